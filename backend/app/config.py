@@ -3,7 +3,13 @@ import os
 
 load_dotenv()  # Loads variables from .env into environment variables
 
-CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not CLAUDE_API_KEY:
-    raise ValueError("Claude API key not found in environment variables.")
 
+def require_env(name: str, description: str) -> str:
+    """
+    Returns a required setting, raising only when it is actually needed so a
+    missing credential disables one feature instead of the whole app.
+    """
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(f"{description} not found in environment variables.")
+    return value
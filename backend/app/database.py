@@ -1,35 +1,316 @@
 #4:42p archisa 
+import asyncio
+import contextvars
+import functools
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
-from dotenv import load_dotenv
-
-# 1. Load environment variables from .env
-load_dotenv()
-
-# 2. Set up Firebase credentials using your .env variables
-cred_dict = {
-    "type": "service_account",
-    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-    "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace('\\n', '\n'),
-    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-    "token_uri": "https://oauth2.googleapis.com/token",
-}
-
-# 3. Initialize Firebase with these credentials
-try:
-    cred = credentials.Certificate(cred_dict)
-    firebase_admin.initialize_app(cred)
-except ValueError as e:
-    print("Firebase Credential Error:", e)
-    print("Check your .env file and make sure FIREBASE_PRIVATE_KEY is correct")
-    raise
-# 4. Create a database instance that other files use
-db = firestore.client()
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from . import config  # noqa: F401 -- 1. loads environment variables from .env
+from .metrics import timed
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def _connect():
+    # firebase_admin pulls in the whole Google Cloud client stack, so it is
+    # only imported once a request actually needs Firestore
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    # 2. Set up Firebase credentials using your .env variables
+    cred_dict = {
+        "type": "service_account",
+        "project_id": os.getenv("FIREBASE_PROJECT_ID"),
+        "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace('\\n', '\n'),
+        "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+
+    # 3. Initialize Firebase with these credentials
+    try:
+        cred = credentials.Certificate(cred_dict)
+        firebase_admin.initialize_app(cred)
+    except ValueError as e:
+        print("Firebase Credential Error:", e)
+        print("Check your .env file and make sure FIREBASE_PRIVATE_KEY is correct")
+        raise
+    return firestore.client()
+
 
 def get_db():
-    """Returns the Firestore database instance."""
-    return db
+    """Returns the Firestore database instance, connecting on first use."""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = _connect()
+    return _db
+
+
+def set_db(client):
+    """Replaces the Firestore client, e.g. with an in-memory fake for benchmarks."""
+    global _db
+    with _db_lock:
+        _db = client
+
+
+def server_timestamp():
+    """Firestore's SERVER_TIMESTAMP sentinel, imported on first write."""
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+    return SERVER_TIMESTAMP
+
+
+class _LazyClient:
+    """Stands in for the Firestore client and forwards to get_db() on use."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+
+# 4. Create a database instance that other files use
+db = _LazyClient()
+
+# 5. Cache user profiles in-process so hot documents skip the network round trip
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1024"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+
+_MISSING = object()
+
+
+class ProfileCache:
+    """
+    Bounded LRU cache of user documents with a per-entry TTL.
+
+    A cached value of None means the document does not exist. Entries are
+    dropped on every write through save_user_profile, so the TTL only bounds
+    staleness from writes made by other processes.
+
+    A read that raced a write must not put the old document back: readers
+    take a token() before going to Firestore and pass it to put(), which is
+    skipped if the key was invalidated since. Invalidations are remembered
+    for the most recent `maxsize` keys; older ones only advance a floor,
+    which errs on the side of not caching.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._clock = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._invalidated_floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, default=_MISSING):
+        """Return the cached profile, or `default` (_MISSING) if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def token(self) -> int:
+        """Taken before reading a document that will be put() afterwards"""
+        with self._lock:
+            return self._clock
+
+    def put(self, user_id: str, profile: Optional[Dict], token: Optional[int] = None):
+        with self._lock:
+            if token is not None and self._invalidated.get(user_id, self._invalidated_floor) > token:
+                return  # Written while this copy was being read
+            self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._clock += 1
+            self._invalidated[user_id] = self._clock
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self.maxsize:
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._invalidated_floor = max(self._invalidated_floor, forgotten)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._clock += 1
+            self._invalidated.clear()
+            self._invalidated_floor = self._clock
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL_SECONDS)
+
+
+def _fetch_user_profile(user_id: str) -> Optional[Dict]:
+    token = profile_cache.token()
+    with timed("firestore"):
+        doc = db.collection("users").document(user_id).get()
+    profile = doc.to_dict() if doc.exists else None
+    profile_cache.put(user_id, profile, token)
+    return profile
+
+
+def get_user_profile(user_id: str) -> Optional[Dict]:
+    """Returns a user's profile document, or None if it does not exist."""
+    profile = profile_cache.get(user_id)
+    if profile is _MISSING:
+        profile = _fetch_user_profile(user_id)
+    return dict(profile) if profile is not None else None
+
+
+_profile_listeners: List[Callable[[str], None]] = []
+
+
+def add_profile_listener(listener: Callable[[str], None]):
+    """Registers a callback run with the user id after every profile write."""
+    _profile_listeners.append(listener)
+
+
+def profile_version(profile: Optional[Dict]):
+    """The opaque version stamped on a profile by its last save_user_profile."""
+    return (profile or {}).get("version")
+
+
+def get_user_profiles(user_ids: List[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Returns {user_id: profile or None} for many users, reading every cache
+    miss from Firestore in a single get_all round trip.
+    """
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = profile_cache.get(user_id)
+        if profile is _MISSING:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+
+    if missing:
+        users = db.collection("users")
+        token = profile_cache.token()
+        with timed("firestore"):
+            docs = list(db.get_all([users.document(user_id) for user_id in missing]))
+        for doc in docs:
+            profile = doc.to_dict() if doc.exists else None
+            profile_cache.put(doc.id, profile, token)
+            profiles[doc.id] = profile
+        for user_id in missing:
+            profiles.setdefault(user_id, None)
+
+    return {user_id: dict(p) if p is not None else None for user_id, p in profiles.items()}
+
+
+def save_user_profile(user_id: str, data: Dict, merge: bool = False):
+    """
+    Writes a user's profile document, stamps it with a new version, drops it
+    from the profile cache and notifies profile listeners.
+    """
+    data = dict(data, version=time.time_ns(), updated_at=server_timestamp())
+    with timed("firestore"):
+        db.collection("users").document(user_id).set(data, merge=merge)
+    profile_cache.invalidate(user_id)
+    for listener in _profile_listeners:
+        try:
+            listener(user_id)
+        except Exception as e:
+            print(f"Profile listener failed for {user_id}: {e}")
+
+
+def annotations_version(profile: Optional[Dict]):
+    """The opaque version stamped on a profile by its last save_profile_annotations."""
+    return (profile or {}).get("annotations_version")
+
+
+def save_profile_annotations(user_id: str, data: Dict):
+    """
+    Merges fields the matcher never reads, such as generated bios, into a
+    user's profile document. They get their own version: the profile version
+    is left alone and profile listeners aren't notified, so stored matches
+    and match ETags stay valid, while profile ETags change with the body.
+    """
+    data = dict(data, annotations_version=time.time_ns())
+    with timed("firestore"):
+        db.collection("users").document(user_id).set(data, merge=True)
+    profile_cache.invalidate(user_id)
+
+
+# 6. Run blocking Firestore calls off the event loop for async routes
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "32"))
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_db_executor_lock = threading.Lock()
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore"
+            )
+        return _db_executor
+
+
+def shutdown_db_executor():
+    """Waits for in-flight Firestore calls and stops the executor threads."""
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is not None:
+            _db_executor.shutdown(wait=True)
+            _db_executor = None
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """
+    Runs a blocking Firestore call on the Firestore thread pool and awaits it,
+    so the event loop keeps serving other requests in the meantime.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_get_db_executor(), call)
+
+
+async def aget_user_profile(user_id: str) -> Optional[Dict]:
+    """Async get_user_profile: cache hits return without leaving the event loop."""
+    profile = profile_cache.get(user_id)
+    if profile is _MISSING:
+        profile = await run_db(_fetch_user_profile, user_id)
+    return dict(profile) if profile is not None else None
+
 
+async def aget_user_profiles(user_ids: List[str]) -> Dict[str, Optional[Dict]]:
+    """Async get_user_profiles."""
+    return await run_db(get_user_profiles, user_ids)
 
 
+async def asave_user_profile(user_id: str, data: Dict, merge: bool = False):
+    """Async save_user_profile."""
+    await run_db(save_user_profile, user_id, data, merge)
@@ -1,15 +1,46 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routes import auth, users, match, ai_claude  # Remove playlists if not using yet
+from fastapi.responses import PlainTextResponse
+from .database import shutdown_db_executor
+from .metrics import METRICS_PATH, TimingMiddleware, render_metrics
+from .profiling import ProfilingMiddleware
+from .services.profile_sync import shutdown_sync_executor
+from .services.refresher import SpotifyRefresher
+from .services.spotify_clients import spotify_clients
+from .routes import admin, auth, users, match, ai_claude  # Remove playlists if not using yet
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep every user's Spotify data fresh in the background; enable on one worker only
+    refresher = SpotifyRefresher() if os.getenv("SPOTIFY_REFRESH_ENABLED") == "1" else None
+    if refresher:
+        refresher.start()
+    yield
+    if refresher:
+        refresher.stop(timeout=5)
+    shutdown_db_executor()
+    shutdown_sync_executor()
+    match.match_store.shutdown()
+    spotify_clients.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TimingMiddleware)
 
 # Include all routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(match.router, prefix="/match", tags=["match"])
 app.include_router(ai_claude.router, prefix="/ai", tags=["ai"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
 # app.include_router(playlists.router, prefix="/playlists", tags=["playlists"])  # Comment if not using
 
 @app.get("/")
 def home():
     return {"message": "Welcome to FastAPI"}
+
+@app.get(METRICS_PATH, include_in_schema=False)
+def metrics():
+    """Latency histograms per route and stage, in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
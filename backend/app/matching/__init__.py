@@ -0,0 +1,9 @@
+# Vectorized matching engine used by the match routes
+from .ann import AudioIndex, get_audio_index
+from .clusters import ClusterIndex, ClusterTable, fit_clusters, get_cluster_index
+from .idf import IdfTable, get_idf
+from .inverted import ItemIndex, get_item_index
+from .parallel import ParallelScorer, SharedPopulation
+from .population import Population, get_population
+from .profile import CompactProfile, Interner, Vocabulary
+from .snapshot import load_snapshot, write_snapshot
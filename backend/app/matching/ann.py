@@ -0,0 +1,213 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..database import add_profile_listener, get_user_profiles
+from .kmeans import kmeans
+from .population import Population, get_population
+from .profile import profile_audio
+
+# Inverted lists scanned per query; more lists, better recall, slower queries
+AUDIO_INDEX_PROBES = int(os.getenv("AUDIO_INDEX_PROBES", "8"))
+
+
+class _InvertedList:
+    """One IVF cell: user handles and their vectors, in buffers grown by doubling"""
+
+    __slots__ = ('handles', 'vectors', 'size')
+
+    def __init__(self, handles: np.ndarray, vectors: np.ndarray):
+        self.handles = handles
+        self.vectors = vectors
+        self.size = len(handles)
+
+    def add(self, handle: int, vector: np.ndarray) -> int:
+        slot = self.size
+        if slot == len(self.handles):
+            capacity = max(2 * slot, 8)
+            self.handles = np.resize(self.handles, capacity)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:slot] = self.vectors[:slot]
+            self.vectors = grown
+        self.handles[slot] = handle
+        self.vectors[slot] = vector
+        self.size += 1
+        return slot
+
+    def remove(self, slot: int) -> Optional[int]:
+        """Swap-remove a slot; returns the handle moved into it, if any"""
+        self.size -= 1
+        last = self.size
+        if slot == last:
+            return None
+        self.handles[slot] = self.handles[last]
+        self.vectors[slot] = self.vectors[last]
+        return int(self.handles[slot])
+
+
+class AudioIndex:
+    """
+    Inverted-file (IVF) index over unit-length audio vectors.
+
+    Spherical k-means splits the vectors into about sqrt(N) cells. A query
+    ranks the cell centroids and scans only the best `probes` cells, so it
+    touches roughly probes * sqrt(N) users instead of all N. Upserts drop a
+    user's vector into its nearest existing cell; centroids stay fixed
+    until the index is rebuilt. Users without audio features aren't indexed.
+    """
+
+    def __init__(self, user_ids: Iterable[str], vectors: np.ndarray,
+                 n_lists: Optional[int] = None, probes: int = AUDIO_INDEX_PROBES, seed: int = 0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        indexed = np.flatnonzero(np.linalg.norm(vectors, axis=1) > 0)
+        user_ids = list(user_ids)
+        # Lists hold integer handles; user ids are only looked up for results
+        self._user_ids: List[str] = [user_ids[i] for i in indexed]
+        self._handle_of: Dict[str, int] = {user_id: handle for handle, user_id in enumerate(self._user_ids)}
+        self._free: List[int] = []
+        vectors = _unit(vectors[indexed])
+
+        n_lists = n_lists or max(1, int(np.sqrt(len(indexed))))
+        if len(indexed):
+            # A rough partition is enough: queries rescore the probed cells exactly
+            self.centroids, labels = kmeans(vectors, n_lists, iterations=10, seed=seed, spherical=True,
+                                            sample_size=64 * n_lists)
+        else:
+            self.centroids, labels = np.zeros((1, vectors.shape[1]), dtype=np.float32), np.zeros(0, dtype=np.int32)
+        self.probes = probes
+        self._cell_of = np.array(labels, dtype=np.int64)
+        self._slot_of = np.empty(len(indexed), dtype=np.int64)
+        self._lock = threading.Lock()
+
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        self.lists: List[_InvertedList] = []
+        for cell in range(len(self.centroids)):
+            members = order[bounds[cell]:bounds[cell + 1]]
+            self.lists.append(_InvertedList(members.astype(np.int64), vectors[members]))
+            self._slot_of[members] = np.arange(len(members))
+
+    @classmethod
+    def from_population(cls, population: Population, **options) -> "AudioIndex":
+        return cls(population.user_ids, population.audio, **options)
+
+    def __len__(self) -> int:
+        return len(self._handle_of)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._handle_of
+
+    def _remove(self, user_id: str):
+        handle = self._handle_of.pop(user_id)
+        moved = self.lists[self._cell_of[handle]].remove(self._slot_of[handle])
+        if moved is not None:
+            self._slot_of[moved] = self._slot_of[handle]
+        self._free.append(handle)
+
+    def _new_handle(self, user_id: str) -> int:
+        if self._free:
+            handle = self._free.pop()
+            self._user_ids[handle] = user_id
+        else:
+            handle = len(self._user_ids)
+            self._user_ids.append(user_id)
+            if handle == len(self._cell_of):
+                self._cell_of = np.resize(self._cell_of, max(2 * handle, 8))
+                self._slot_of = np.resize(self._slot_of, max(2 * handle, 8))
+        self._handle_of[user_id] = handle
+        return handle
+
+    def upsert(self, user_id: str, vector: np.ndarray):
+        """Insert or move a user's vector; an all-zero vector removes the user"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        with self._lock:
+            if user_id in self._handle_of:
+                self._remove(user_id)
+            if norm == 0:
+                return
+            vector = vector / norm
+            cell = int(np.argmax(self.centroids @ vector))
+            handle = self._new_handle(user_id)
+            self._cell_of[handle] = cell
+            self._slot_of[handle] = self.lists[cell].add(handle, vector)
+
+    def remove(self, user_id: str):
+        with self._lock:
+            if user_id in self._handle_of:
+                self._remove(user_id)
+
+    def search(self, vector: np.ndarray, k: int, exclude: Optional[str] = None,
+               probes: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Approximate top k (user_id, cosine similarity) for a vector, best first"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0 or k <= 0:
+            return []
+        vector = vector / norm
+        probes = min(probes or self.probes, len(self.centroids))
+        cells = np.argpartition(-(self.centroids @ vector), probes - 1)[:probes]
+        with self._lock:
+            lists = [self.lists[cell] for cell in cells if self.lists[cell].size]
+            if not lists:
+                return []
+            handles = np.concatenate([cell.handles[:cell.size] for cell in lists])
+            sims = np.concatenate([cell.vectors[:cell.size] for cell in lists]) @ vector
+            excluded = self._handle_of.get(exclude) if exclude is not None else None
+            if excluded is not None:
+                sims[handles == excluded] = -np.inf
+            k = min(k, len(handles))
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top], kind='stable')]
+            return [(self._user_ids[handles[i]], float(sims[i])) for i in top if sims[i] > -np.inf]
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+# ============================
+# 🎵 AUDIO INDEX CACHE 🎵
+# ============================
+
+_audio_index: Optional[AudioIndex] = None
+_audio_index_population: Optional[Population] = None
+_audio_pending: Set[str] = set()
+_audio_lock = threading.Lock()
+
+
+def _note_profile_change(user_id: str):
+    # Upserted by the next get_audio_index(), so profile writes don't pay for it
+    with _audio_lock:
+        if _audio_index is not None:
+            _audio_pending.add(user_id)
+
+
+add_profile_listener(_note_profile_change)
+
+
+def get_audio_index() -> AudioIndex:
+    """
+    Return the audio index of the cached population, rebuilt along with it
+    and upserted with every profile written since.
+    """
+    global _audio_index, _audio_index_population
+    population = get_population()
+    with _audio_lock:
+        if _audio_index is None or _audio_index_population is not population:
+            _audio_index = AudioIndex.from_population(population)
+            _audio_index_population = population
+            _audio_pending.clear()
+        index, pending = _audio_index, list(_audio_pending)
+        _audio_pending.clear()
+    if pending:
+        for user_id, user_data in get_user_profiles(pending).items():
+            if user_data is None:
+                index.remove(user_id)
+            else:
+                index.upsert(user_id, profile_audio(user_data))
+    return index
@@ -0,0 +1,205 @@
+import os
+import threading
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from .kmeans import KMEANS_SAMPLE_PER_CENTROID, assign, kmeans
+from .population import Population, get_population
+from .profile import profile_audio, profile_items
+
+# Cluster table written by scripts/cluster_users.py; without one it is fitted in-process
+CLUSTER_TABLE_PATH = os.getenv("CLUSTER_TABLE_PATH", "")
+# Users per cluster the offline job aims for, which bounds the users scored per probe
+CLUSTER_SIZE = int(os.getenv("CLUSTER_SIZE", "1000"))
+# Most common genres kept as clustering dimensions
+CLUSTER_GENRE_DIMS = int(os.getenv("CLUSTER_GENRE_DIMS", "64"))
+# Nearest clusters scored by /match/candidates; 0 scores the whole population
+CLUSTER_PROBES = int(os.getenv("CLUSTER_PROBES", "0"))
+# audio_match / (audio_match + genre_match) in FlirtifyMatcher's weights
+AUDIO_SHARE = 35 / 50
+# Rows featurized and labeled at a time, to bound memory on large populations
+LABEL_BLOCK_ROWS = 65536
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def _combine(audio: np.ndarray, genres: np.ndarray) -> np.ndarray:
+    # Dot products of these are AUDIO_SHARE * audio cosine + the rest * genre cosine
+    features = np.hstack([np.sqrt(AUDIO_SHARE) * _unit_rows(audio),
+                          np.sqrt(1 - AUDIO_SHARE) * _unit_rows(genres)])
+    return _unit_rows(features).astype(np.float32)
+
+
+class ClusterTable:
+    """
+    k-means centroids over combined audio and genre vectors, plus the
+    cluster every user had when the table was fitted.
+
+    A user's vector is their unit audio vector and their unit indicator
+    vector over the table's genres, weighted so that the dot product of two
+    users blends audio and genre cosine like FlirtifyMatcher's weights do.
+    """
+
+    def __init__(self, centroids: np.ndarray, genres: Sequence[str],
+                 user_ids: Sequence[str] = (), labels: Optional[np.ndarray] = None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.genres = list(genres)
+        self.user_ids = list(user_ids)
+        self.labels = np.zeros(0, dtype=np.int32) if labels is None else np.asarray(labels, dtype=np.int32)
+        self._column_of = {genre: column for column, genre in enumerate(self.genres)}
+
+    def __len__(self) -> int:
+        return len(self.centroids)
+
+    def features(self, population: Population, rows: np.ndarray) -> np.ndarray:
+        """Clustering vectors of some population rows"""
+        vocab = population.vocabs['genres']
+        column_of = np.full(len(vocab), -1, dtype=np.int64)
+        for genre, column in self._column_of.items():
+            item_id = vocab.get(genre)
+            if item_id is not None and item_id < len(column_of):
+                column_of[item_id] = column
+
+        matrix = population.matrices['genres'][rows]
+        columns = column_of[matrix.indices]
+        owners = np.repeat(np.arange(len(rows)), np.diff(matrix.indptr))
+        kept = columns >= 0
+        genres = np.zeros((len(rows), len(self.genres)), dtype=np.float32)
+        genres[owners[kept], columns[kept]] = 1
+        return _combine(np.asarray(population.audio[rows], dtype=np.float32), genres)
+
+    def query_vector(self, user_data: Dict) -> np.ndarray:
+        """Clustering vector of a profile"""
+        genres = np.zeros((1, len(self.genres)), dtype=np.float32)
+        columns = [self._column_of.get(genre) for genre in profile_items(user_data, 'genres')]
+        genres[0, [column for column in columns if column is not None]] = 1
+        return _combine(profile_audio(user_data)[np.newaxis, :], genres)[0]
+
+    def label(self, population: Population, rows: np.ndarray) -> np.ndarray:
+        """Nearest centroid of some population rows"""
+        labels = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), LABEL_BLOCK_ROWS):
+            block = rows[start:start + LABEL_BLOCK_ROWS]
+            labels[start:start + len(block)] = assign(self.features(population, block), self.centroids, spherical=True)
+        return labels
+
+    def nearest(self, user_data: Dict, probes: int) -> np.ndarray:
+        """The `probes` clusters whose centroids are nearest a profile, nearest first"""
+        sims = self.centroids @ self.query_vector(user_data)
+        probes = min(probes, len(sims))
+        if probes <= 0:
+            return np.zeros(0, dtype=np.int64)
+        best = np.argpartition(-sims, probes - 1)[:probes]
+        return best[np.argsort(-sims[best], kind='stable')]
+
+    def save(self, path: str):
+        """Write the table to an .npz file, atomically replacing any previous one"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, genres=np.array(self.genres, dtype=str),
+                     user_ids=np.array(self.user_ids, dtype=str), labels=self.labels)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ClusterTable":
+        with np.load(path, allow_pickle=False) as table:
+            return cls(table['centroids'], table['genres'].tolist(), table['user_ids'].tolist(), table['labels'])
+
+
+def fit_clusters(population: Population, n_clusters: Optional[int] = None,
+                 genre_dims: int = CLUSTER_GENRE_DIMS, iterations: int = 20, seed: int = 0) -> ClusterTable:
+    """
+    Cluster a population with spherical k-means into about one cluster per
+    CLUSTER_SIZE users. Centroids are trained on a sample, then every user
+    is labeled in blocks, so memory stays bounded as the population grows.
+    """
+    df = np.bincount(population.matrices['genres'].indices, minlength=len(population.vocabs['genres']))
+    top = np.argsort(-df, kind='stable')[:genre_dims]
+    names = population.vocabs['genres'].names
+    genres = [names[i] for i in top if df[i] > 0]
+
+    table = ClusterTable(np.zeros((0, 3 + len(genres)), dtype=np.float32), genres)
+    if not len(population):
+        return table
+    k = max(1, min(n_clusters or round(len(population) / CLUSTER_SIZE), len(population)))
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(population), k * KMEANS_SAMPLE_PER_CENTROID)
+    sample = np.sort(rng.choice(len(population), sample_size, replace=False))
+    table.centroids, _ = kmeans(table.features(population, sample), k, iterations=iterations, seed=seed,
+                                spherical=True, sample_size=sample_size)
+    table.user_ids = list(population.user_ids)
+    table.labels = table.label(population, np.arange(len(population)))
+    return table
+
+
+class ClusterIndex:
+    """
+    Population rows grouped by cluster. Users the table already labels keep
+    their cluster; everyone else (new since the table was fitted) is put in
+    their nearest one. Scoring a query against its `probes` nearest clusters
+    touches about probes * CLUSTER_SIZE users however large the population.
+    """
+
+    def __init__(self, table: ClusterTable, population: Population):
+        self.table = table
+        self.population = population
+        label_of = dict(zip(table.user_ids, table.labels.tolist()))
+        labels = np.array([label_of.get(user_id, -1) for user_id in population.user_ids], dtype=np.int32)
+        unlabeled = np.flatnonzero(labels < 0)
+        if len(unlabeled) and len(table):
+            labels[unlabeled] = table.label(population, unlabeled)
+        self.labels = labels
+
+        self._order = np.argsort(labels, kind='stable')
+        self._bounds = np.searchsorted(labels[self._order], np.arange(len(table) + 1))
+
+    def members(self, cluster: int) -> np.ndarray:
+        return self._order[self._bounds[cluster]:self._bounds[cluster + 1]]
+
+    def candidate_rows(self, user_data: Dict, probes: int) -> np.ndarray:
+        """Sorted population rows of the `probes` clusters nearest a profile"""
+        clusters = self.table.nearest(user_data, probes)
+        if not len(clusters):
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.members(cluster) for cluster in clusters]))
+
+
+# ============================
+# 🎵 CLUSTER INDEX CACHE 🎵
+# ============================
+
+_cluster_table: Optional[ClusterTable] = None
+_cluster_table_mtime: Optional[int] = None
+_cluster_index: Optional[ClusterIndex] = None
+_cluster_lock = threading.Lock()
+
+
+def _current_table(population: Population) -> ClusterTable:
+    global _cluster_table, _cluster_table_mtime
+    if CLUSTER_TABLE_PATH and os.path.exists(CLUSTER_TABLE_PATH):
+        mtime = os.stat(CLUSTER_TABLE_PATH).st_mtime_ns
+        if _cluster_table is None or mtime != _cluster_table_mtime:
+            _cluster_table, _cluster_table_mtime = ClusterTable.load(CLUSTER_TABLE_PATH), mtime
+    elif _cluster_table is None:
+        # No offline table yet: fit one from the first population and keep it
+        _cluster_table = fit_clusters(population)
+    return _cluster_table
+
+
+def get_cluster_index() -> ClusterIndex:
+    """
+    Return the cluster index of the cached population, regrouped whenever the
+    population is rebuilt or the offline job writes a new table.
+    """
+    global _cluster_index
+    population = get_population()
+    with _cluster_lock:
+        table = _current_table(population)
+        if _cluster_index is None or _cluster_index.population is not population or _cluster_index.table is not table:
+            _cluster_index = ClusterIndex(table, population)
+        return _cluster_index
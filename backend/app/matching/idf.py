@@ -0,0 +1,137 @@
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+import numpy as np
+
+from ..database import add_profile_listener, get_user_profiles
+from .population import Population, get_population
+from .profile import ITEM_FIELDS, profile_items
+
+
+class IdfTable:
+    """
+    Inverse document frequencies of every artist, track and genre.
+
+    Document frequencies start as the column counts of a population's
+    incidence matrices and are then adjusted one profile at a time by
+    update(), so a profile write costs a few array increments rather than a
+    rebuild. idf = ln((1 + N) / (1 + df)) + 1, which is 1 for an item every
+    user has and largest for items nobody else has. The idf vectors and the
+    population's weighted row norms are recomputed lazily after changes.
+    Rows of the population itself stay as built; only the weights move.
+    """
+
+    def __init__(self, population: Population):
+        self.population = population
+        self.df = {
+            kind: np.bincount(matrix.indices, minlength=matrix.shape[1]).astype(np.int64)
+            for kind, matrix in population.matrices.items()
+        }
+        self.n_users = len(population)
+        # Item ids currently counted for users updated since the population was built
+        self._counted: Dict[str, Optional[Dict[str, np.ndarray]]] = {}
+        self._idf: Dict[str, np.ndarray] = {}
+        self._row_norms: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _item_ids(self, user_data: Dict) -> Dict[str, np.ndarray]:
+        """Population vocabulary ids of a profile's items; unknown items are not counted"""
+        ids = {}
+        for kind, vocab in self.population.vocabs.items():
+            known = (vocab.get(item) for item in profile_items(user_data, kind))
+            ids[kind] = np.array([i for i in known if i is not None], dtype=np.int64)
+        return ids
+
+    def _counted_ids(self, user_id: str) -> Optional[Dict[str, np.ndarray]]:
+        if user_id in self._counted:
+            return self._counted[user_id]
+        row = self.population.row_of.get(user_id)
+        if row is None:
+            return None
+        return {
+            kind: matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+            for kind, matrix in self.population.matrices.items()
+        }
+
+    def update(self, user_id: str, user_data: Optional[Dict]):
+        """Recount one user's items after their profile changed (None: deleted)"""
+        with self._lock:
+            old = self._counted_ids(user_id)
+            new = self._item_ids(user_data) if user_data is not None else None
+            for kind in ITEM_FIELDS:
+                # Ids are unique within a profile, so fancy-indexed += is exact
+                if old is not None:
+                    self.df[kind][old[kind]] -= 1
+                if new is not None:
+                    self.df[kind][new[kind]] += 1
+            self.n_users += (new is not None) - (old is not None)
+            self._counted[user_id] = new
+            self._idf.clear()
+            self._row_norms.clear()
+
+    def idf(self, kind: str) -> np.ndarray:
+        """idf of every item of one kind, indexed by population vocabulary id"""
+        with self._lock:
+            idf = self._idf.get(kind)
+            if idf is None:
+                idf = np.log((1.0 + self.n_users) / (1.0 + self.df[kind])) + 1.0
+                self._idf[kind] = idf = idf.astype(np.float32)
+            return idf
+
+    def unseen_idf(self) -> float:
+        """idf of an item no user in the population has"""
+        return float(np.log(1.0 + self.n_users) + 1.0)
+
+    def weights(self, kind: str, items: Iterable[str]) -> np.ndarray:
+        """idf of each named item, in order"""
+        idf, vocab, unseen = self.idf(kind), self.population.vocabs[kind], self.unseen_idf()
+        return np.array([idf[i] if (i := vocab.get(item)) is not None else unseen for item in items],
+                        dtype=np.float32)
+
+    def row_norms(self, kind: str) -> np.ndarray:
+        """Length of every population row's idf-weighted item vector"""
+        idf = self.idf(kind)
+        with self._lock:
+            norms = self._row_norms.get(kind)
+            if norms is None:
+                norms = np.sqrt(self.population.matrices[kind] @ (idf * idf))
+                self._row_norms[kind] = norms
+            return norms
+
+
+# ============================
+# 🎵 IDF CACHE 🎵
+# ============================
+
+_idf: Optional[IdfTable] = None
+_idf_pending: Set[str] = set()
+_idf_lock = threading.Lock()
+
+
+def _note_profile_change(user_id: str):
+    # Recounted by the next get_idf(), so profile writes don't pay for it
+    with _idf_lock:
+        if _idf is not None:
+            _idf_pending.add(user_id)
+
+
+add_profile_listener(_note_profile_change)
+
+
+def get_idf() -> IdfTable:
+    """
+    Return the IDF table of the cached population, built along with it and
+    brought up to date with every profile written since.
+    """
+    global _idf
+    population = get_population()
+    with _idf_lock:
+        if _idf is None or _idf.population is not population:
+            _idf = IdfTable(population)
+            _idf_pending.clear()
+        idf, pending = _idf, list(_idf_pending)
+        _idf_pending.clear()
+    if pending:
+        for user_id, user_data in get_user_profiles(pending).items():
+            idf.update(user_id, user_data)
+    return idf
@@ -0,0 +1,238 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..database import add_profile_listener, db, get_user_profile
+from ..metrics import timed
+from .population import Population, get_population
+from .profile import ITEM_FIELDS, profile_items
+
+# Items held by more users than this are too common to narrow candidates down
+ITEM_INDEX_POSTING_CAP = int(os.getenv("ITEM_INDEX_POSTING_CAP", "10000"))
+# Most candidates handed to exact scoring per query
+ITEM_INDEX_CANDIDATE_LIMIT = int(os.getenv("ITEM_INDEX_CANDIDATE_LIMIT", "2000"))
+# Mirror posting lists to Firestore item_index documents as they change
+ITEM_INDEX_PERSIST = os.getenv("ITEM_INDEX_PERSIST") == "1"
+ITEM_INDEX_COLLECTION = "item_index"
+# Firestore caps a write batch at 500 operations
+FIRESTORE_BATCH_SIZE = 500
+
+
+class ItemIndex:
+    """
+    Inverted index from artist, track and genre to the users who list it.
+
+    Posting lists start as the CSC transpose of a population's incidence
+    matrices. Profile updates mark the user's population row stale and
+    record their current items in an in-memory overlay, so posting lists
+    stay exact between population rebuilds.
+    """
+
+    def __init__(self, population: Population, cap: int = ITEM_INDEX_POSTING_CAP):
+        self.population = population
+        self.cap = cap
+        self.postings = {kind: matrix.tocsc() for kind, matrix in population.matrices.items()}
+        self._stale = np.zeros(len(population), dtype=bool)
+        # Current items of every user updated since the population was built
+        self._items: Dict[str, Dict[str, Set[str]]] = {}
+        self._added: Dict[str, Dict[str, Set[str]]] = {kind: {} for kind in ITEM_FIELDS}
+        self._lock = threading.Lock()
+
+    def _base_rows(self, kind: str, item: str) -> np.ndarray:
+        postings = self.postings[kind]
+        item_id = self.population.vocabs[kind].get(item)
+        if item_id is None or item_id >= postings.shape[1]:
+            return postings.indices[:0]
+        return postings.indices[postings.indptr[item_id]:postings.indptr[item_id + 1]]
+
+    def _items_of(self, user_id: str) -> Dict[str, Set[str]]:
+        if user_id in self._items:
+            return self._items[user_id]
+        row = self.population.row_of.get(user_id)
+        if row is None:
+            return {kind: set() for kind in ITEM_FIELDS}
+        items = {}
+        for kind, matrix in self.population.matrices.items():
+            names = self.population.vocabs[kind].names
+            items[kind] = {names[i] for i in matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]}
+        return items
+
+    def update(self, user_id: str, user_data: Optional[Dict]) -> Dict[str, Set[str]]:
+        """Re-index a user's profile (None: deleted); returns the items whose postings changed"""
+        with self._lock:
+            old = self._items_of(user_id)
+            new = {kind: set(profile_items(user_data, kind)) if user_data is not None else set()
+                   for kind in ITEM_FIELDS}
+            row = self.population.row_of.get(user_id)
+            if row is not None:
+                self._stale[row] = True
+            for kind in ITEM_FIELDS:
+                added = self._added[kind]
+                for item in self._items.get(user_id, {}).get(kind, ()):
+                    users = added[item]
+                    users.discard(user_id)
+                    if not users:
+                        del added[item]
+                for item in new[kind]:
+                    added.setdefault(item, set()).add(user_id)
+            self._items[user_id] = new
+            return {kind: old[kind] ^ new[kind] for kind in ITEM_FIELDS}
+
+    def posting(self, kind: str, item: str) -> List[str]:
+        """Every user currently listing an item"""
+        with self._lock:
+            rows = self._base_rows(kind, item)
+            rows = rows[~self._stale[rows]]
+            user_ids = self.population.user_ids
+            return [user_ids[row] for row in rows] + sorted(self._added[kind].get(item, ()))
+
+    def _shared(self, user_data: Dict, weights: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """(population rows, shared weight) from the base postings, plus {user_id: shared weight} from the overlay"""
+        rows, row_weights = [], []
+        overlay_weights: Dict[str, float] = {}
+        with self._lock:
+            for kind, weight in weights.items():
+                added = self._added[kind]
+                for item in profile_items(user_data, kind):
+                    base = self._base_rows(kind, item)
+                    overlay = added.get(item, ())
+                    if len(base) + len(overlay) > self.cap:
+                        continue
+                    rows.append(base)
+                    row_weights.append(np.full(len(base), weight, dtype=np.float32))
+                    for other_id in overlay:
+                        overlay_weights[other_id] = overlay_weights.get(other_id, 0.0) + weight
+            stale = self._stale
+
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), overlay_weights
+        # A dense tally over population rows is cheaper than sorting the postings
+        totals = np.bincount(np.concatenate(rows), weights=np.concatenate(row_weights), minlength=len(stale))
+        totals[stale] = 0
+        shared = np.flatnonzero(totals)
+        return shared, totals[shared], overlay_weights
+
+    def candidate_rows(self, user_data: Dict, weights: Dict[str, float],
+                       limit: int = ITEM_INDEX_CANDIDATE_LIMIT) -> np.ndarray:
+        """
+        Population rows of the users sharing at least one item with a
+        profile, those sharing the most weight first, at most `limit`.
+        Items listed by more than `cap` users are skipped: they would make
+        almost everyone a candidate while barely telling them apart. Users
+        added since the population was built have no row and are left out.
+        """
+        rows, totals, overlay_weights = self._shared(user_data, weights)
+        overlay = [(self.population.row_of.get(other_id), weight) for other_id, weight in overlay_weights.items()]
+        overlay = [(row, weight) for row, weight in overlay if row is not None]
+        if overlay:
+            rows = np.concatenate([rows, np.array([row for row, _ in overlay], dtype=np.int64)])
+            totals = np.concatenate([totals, np.array([weight for _, weight in overlay])])
+        if len(rows) > limit:
+            top = np.argpartition(-totals, limit - 1)[:limit]
+            rows, totals = rows[top], totals[top]
+        return rows[np.argsort(-totals, kind='stable')]
+
+    def candidates(self, user_data: Dict, weights: Dict[str, float],
+                   limit: int = ITEM_INDEX_CANDIDATE_LIMIT) -> List[Tuple[str, float]]:
+        """candidate_rows as (user_id, shared weight), including users added since the build"""
+        rows, totals, overlay_weights = self._shared(user_data, weights)
+        if len(rows) > limit:
+            top = np.argpartition(-totals, limit - 1)[:limit]
+            rows, totals = rows[top], totals[top]
+        user_ids = self.population.user_ids
+        found = [(user_ids[row], float(total)) for row, total in zip(rows, totals)] + list(overlay_weights.items())
+        found.sort(key=lambda candidate: -candidate[1])
+        return found[:limit]
+
+
+# ============================
+# 🎵 FIRESTORE MIRROR 🎵
+# ============================
+
+def item_doc_id(kind: str, item: str) -> str:
+    """Firestore-safe document id for an item; names may contain '/'"""
+    return f"{kind}-{hashlib.sha1(item.encode('utf-8')).hexdigest()[:20]}"
+
+
+def persist_postings(index: ItemIndex, items: Dict[str, Set[str]]):
+    """
+    Write the posting lists of some items to item_index documents. Lists
+    longer than the cap are stored as `popular` without user ids, which
+    keeps every document well under Firestore's 1 MiB limit.
+    """
+    collection = db.collection(ITEM_INDEX_COLLECTION)
+    batch, ops = db.batch(), 0
+    for kind, kind_items in items.items():
+        for item in kind_items:
+            user_ids = index.posting(kind, item)
+            popular = len(user_ids) > index.cap
+            batch.set(collection.document(item_doc_id(kind, item)), {
+                "kind": kind,
+                "item": item,
+                "count": len(user_ids),
+                "popular": popular,
+                "user_ids": [] if popular else user_ids,
+            })
+            ops += 1
+            if ops == FIRESTORE_BATCH_SIZE:
+                with timed("firestore"):
+                    batch.commit()
+                batch, ops = db.batch(), 0
+    if ops:
+        with timed("firestore"):
+            batch.commit()
+
+
+def persist_all(index: ItemIndex):
+    """Write every posting list of the index, e.g. to seed the collection"""
+    persist_postings(index, {kind: set(vocab.names) for kind, vocab in index.population.vocabs.items()})
+
+
+# ============================
+# 🎵 ITEM INDEX CACHE 🎵
+# ============================
+
+_item_index: Optional[ItemIndex] = None
+_item_index_pending: Set[str] = set()
+_item_index_lock = threading.Lock()
+_item_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="item-index")
+
+
+def _reindex(user_id: str):
+    with _item_index_lock:
+        _item_index_pending.discard(user_id)
+        index = _item_index
+    if index is None:
+        return
+    try:
+        changed = index.update(user_id, get_user_profile(user_id))
+        if ITEM_INDEX_PERSIST:
+            persist_postings(index, changed)
+    except Exception as e:
+        print(f"Item index update failed for {user_id}: {e}")
+
+
+def _note_profile_change(user_id: str):
+    # Re-indexed on a background thread, coalescing repeated writes
+    with _item_index_lock:
+        if _item_index is None or user_id in _item_index_pending:
+            return
+        _item_index_pending.add(user_id)
+    _item_index_executor.submit(_reindex, user_id)
+
+
+add_profile_listener(_note_profile_change)
+
+
+def get_item_index() -> ItemIndex:
+    """Return the item index of the cached population, built along with it"""
+    global _item_index
+    population = get_population()
+    with _item_index_lock:
+        if _item_index is None or _item_index.population is not population:
+            _item_index = ItemIndex(population)
+        return _item_index
@@ -0,0 +1,63 @@
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Points per centroid used to train; the rest are only assigned
+KMEANS_SAMPLE_PER_CENTROID = 256
+ASSIGN_BLOCK_CELLS = 4_000_000
+
+
+def _normalize(points: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(points, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return points / norms
+
+
+def assign(points: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    """Nearest centroid of every point, by cosine when spherical, else by Euclidean distance"""
+    labels = np.empty(len(points), dtype=np.int32)
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 doesn't change the argmin
+    offsets = 0 if spherical else 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    block = max(1, ASSIGN_BLOCK_CELLS // max(len(centroids), 1))
+    for start in range(0, len(points), block):
+        labels[start:start + block] = np.argmax(points[start:start + block] @ centroids.T - offsets, axis=1)
+    return labels
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = 20, seed: int = 0,
+           spherical: bool = False, sample_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lloyd's k-means, trained on a random sample of at most `sample_size`
+    points (KMEANS_SAMPLE_PER_CENTROID per centroid by default), then used to
+    label every point. Spherical k-means keeps unit-length centroids and
+    assigns by cosine similarity. Returns (centroids, labels).
+    """
+    points = np.asarray(points, dtype=np.float32)
+    if not len(points):
+        return np.zeros((0, points.shape[1]), dtype=np.float32), np.zeros(0, dtype=np.int32)
+    k = max(1, min(k, len(points)))
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or k * KMEANS_SAMPLE_PER_CENTROID
+    sample = points[rng.choice(len(points), sample_size, replace=False)] if len(points) > sample_size else points
+
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids, spherical)
+        members = sparse.csr_matrix(
+            (np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))), shape=(k, len(sample))
+        )
+        sums = np.asarray(members @ sample)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        # Empty clusters restart from random points rather than vanish
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        counts[empty] = 1
+        updated = sums / counts[:, np.newaxis]
+        if spherical:
+            updated = _normalize(updated)
+        if np.allclose(updated, centroids, atol=1e-6):
+            centroids = updated
+            break
+        centroids = updated
+    return centroids.astype(np.float32), assign(points, centroids, spherical)
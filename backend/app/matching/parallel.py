@@ -0,0 +1,201 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .population import Population
+from .profile import ITEM_FIELDS
+
+PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", str(os.cpu_count() or 1)))
+# Query users per task sent to a worker
+PARALLEL_TASK_SIZE = int(os.getenv("PARALLEL_TASK_SIZE", "256"))
+# Bound on the population x queries score block a worker holds at once
+PARALLEL_BLOCK_CELLS = int(os.getenv("PARALLEL_BLOCK_CELLS", str(8_000_000)))
+
+# (offset, shape, dtype) of every array in the shared block
+Layout = Dict[str, Tuple[int, Tuple[int, ...], str]]
+
+
+def _population_arrays(population: Population) -> Dict[str, np.ndarray]:
+    arrays = {'audio': np.ascontiguousarray(population.audio, dtype=np.float32)}
+    for kind, matrix in population.matrices.items():
+        arrays[f'{kind}.indptr'] = matrix.indptr
+        arrays[f'{kind}.indices'] = matrix.indices
+        arrays[f'{kind}.data'] = matrix.data
+    return arrays
+
+
+class SharedPopulation:
+    """
+    A population's incidence and audio matrices copied once into a single
+    shared memory block. Worker processes attach to the block by name and
+    wrap it in scipy/NumPy views, so every worker reads the same physical
+    pages instead of rebuilding or unpickling its own copy.
+    """
+
+    def __init__(self, population: Population):
+        arrays = _population_arrays(population)
+        self.dims = (len(population), {kind: m.shape[1] for kind, m in population.matrices.items()})
+        self.layout: Layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            offset = -(-offset // 64) * 64  # Cache-line aligned
+            self.layout[key] = (offset, array.shape, array.dtype.str)
+            offset += array.nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for key, array in arrays.items():
+            view(self._shm, self.layout[key])[...] = array
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    def close(self):
+        """Release the block; workers must have detached first"""
+        self._shm.close()
+        self._shm.unlink()
+
+
+def view(shm: shared_memory.SharedMemory, entry: Tuple[int, Tuple[int, ...], str]) -> np.ndarray:
+    offset, shape, dtype = entry
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+
+# ============================
+# 🎵 WORKER SIDE 🎵
+# ============================
+
+_worker_state: Dict = {}
+
+
+def _attach(name: str, layout: Layout, dims, weights: Dict[str, float]):
+    """Process pool initializer: map the shared block into this worker"""
+    # Workers share the parent's resource tracker, so the block is unlinked
+    # once, by the parent's SharedPopulation.close()
+    shm = shared_memory.SharedMemory(name=name)
+    n_users, n_items = dims
+    _worker_state.update(
+        shm=shm,
+        weights=weights,
+        audio=view(shm, layout['audio']),
+        matrices={
+            kind: sparse.csr_matrix(
+                (view(shm, layout[f'{kind}.data']), view(shm, layout[f'{kind}.indices']),
+                 view(shm, layout[f'{kind}.indptr'])),
+                shape=(n_users, n_items[kind]), copy=False,
+            )
+            for kind in ITEM_FIELDS
+        },
+    )
+
+
+def score_block(matrices: Dict[str, sparse.csr_matrix], audio: np.ndarray,
+                weights: Dict[str, float], rows: np.ndarray) -> np.ndarray:
+    """
+    FlirtifyMatcher.score_population for several population rows at once:
+    a population x len(rows) block of match scores. Each item kind is one
+    sparse-sparse product against the queries' own rows.
+    """
+    scores = (audio @ audio[rows].T) * weights['audio_match']
+    for kind, weight in (('artists', 'artist_match'), ('tracks', 'track_match'), ('genres', 'genre_match')):
+        matrix = matrices[kind]
+        scores += (matrix @ matrix[rows].T).toarray() * weights[weight]
+    return scores
+
+
+def top_k_block(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k other rows of each score column, best first, as (rows, scores)"""
+    scores[rows, np.arange(len(rows))] = -np.inf  # Never match a user with themselves
+    k = min(k, scores.shape[0] - 1)
+    if k <= 0:
+        return np.zeros((len(rows), 0), dtype=np.int64), np.zeros((len(rows), 0), dtype=np.float32)
+    # One contiguous row per query makes the partition several times faster
+    scores = np.ascontiguousarray(scores.T)
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1).astype(np.float32)
+
+
+def _top_k_task(rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    matrices, audio, weights = _worker_state['matrices'], _worker_state['audio'], _worker_state['weights']
+    block = max(1, PARALLEL_BLOCK_CELLS // max(audio.shape[0], 1))
+    top_rows, top_scores = [], []
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        chunk_rows, chunk_scores = top_k_block(score_block(matrices, audio, weights, chunk), chunk, k)
+        top_rows.append(chunk_rows)
+        top_scores.append(chunk_scores)
+    return np.vstack(top_rows), np.vstack(top_scores)
+
+
+# ============================
+# 🎵 PARENT SIDE 🎵
+# ============================
+
+class ParallelScorer:
+    """
+    Fans batch scoring of one population out over a process pool.
+
+    The population is placed in shared memory once; each task sends only
+    query row numbers and gets back (rows, scores) arrays, so throughput
+    grows with cores rather than with pickled payloads. Scores are exactly
+    FlirtifyMatcher's, as returned by rank_candidates. Use as a context
+    manager, or call close(), to release the workers and the block.
+    """
+
+    def __init__(self, population: Population, weights: Dict[str, float],
+                 workers: int = PARALLEL_WORKERS, task_size: int = PARALLEL_TASK_SIZE):
+        self.population = population
+        self.task_size = task_size
+        self.shared = SharedPopulation(population)
+        try:
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_attach,
+                initargs=(self.shared.name, self.shared.layout, self.shared.dims, dict(weights)),
+            )
+        except Exception:
+            self.shared.close()
+            raise
+
+    def top_k_rows(self, rows: Iterable[int], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k (rows, scores) for every query row, in query order"""
+        rows = np.asarray(list(rows) if not isinstance(rows, np.ndarray) else rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+        tasks = [rows[start:start + self.task_size] for start in range(0, len(rows), self.task_size)]
+        results = list(self._pool.map(_top_k_task, tasks, [k] * len(tasks)))
+        return np.vstack([r for r, _ in results]), np.vstack([s for _, s in results])
+
+    def top_k(self, user_ids: Iterable[str], k: int) -> Dict[str, List[Tuple[str, float]]]:
+        """Top k (user_id, score) matches of each known user; unknown users are skipped"""
+        known = [user_id for user_id in user_ids if user_id in self.population.row_of]
+        top_rows, top_scores = self.top_k_rows([self.population.row_of[u] for u in known], k)
+        user_ids_of = self.population.user_ids
+        return {
+            user_id: [(user_ids_of[row], float(score)) for row, score in zip(rows, scores)]
+            for user_id, rows, scores in zip(known, top_rows, top_scores)
+        }
+
+    def all_top_k(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The nightly all-pairs pass: top k rows and scores for every user"""
+        return self.top_k_rows(np.arange(len(self.population)), k)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.shared.close()
+
+    def __enter__(self) -> "ParallelScorer":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
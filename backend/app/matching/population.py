@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from ..database import db
+from ..metrics import timed_iter
+from .profile import ITEM_FIELDS, CompactProfile, Interner, Vocabulary, profile_audio, profile_items
+
+POPULATION_TTL_SECONDS = float(os.getenv("POPULATION_TTL_SECONDS", "300"))
+# When set, populations are memory-mapped from snapshots here instead of streamed from Firestore
+POPULATION_SNAPSHOT_DIR = os.getenv("POPULATION_SNAPSHOT_DIR", "")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class Population:
+    """
+    Matrix view of every user profile.
+
+    Artists, tracks and genres are sparse user x item incidence matrices and
+    the audio features a dense, row-normalized user x 3 matrix, so scoring
+    one user against everyone is a handful of sparse mat-vec products.
+    """
+
+    def __init__(self, user_ids: Sequence[str], matrices: Dict[str, sparse.csr_matrix],
+                 audio: np.ndarray, vocabs: Dict[str, Vocabulary], row_of: Optional[Mapping[str, int]] = None):
+        self.user_ids = user_ids
+        self.matrices = matrices
+        self.audio = audio
+        self.vocabs = vocabs
+        self.row_of = row_of if row_of is not None else {user_id: row for row, user_id in enumerate(user_ids)}
+
+    @classmethod
+    def from_profiles(cls, profiles: Iterable[Tuple[str, Dict]]) -> "Population":
+        """Build a population from (user_id, user_data) pairs"""
+        interner = Interner()
+        return cls.from_compact(((user_id, interner.compact(user_data)) for user_id, user_data in profiles), interner)
+
+    @classmethod
+    def from_compact(cls, profiles: Iterable[Tuple[str, CompactProfile]], interner: Interner) -> "Population":
+        """
+        Build a population from CompactProfiles interned by `interner`. Their
+        sorted id arrays are exactly CSR rows, so they are concatenated as is.
+        """
+        user_ids, audio = [], []
+        rows = {kind: [] for kind in ITEM_FIELDS}
+        for user_id, profile in profiles:
+            user_ids.append(user_id)
+            audio.append(profile.audio)
+            for kind in ITEM_FIELDS:
+                rows[kind].append(getattr(profile, kind))
+
+        n_users = len(user_ids)
+        matrices = {}
+        for kind, kind_rows in rows.items():
+            indptr = np.zeros(n_users + 1, dtype=np.int32)
+            np.cumsum([len(ids) for ids in kind_rows], out=indptr[1:])
+            indices = np.frombuffer(bytearray(b"".join(ids.tobytes() for ids in kind_rows)), dtype=np.int32)
+            matrices[kind] = sparse.csr_matrix(
+                (np.ones(len(indices), dtype=np.float32), indices, indptr),
+                shape=(n_users, len(interner.vocabs[kind])),
+            )
+
+        audio_matrix = np.vstack(audio) if audio else np.zeros((0, 3), dtype=np.float32)
+        return cls(user_ids, matrices, audio_matrix, interner.vocabs)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def query_vectors(self, user_data: Dict) -> Dict[str, np.ndarray]:
+        """
+        Encode a profile as dense indicator vectors over this population's
+        vocabularies. Items nobody else has are dropped: they can't overlap.
+        """
+        vectors = {}
+        for kind, vocab in self.vocabs.items():
+            vector = np.zeros(len(vocab), dtype=np.float32)
+            ids = [vocab.get(item) for item in profile_items(user_data, kind)]
+            vector[[i for i in ids if i is not None]] = 1
+            vectors[kind] = vector
+        audio = profile_audio(user_data)
+        vectors['audio'] = _normalize_rows(audio[np.newaxis, :])[0]
+        return vectors
+
+    def overlap_counts(self, query: Dict[str, np.ndarray], rows: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Number of shared items of each kind between the query and every user (or just `rows`)"""
+        if rows is None:
+            return {kind: self.matrices[kind] @ query[kind] for kind in ITEM_FIELDS}
+        return {kind: self.matrices[kind][rows] @ query[kind] for kind in ITEM_FIELDS}
+
+    def audio_similarity(self, query: Dict[str, np.ndarray], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of the query's audio vector to every user's (or just `rows`)"""
+        audio = self.audio if rows is None else self.audio[rows]
+        return audio @ query['audio']
+
+    def pair_overlaps(self, rows1: np.ndarray, rows2: np.ndarray) -> Dict[str, np.ndarray]:
+        """Number of shared items of each kind for every pair (rows1[i], rows2[i])"""
+        return {
+            kind: np.asarray(self.matrices[kind][rows1].multiply(self.matrices[kind][rows2]).sum(axis=1)).ravel()
+            for kind in ITEM_FIELDS
+        }
+
+    def pair_audio_similarity(self, rows1: np.ndarray, rows2: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the audio vectors of every pair (rows1[i], rows2[i])"""
+        return np.einsum('ij,ij->i', self.audio[rows1], self.audio[rows2])
+
+    def shared_items(self, row: int, query: Dict[str, np.ndarray], kind: str) -> List[str]:
+        """Names of the items of one kind shared by the query and a user"""
+        matrix = self.matrices[kind]
+        item_ids = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+        names = self.vocabs[kind].names
+        return [names[i] for i in item_ids if query[kind][i]]
+
+
+# ============================
+# 🎵 POPULATION CACHE 🎵
+# ============================
+
+_population: Optional[Population] = None
+_population_built_at = 0.0
+_population_refreshing = False
+_population_lock = threading.Lock()
+# Held only while building the first population, which every caller must wait for
+_population_build_lock = threading.Lock()
+
+
+def stream_population() -> Population:
+    """Stream every user document from Firestore into a Population"""
+    docs = timed_iter("firestore", db.collection('users').stream())
+    return Population.from_profiles((doc.id, doc.to_dict()) for doc in docs)
+
+
+def load_population() -> Population:
+    """
+    Load the population from the latest snapshot plus its delta log when
+    POPULATION_SNAPSHOT_DIR is set, otherwise stream it from Firestore.
+    """
+    if POPULATION_SNAPSHOT_DIR:
+        from .snapshot import load_or_build_snapshot
+
+        return load_or_build_snapshot(POPULATION_SNAPSHOT_DIR)
+    return stream_population()
+
+
+def _refresh_population():
+    global _population, _population_built_at, _population_refreshing
+    try:
+        population = load_population()
+    except Exception as e:
+        print(f"Population refresh failed: {e}")
+        population = None
+    with _population_lock:
+        if population is not None:
+            _population = population
+        # A failed refresh is retried once the TTL has passed again
+        _population_built_at = time.monotonic()
+        _population_refreshing = False
+
+
+def get_population() -> Population:
+    """
+    Return the cached population. Once it is older than the TTL it keeps
+    being served while a background thread rebuilds it; callers only wait
+    for the very first build.
+    """
+    global _population, _population_built_at, _population_refreshing
+    with _population_lock:
+        if _population is not None:
+            if time.monotonic() - _population_built_at > POPULATION_TTL_SECONDS and not _population_refreshing:
+                _population_refreshing = True
+                threading.Thread(target=_refresh_population, name="population-refresh", daemon=True).start()
+            return _population
+
+    with _population_build_lock:
+        with _population_lock:
+            if _population is not None:
+                return _population
+        population = load_population()
+        with _population_lock:
+            _population, _population_built_at = population, time.monotonic()
+            return _population
@@ -0,0 +1,128 @@
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Profile fields scored by FlirtifyMatcher, keyed by matcher name
+ITEM_FIELDS = {
+    'artists': 'top_artists',
+    'tracks': 'top_tracks',
+    'genres': 'top_genres',
+}
+AUDIO_KEYS = ('danceability', 'energy', 'valence')
+
+
+class Vocabulary:
+    """Interns item names (artists, tracks, genres) to dense integer ids"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        item_id = self.ids.get(name)
+        if item_id is None:
+            item_id = len(self.names)
+            self.ids[name] = item_id
+            self.names.append(name)
+        return item_id
+
+    def get(self, name: str) -> Optional[int]:
+        return self.ids.get(name)
+
+
+def profile_items(user_data: Dict, kind: str) -> List[str]:
+    """Return the unique items of one kind from a Firestore user document"""
+    return list(dict.fromkeys(user_data.get(ITEM_FIELDS[kind]) or []))
+
+
+def profile_audio(user_data: Dict) -> np.ndarray:
+    """Return the user's audio vector, zeros if the profile has none"""
+    features = user_data.get('audio_features') or {}
+    try:
+        return np.array([float(features[key]) for key in AUDIO_KEYS], dtype=np.float32)
+    except (KeyError, TypeError, ValueError):
+        return np.zeros(len(AUDIO_KEYS), dtype=np.float32)
+
+
+class CompactProfile:
+    """
+    A user's matcher inputs with every string interned: artists, tracks and
+    genres are sorted int32 id arrays and the audio features one unit-length
+    float32 vector (all zeros when unknown), so scoring a pair needs no sets
+    and no per-pair allocation.
+    """
+
+    __slots__ = ('artists', 'tracks', 'genres', 'audio')
+
+    def __init__(self, artists: array, tracks: array, genres: array, audio: np.ndarray):
+        self.artists = artists
+        self.tracks = tracks
+        self.genres = genres
+        self.audio = audio
+
+    def nbytes(self) -> int:
+        """Approximate payload size, excluding Python object headers"""
+        return sum(len(ids) * ids.itemsize for ids in (self.artists, self.tracks, self.genres)) + self.audio.nbytes
+
+
+class Interner:
+    """Shared vocabularies that turn user documents into CompactProfiles"""
+
+    def __init__(self, vocabs: Optional[Dict[str, Vocabulary]] = None):
+        self.vocabs = vocabs if vocabs is not None else {kind: Vocabulary() for kind in ITEM_FIELDS}
+        self._lock = threading.Lock()
+
+    def compact(self, user_data: Dict) -> CompactProfile:
+        with self._lock:
+            ids = {
+                kind: array('i', sorted({vocab.intern(item) for item in profile_items(user_data, kind)}))
+                for kind, vocab in self.vocabs.items()
+            }
+        audio = profile_audio(user_data)
+        norm = np.linalg.norm(audio)
+        if norm:
+            audio /= norm
+        return CompactProfile(ids['artists'], ids['tracks'], ids['genres'], audio)
+
+    def names(self, kind: str, item_ids) -> List[str]:
+        names = self.vocabs[kind].names
+        return [names[i] for i in item_ids]
+
+
+def overlap_count(a: array, b: array) -> int:
+    """Size of the intersection of two sorted id arrays, by merging them"""
+    i = j = count = 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a and j < len_b:
+        x, y = a[i], b[j]
+        if x == y:
+            count += 1
+            i += 1
+            j += 1
+        elif x < y:
+            i += 1
+        else:
+            j += 1
+    return count
+
+
+def overlap(a: array, b: array) -> List[int]:
+    """Ids present in both sorted id arrays"""
+    i = j = 0
+    shared = []
+    while i < len(a) and j < len(b):
+        x, y = a[i], b[j]
+        if x == y:
+            shared.append(x)
+            i += 1
+            j += 1
+        elif x < y:
+            i += 1
+        else:
+            j += 1
+    return shared
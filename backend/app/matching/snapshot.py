@@ -0,0 +1,458 @@
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from ..database import add_profile_listener, get_user_profile
+from .population import POPULATION_SNAPSHOT_DIR, Population, stream_population
+from .profile import AUDIO_KEYS, ITEM_FIELDS, CompactProfile, Interner
+
+# Bumped whenever the on-disk layout changes; other formats are rebuilt, not read
+SNAPSHOT_FORMAT = 1
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+DELTA_LOG = "deltas.ndjson"
+# Held by whoever builds, writes or prunes snapshots in a directory
+LOCK_FILE = ".lock"
+
+
+class StringTable:
+    """
+    Read-only list of strings stored as one UTF-8 blob plus end offsets,
+    with a permutation sorting them for binary-search lookups. All three
+    are memory-mapped, so a table costs no heap and no load time. Strings
+    appended after loading (from replayed deltas) are kept in memory.
+    """
+
+    def __init__(self, blob, offsets: np.ndarray, order: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+        self._order = order
+        self._base = len(offsets) - 1
+        self._extra: List[str] = []
+        self._extra_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._base + len(self._extra)
+
+    def _bytes(self, i: int) -> bytes:
+        return self._blob[int(self._offsets[i]):int(self._offsets[i + 1])]
+
+    def __getitem__(self, i) -> str:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i >= self._base:
+            return self._extra[i - self._base]
+        return self._bytes(i).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+    def index(self, name: str) -> Optional[int]:
+        """Position of a string, or None"""
+        extra = self._extra_ids.get(name)
+        if extra is not None:
+            return extra
+        key = name.encode("utf-8")
+        lo, hi = 0, self._base
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(self._order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._base and self._bytes(self._order[lo]) == key:
+            return int(self._order[lo])
+        return None
+
+    def append(self, name: str) -> int:
+        i = len(self)
+        self._extra.append(name)
+        self._extra_ids[name] = i
+        return i
+
+
+class MappedVocabulary:
+    """Vocabulary over a StringTable; names interned after loading are appended in memory"""
+
+    def __init__(self, names: StringTable):
+        self.names = names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        item_id = self.names.index(name)
+        return item_id if item_id is not None else self.names.append(name)
+
+    def get(self, name: str) -> Optional[int]:
+        return self.names.index(name)
+
+
+class RowIndex(Mapping):
+    """Population.row_of over a StringTable of user ids"""
+
+    def __init__(self, user_ids: StringTable):
+        self.user_ids = user_ids
+
+    def __getitem__(self, user_id: str) -> int:
+        row = self.user_ids.index(user_id)
+        if row is None:
+            raise KeyError(user_id)
+        return row
+
+    def get(self, user_id: str, default=None):
+        row = self.user_ids.index(user_id)
+        return default if row is None else row
+
+    def __iter__(self):
+        return iter(self.user_ids)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+
+# ============================
+# 🎵 SNAPSHOT FILES 🎵
+# ============================
+
+def _write_strings(directory: str, name: str, strings: Sequence[str]):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(directory, f"{name}.blob"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+    order = sorted(range(len(encoded)), key=encoded.__getitem__)
+    np.save(os.path.join(directory, f"{name}.order.npy"), np.array(order, dtype=np.int64))
+
+
+def _load_array(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode="r")
+
+
+def _read_strings(directory: str, name: str) -> StringTable:
+    with open(os.path.join(directory, f"{name}.blob"), "rb") as f:
+        # The mapping stays valid after the file is closed; empty files can't be mapped
+        blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+    return StringTable(
+        blob,
+        _load_array(os.path.join(directory, f"{name}.offsets.npy")),
+        _load_array(os.path.join(directory, f"{name}.order.npy")),
+    )
+
+
+def current_snapshot(directory: str) -> Optional[str]:
+    """Name of the snapshot workers should load, or None before the first one"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def snapshot_lock(directory: str):
+    """
+    Exclusive lock on a snapshot directory, shared by every process on the
+    host. Hold it around building and writing a snapshot so that concurrent
+    writers neither prune each other's snapshots nor repeat each other's
+    work. Without a writable directory nothing can be written anyway, so the
+    lock is skipped.
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+        f = open(os.path.join(directory, LOCK_FILE), "a")
+    except OSError as e:
+        print(f"Could not lock population snapshots in {directory}: {e}")
+        yield
+        return
+    with f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def write_snapshot(population: Population, directory: str, taken_at: int) -> str:
+    """
+    Write a population as snapshot `v<taken_at>` and make it current.
+    taken_at is the time_ns() before the population was read: deltas logged
+    from then on are replayed over it. The snapshot is written to a
+    temporary directory and renamed, so readers never see a partial one.
+    Call it holding snapshot_lock(directory), which also covers the pruning
+    of older snapshots.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"v{taken_at}"
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    os.makedirs(tmp)
+    try:
+        _write_strings(tmp, "users", population.user_ids)
+        np.save(os.path.join(tmp, "audio.npy"), np.ascontiguousarray(population.audio, dtype=np.float32))
+        for kind, matrix in population.matrices.items():
+            np.save(os.path.join(tmp, f"{kind}.indptr.npy"), matrix.indptr)
+            np.save(os.path.join(tmp, f"{kind}.indices.npy"), matrix.indices)
+            np.save(os.path.join(tmp, f"{kind}.data.npy"), matrix.data)
+            _write_strings(tmp, f"{kind}.names", population.vocabs[kind].names)
+        meta = {
+            "format": SNAPSHOT_FORMAT,
+            "taken_at": taken_at,
+            "users": len(population),
+            "items": {kind: len(vocab) for kind, vocab in population.vocabs.items()},
+            "previous": current_snapshot(directory),
+        }
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp, os.path.join(directory, name))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(directory, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(pointer, "w") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+    _prune(directory, keep={name, meta["previous"]})
+    return name
+
+
+def _prune(directory: str, keep: Set[Optional[str]]):
+    # The previous snapshot is kept: its delta log may hold changes made while this one was taken
+    for entry in os.listdir(directory):
+        if entry.startswith("v") and entry not in keep:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+
+def load_snapshot(directory: str) -> Optional[Tuple[Population, Dict]]:
+    """Memory-map the current snapshot as (population, meta); None if there is none"""
+    name = current_snapshot(directory)
+    if name is None:
+        return None
+    path = os.path.join(directory, name)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"unsupported snapshot format {meta.get('format')}")
+    meta["name"] = name
+
+    user_ids = _read_strings(path, "users")
+    vocabs = {kind: MappedVocabulary(_read_strings(path, f"{kind}.names")) for kind in ITEM_FIELDS}
+    matrices = {
+        kind: sparse.csr_matrix(
+            (_load_array(os.path.join(path, f"{kind}.data.npy")),
+             _load_array(os.path.join(path, f"{kind}.indices.npy")),
+             _load_array(os.path.join(path, f"{kind}.indptr.npy"))),
+            shape=(len(user_ids), len(vocabs[kind])), copy=False,
+        )
+        for kind in ITEM_FIELDS
+    }
+    audio = _load_array(os.path.join(path, "audio.npy"))
+    return Population(user_ids, matrices, audio, vocabs, row_of=RowIndex(user_ids)), meta
+
+
+# ============================
+# 🎵 DELTA LOG 🎵
+# ============================
+
+def matcher_fields(user_data: Dict) -> Dict:
+    """The parts of a profile a Population is built from"""
+    fields = {field: list(user_data.get(field) or []) for field in ITEM_FIELDS.values()}
+    audio = user_data.get("audio_features") or {}
+    fields["audio_features"] = {key: audio[key] for key in AUDIO_KEYS if key in audio}
+    return fields
+
+
+def append_delta(directory: str, user_id: str, user_data: Optional[Dict], at: int):
+    """
+    Append a profile's current matcher fields (None: deleted) to the current
+    snapshot's delta log. Each entry is one O_APPEND write, so workers on a
+    host can share the log.
+    """
+    name = current_snapshot(directory)
+    if name is None:
+        return  # The first snapshot will read the profile itself
+    entry = {"at": at, "user_id": user_id, "profile": matcher_fields(user_data) if user_data is not None else None}
+    fd = os.open(os.path.join(directory, name, DELTA_LOG), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry) + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def read_deltas(directory: str, meta: Dict) -> List[Tuple[str, Optional[Dict]]]:
+    """
+    (user_id, profile) changes since a snapshot was taken, oldest first.
+    Changes logged while it was being taken went to the previous snapshot's
+    log, so both are read.
+    """
+    deltas = []
+    for name in (meta.get("previous"), meta["name"]):
+        if name is None:
+            continue
+        try:
+            f = open(os.path.join(directory, name, DELTA_LOG))
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A write torn by a crash
+                if entry["at"] >= meta["taken_at"]:
+                    deltas.append((entry["user_id"], entry["profile"]))
+    return deltas
+
+
+def _replace_rows(matrix: sparse.csr_matrix, rows: np.ndarray, replaced: List[array],
+                  appended: List[array], n_items: int) -> sparse.csr_matrix:
+    """A copy of a CSR incidence matrix with some rows replaced and more appended"""
+    indptr, indices = matrix.indptr.astype(np.int64), matrix.indices
+    lengths = np.diff(indptr)
+    new_lengths = np.concatenate([lengths, np.array([len(ids) for ids in appended], dtype=np.int64)])
+    new_lengths[rows] = [len(ids) for ids in replaced]
+    new_indptr = np.zeros(len(new_lengths) + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=new_indptr[1:])
+
+    new_indices = np.empty(new_indptr[-1], dtype=np.int32)
+    # Every kept entry moves by how much the rows before it grew or shrank
+    kept_rows = np.ones(len(lengths), dtype=bool)
+    kept_rows[rows] = False
+    kept = np.repeat(kept_rows, lengths)
+    shift = np.repeat(new_indptr[:len(lengths)] - indptr[:-1], lengths)
+    new_indices[(np.arange(len(indices)) + shift)[kept]] = indices[kept]
+    for row, ids in zip(np.concatenate([rows, np.arange(len(lengths), len(new_lengths))]), replaced + appended):
+        new_indices[new_indptr[row]:new_indptr[row + 1]] = ids
+
+    return sparse.csr_matrix(
+        (np.ones(len(new_indices), dtype=np.float32), new_indices, new_indptr.astype(np.int32)),
+        shape=(len(new_lengths), n_items),
+    )
+
+
+def apply_deltas(population: Population, deltas: List[Tuple[str, Optional[Dict]]]) -> Population:
+    """
+    Replay logged changes over a snapshot population, last change winning.
+    Changed rows are rewritten into private copies of the arrays, so keep
+    deltas small by taking snapshots regularly. Deleted users' rows are
+    emptied. The population's user ids, row index and string tables are
+    extended in place.
+    """
+    latest = dict(deltas)
+    if not latest:
+        return population
+
+    interner = Interner(population.vocabs)
+    empty = CompactProfile(array('i'), array('i'), array('i'), np.zeros(len(AUDIO_KEYS), dtype=np.float32))
+    changed_rows, changed, new = [], [], []
+    for user_id, user_data in latest.items():
+        profile = interner.compact(user_data) if user_data is not None else empty
+        row = population.row_of.get(user_id)
+        if row is not None:
+            changed_rows.append(row)
+            changed.append(profile)
+        elif user_data is not None:
+            population.user_ids.append(user_id)
+            if isinstance(population.row_of, dict):
+                # A RowIndex reads user_ids itself; a plain dict has to be told
+                population.row_of[user_id] = len(population.user_ids) - 1
+            new.append(profile)
+
+    rows = np.array(changed_rows, dtype=np.int64)
+    matrices = {
+        kind: _replace_rows(matrix, rows, [getattr(p, kind) for p in changed], [getattr(p, kind) for p in new],
+                            len(population.vocabs[kind]))
+        for kind, matrix in population.matrices.items()
+    }
+    audio = np.vstack([population.audio] + [p.audio[np.newaxis] for p in new]).astype(np.float32)
+    if changed:
+        audio[rows] = np.vstack([p.audio for p in changed])
+    return Population(population.user_ids, matrices, audio, population.vocabs, row_of=population.row_of)
+
+
+def _load_current(directory: str) -> Optional[Population]:
+    try:
+        loaded = load_snapshot(directory)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not load population snapshot from {directory}: {e}")
+        return None
+    if loaded is None:
+        return None
+    population, meta = loaded
+    return apply_deltas(population, read_deltas(directory, meta))
+
+
+def load_or_build_snapshot(directory: str) -> Population:
+    """
+    The current snapshot with its delta log replayed. Without a usable
+    snapshot the population is streamed from Firestore and written as the
+    first one under snapshot_lock, so workers starting together wait for
+    one stream instead of each paying for their own.
+    """
+    population = _load_current(directory)
+    if population is not None:
+        return population
+
+    with snapshot_lock(directory):
+        # Another worker may have written one while this one waited for the lock
+        population = _load_current(directory)
+        if population is not None:
+            return population
+
+        taken_at = time.time_ns()
+        population = stream_population()
+        try:
+            write_snapshot(population, directory, taken_at)
+        except OSError as e:
+            print(f"Could not write population snapshot to {directory}: {e}")
+        return population
+
+
+class DeltaLog:
+    """
+    Appends every profile write to the snapshot delta log, on a background
+    thread so writes don't wait on the profile read. Bulk ingests don't
+    notify listeners and are picked up by the next snapshot instead.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delta-log")
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def record(self, user_id: str):
+        with self._lock:
+            self._pending.discard(user_id)
+        at = time.time_ns()
+        try:
+            append_delta(self.directory, user_id, get_user_profile(user_id), at)
+        except Exception as e:
+            print(f"Could not log profile change for {user_id}: {e}")
+
+    def schedule(self, user_id: str):
+        """Queue a delta for a user, coalescing repeated writes"""
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._executor.submit(self.record, user_id)
+
+
+delta_log = DeltaLog(POPULATION_SNAPSHOT_DIR) if POPULATION_SNAPSHOT_DIR else None
+if delta_log is not None:
+    add_profile_listener(delta_log.schedule)
@@ -0,0 +1,237 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Route label for work done outside a request, e.g. background refreshes
+BACKGROUND_ROUTE = "background"
+METRICS_PATH = "/metrics"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple"""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (the last one is +Inf), sum, count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_duration = Histogram(
+    "flirtify_request_duration_seconds", "HTTP request latency by route.", ("route", "method", "status"),
+)
+stage_duration = Histogram(
+    "flirtify_stage_duration_seconds",
+    "Time spent in each backend stage (firestore, spotify, anthropic, scoring) by route.",
+    ("route", "stage"),
+)
+
+# Stage timings of the request being served: {stage: [total seconds, calls]}.
+# The dict is shared, not copied, with threads that run in a copy of the
+# request's context (sync endpoints, run_db), so their stages are counted too.
+_request_stages: contextvars.ContextVar[Optional[Dict[str, List]]] = contextvars.ContextVar(
+    "request_stages", default=None
+)
+
+
+_stages_lock = threading.Lock()
+
+
+def record_stage(stage: str, seconds: float):
+    """Attribute `seconds` of work to a stage of the current request, or to background work"""
+    stages = _request_stages.get()
+    if stages is None:
+        stage_duration.observe((BACKGROUND_ROUTE, stage), seconds)
+        return
+    with _stages_lock:
+        totals = stages.get(stage)
+        if totals is None:
+            stages[stage] = [seconds, 1]
+        else:
+            totals[0] += seconds
+            totals[1] += 1
+
+
+# Stages being timed by an enclosing timed() block in this context
+_open_stages: contextvars.ContextVar[frozenset] = contextvars.ContextVar("open_stages", default=frozenset())
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time the enclosed block as one call of `stage`. Blocks nested in one of
+    the same stage, like rank_candidates calling score_population, are
+    already counted by it and aren't timed again.
+    """
+    open_stages = _open_stages.get()
+    if stage in open_stages:
+        yield
+        return
+    token = _open_stages.set(open_stages | {stage})
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _open_stages.reset(token)
+        record_stage(stage, time.perf_counter() - started)
+
+
+def timed_iter(stage: str, iterable: Iterable):
+    """
+    Iterate, timing only the waits for each item, e.g. the round trips of a
+    Firestore stream, and record them as one call of `stage` once the
+    iteration ends. Time the consumer spends on each item isn't counted.
+    """
+    iterator = iter(iterable)
+    spent = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            yield item
+    finally:
+        record_stage(stage, spent)
+
+
+def timed_stage(stage: str):
+    """Decorator form of timed()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(stages: Dict[str, List], total: float) -> str:
+    """Server-Timing header value for a request's stage totals"""
+    entries = [f'{stage};dur={seconds * 1000:.3f};desc="{calls} calls"'
+               for stage, (seconds, calls) in sorted(stages.items())]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
+
+
+def _route_templates(routes, prefix: str = "") -> Iterator[Tuple[object, str]]:
+    """Every route of an app with its full path template, router prefixes included"""
+    for route in routes:
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            # Newer FastAPI keeps included routers nested instead of copying
+            # their routes with the prefix prepended
+            yield from _route_templates(included.routes, prefix + route.include_context.prefix)
+        else:
+            yield route, prefix + getattr(route, "path_format", getattr(route, "path", ""))
+
+
+# Full path template of each route, by id(route), filled in on first use
+_templates: Dict[int, str] = {}
+
+
+def route_label(scope) -> str:
+    """Full path template of the route a request matched, router prefixes included"""
+    global _templates
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    label = _templates.get(id(route))
+    if label is None:
+        _templates = {id(r): template for r, template in _route_templates(scope["app"].routes)}
+        label = _templates.get(id(route)) or getattr(route, "path", None) or "unmatched"
+    return label
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware timing every request by route template and stage.
+
+    Stage totals gathered before the response starts are sent back in a
+    Server-Timing header; histograms are recorded once the body has been
+    sent, so streamed responses include their streaming stages too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        stages: Dict[str, List] = {}
+        token = _request_stages.set(stages)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = server_timing(stages, time.perf_counter() - started).encode("latin-1")
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", header)])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
+            route_path = route_label(scope)
+            request_duration.observe((route_path, scope["method"], str(status[0])), time.perf_counter() - started)
+            for stage, (seconds, _) in stages.items():
+                stage_duration.observe((route_path, stage), seconds)
+
+
+def render_metrics() -> str:
+    """Every histogram in the Prometheus text exposition format"""
+    return "\n".join(request_duration.expose() + stage_duration.expose()) + "\n"
@@ -0,0 +1,195 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .metrics import route_label
+
+# Fraction of requests profiled; requests with a valid X-Profile admin header always are
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+# Shared secret for admin-only endpoints and for requesting a profile with X-Profile: 1
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+PROFILE_SUFFIX = ".folded"
+PROFILE_NAME = re.compile(r"^[\w.-]+\.folded$")
+# (module, function) of the leaf frames of threads that are blocked waiting for
+# work rather than running; matched by module too, so hot frames that merely
+# share a name, like ProfileCache.get, are still sampled
+IDLE_FUNCTIONS = frozenset({
+    ("threading", "wait"),
+    ("queue", "get"),
+    ("selectors", "select"),
+    ("socket", "accept"),
+    ("concurrent.futures.thread", "_worker"),
+    ("asyncio.base_events", "_run_once"),
+})
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+
+def _is_idle(frame) -> bool:
+    return (frame.f_globals.get("__name__"), frame.f_code.co_name) in IDLE_FUNCTIONS
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler.
+
+    While at least one profile is active, a background thread snapshots the
+    Python stack of every other thread each PROFILE_INTERVAL_SECONDS and
+    adds it, root first, to every active profile as a folded stack. Threads
+    blocked waiting for work are skipped. Samples are not tied to a request:
+    profiles of overlapping requests also see each other's stacks, so the
+    sample rate should stay low.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._active: List[Counter] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Counter:
+        samples = Counter()
+        with self._lock:
+            self._active.append(samples)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self, samples: Counter):
+        with self._lock:
+            self._active.remove(samples)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)).replace(";", ":"))
+                folded = ";".join(reversed(stack))
+                for samples in active:
+                    samples[folded] += 1
+            time.sleep(self.interval)
+
+
+sampler = StackSampler()
+
+
+def _slug(route: str) -> str:
+    return re.sub(r"[^\w-]+", "_", route).strip("_") or "root"
+
+
+def write_profile(samples: Counter, route: str, method: str, elapsed: float,
+                  directory: str = PROFILE_DIR) -> Optional[str]:
+    """
+    Write samples in the folded-stack format read by flamegraph.pl and
+    speedscope, one `frame;frame;frame count` line per distinct stack.
+    Returns the file name, or None if nothing was sampled.
+    """
+    if not samples:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{int(time.time() * 1000) % 1000:03d}" \
+           f"_{method}_{_slug(route)}_{elapsed * 1000:.0f}ms{PROFILE_SUFFIX}"
+    with open(os.path.join(directory, name), "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    _prune(directory)
+    return name
+
+
+def _prune(directory: str):
+    names = sorted(n for n in os.listdir(directory) if n.endswith(PROFILE_SUFFIX))
+    for name in names[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def list_profiles(directory: str = PROFILE_DIR, limit: int = 50) -> List[Dict]:
+    """Most recent profiles first"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((n for n in os.listdir(directory) if PROFILE_NAME.match(n)), reverse=True)[:limit]
+    profiles = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        profiles.append({"name": name, "bytes": stat.st_size, "created_at": stat.st_mtime})
+    return profiles
+
+
+def profile_path(name: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Path of a stored profile, or None for unknown or unsafe names"""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling a PROFILE_SAMPLE_RATE fraction of requests,
+    plus any request sent with `X-Profile: 1` and a valid X-Admin-Token.
+    Profiles are written to PROFILE_DIR, named after the route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _wanted(scope) -> bool:
+        if not ADMIN_TOKEN and PROFILE_SAMPLE_RATE <= 0:
+            return False
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-profile") == b"1":
+            return is_admin(headers.get(b"x-admin-token", b"").decode("latin-1"))
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        samples = sampler.start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stop(samples)
+            route = route_label(scope)
+            try:
+                write_profile(samples, route, scope["method"], time.perf_counter() - started)
+            except OSError as e:
+                print(f"Could not write profile for {route}: {e}")
@@ -0,0 +1,28 @@
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import FileResponse
+from ..profiling import is_admin, list_profiles, profile_path
+
+router = APIRouter()
+
+def require_admin(x_admin_token: Optional[str]):
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@router.get("/profiles")
+def get_profiles(limit: int = Query(50, ge=1, le=500), x_admin_token: Optional[str] = Header(None)):
+    """List the most recent request profiles, newest first"""
+    require_admin(x_admin_token)
+    return {"profiles": list_profiles(limit=limit)}
+
+@router.get("/profiles/{name}")
+def get_profile(name: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Download one profile as folded stacks; feed it to flamegraph.pl or drop
+    it into speedscope.app to see the flame graph.
+    """
+    require_admin(x_admin_token)
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
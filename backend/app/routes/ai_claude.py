@@ -1,88 +1,293 @@
 # backend/app/routes/ai_claude.py
 
-import os
-from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException
-from anthropic import Anthropic
-from app.database import db
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Set
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.config import require_env
+from app.database import aget_user_profile, db, get_user_profile, run_db, save_profile_annotations, save_user_profile
+from app.metrics import record_stage, timed
+from app.services.singleflight import SingleFlight
 
+router = APIRouter()
 
-# Load environment variables
-load_dotenv()
+# Anthropic clients are created on first use: importing the SDK is slow and
+# the app should still start when the API key is missing
+_clients = {}
+_clients_lock = threading.Lock()
 
-# Retrieve the Claude API key from environment variables
-CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not CLAUDE_API_KEY:
-    raise ValueError("Claude API key not found in environment variables.")
+def _client(kind: str):
+    with _clients_lock:
+        if kind not in _clients:
+            try:
+                api_key = require_env("ANTHROPIC_API_KEY", "Claude API key")
+            except ValueError as e:
+                raise HTTPException(status_code=503, detail=str(e))
+            import anthropic
+            client_class = anthropic.Anthropic if kind == "sync" else anthropic.AsyncAnthropic
+            _clients[kind] = client_class(api_key=api_key)
+        return _clients[kind]
 
-# Initialize Anthropic client
-anthropic = Anthropic(api_key=CLAUDE_API_KEY)
+def get_anthropic():
+    """Dependency returning the shared Anthropic client"""
+    return _client("sync")
 
-router = APIRouter()
+def get_async_anthropic():
+    """Dependency returning the shared AsyncAnthropic client"""
+    return _client("async")
+
+CLAUDE_MODEL = "claude-3-opus-20240229"
+CLAUDE_MAX_TOKENS = 1024
+CLAUDE_TEMPERATURE = 0.7
+
+# Generated bios keyed by the hash of everything that went into the prompt
+BIOS_COLLECTION = "claude_bios"
 
-def call_claude_api(prompt: str) -> str:
+BIO_PROMPT_TEMPLATE = """
+    The user listens to {artists}. 
+    Their audio features might be {audio_features}.
+    Write a fun, detailed personality profile that connects these music tastes 
+    to unique personality traits and style. 
+    Give it a lively, friendly tone.
+    """
+
+# Concurrent requests for the same bio share one in-flight Claude call
+_bio_generations = SingleFlight()
+
+def call_claude_api(prompt: str, client=None) -> str:
     """
     Calls the Claude API with a given prompt and returns the generated text.
     """
+    client = client or get_anthropic()
     try:
-        message = anthropic.messages.create(
-            model="claude-3-opus-20240229",
-            max_tokens=1024,
-            temperature=0.7,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
-        
-        print("Response:", message)  # Debug info
+        with timed("anthropic"):
+            message = client.messages.create(
+                model=CLAUDE_MODEL,
+                max_tokens=CLAUDE_MAX_TOKENS,
+                temperature=CLAUDE_TEMPERATURE,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ]
+            )
         return message.content[0].text
-        
     except Exception as e:
-        print(f"Error details: {str(e)}")  # Debug info
         raise HTTPException(
             status_code=500,
             detail=f"Claude API error: {str(e)}"
         )
 
 @router.get("/test-claude")
-def test_claude(prompt: str):
+def test_claude(prompt: str, client=Depends(get_anthropic)):
     """
     Endpoint to test Claude API by providing a prompt.
     """
-    completion = call_claude_api(prompt)
+    completion = call_claude_api(prompt, client)
     return {"completion": completion}
 
 
+def bio_prompt(user_data: dict) -> str:
+    """Build the personality bio prompt from a user's profile"""
+    return BIO_PROMPT_TEMPLATE.format(
+        artists=', '.join(user_data.get("top_artists", [])),
+        audio_features=user_data.get("audio_features", {}),
+    )
+
+def bio_hash(user_data: dict) -> str:
+    """
+    Content address of a bio: a hash of the model settings, the prompt
+    template and the profile fields the prompt is built from.
+    """
+    inputs = {
+        "model": CLAUDE_MODEL,
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "temperature": CLAUDE_TEMPERATURE,
+        "template": BIO_PROMPT_TEMPLATE,
+        "top_artists": user_data.get("top_artists", []),
+        "audio_features": user_data.get("audio_features", {}),
+    }
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def cached_bio(user_data: dict, content_hash: str):
+    """Return a previously generated bio for these inputs, or None"""
+    if user_data.get("claude_personality_bio_hash") == content_hash and user_data.get("claude_personality_bio"):
+        return user_data["claude_personality_bio"]
+    with timed("firestore"):
+        doc = db.collection(BIOS_COLLECTION).document(content_hash).get()
+    if doc.exists:
+        # An empty bio is a failed generation, not something to serve again
+        return doc.to_dict().get("bio") or None
+    return None
+
+def store_bio(user_id: str, content_hash: str, bio: str):
+    """
+    Record a bio and the hash of its inputs on the user's profile. Bios
+    don't affect matching, so this doesn't bump the profile version.
+    """
+    save_profile_annotations(user_id, {
+        "claude_personality_bio": bio,
+        "claude_personality_bio_hash": content_hash,
+    })
+
+def _generate_bio(user_data: dict, content_hash: str, client) -> str:
+    bio = cached_bio(user_data, content_hash)
+    if bio is None:
+        bio = call_claude_api(bio_prompt(user_data), client)
+        with timed("firestore"):
+            db.collection(BIOS_COLLECTION).document(content_hash).set({"bio": bio})
+    return bio
+
 @router.get("/claude-personality-bio")
-def generate_personality_bio(user_id: str):
+def generate_personality_bio(user_id: str, client=Depends(get_anthropic)):
     """
     Generate a music personality bio using Claude.
+    Bios are reused while the user's artists and audio features are unchanged.
     """
-    user_doc = db.collection("users").document(user_id).get()
-    if not user_doc.exists:
+    user_data = get_user_profile(user_id)
+    if user_data is None:
         return {"error": "User not found"}
 
-    user_data = user_doc.to_dict()
-    top_artists = user_data.get("top_artists", [])
-    audio_features = user_data.get("audio_features", {})
+    content_hash = bio_hash(user_data)
+    completion = _bio_generations.do(content_hash, _generate_bio, user_data, content_hash, client)
 
-    prompt = f"""
-    The user listens to {', '.join(top_artists)}. 
-    Their audio features might be {audio_features}.
-    Write a fun, detailed personality profile that connects these music tastes 
-    to unique personality traits and style. 
-    Give it a lively, friendly tone.
-    """
-
-    completion = call_claude_api(prompt)
     # Store in Firestore
-    db.collection("users").document(user_id).set({"claude_personality_bio": completion}, merge=True)
+    if user_data.get("claude_personality_bio_hash") != content_hash:
+        store_bio(user_id, content_hash, completion)
 
     return {"personality_bio": completion}
 
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _save_streamed_bio(user_id: str, content_hash: str, bio: str):
+    if bio:
+        with timed("firestore"):
+            db.collection(BIOS_COLLECTION).document(content_hash).set({"bio": bio})
+    store_bio(user_id, content_hash, bio)
+
+# Bio generations outliving the stream that started them, referenced until done
+_bio_streams: Set[asyncio.Task] = set()
+
+async def _stream_bio(client, user_id: str, user_data: dict, content_hash: str, queue: asyncio.Queue):
+    """
+    Generate a bio, putting each text chunk on `queue` and then None (or the
+    error). Runs as its own task, so a client that disconnects mid-stream
+    doesn't waste the paid generation: it is still saved, and it settles the
+    _bio_generations call this stream leads either way.
+    """
+    parts = []
+    started = time.perf_counter()
+    try:
+        async with client.messages.stream(
+            model=CLAUDE_MODEL,
+            max_tokens=CLAUDE_MAX_TOKENS,
+            temperature=CLAUDE_TEMPERATURE,
+            messages=[{"role": "user", "content": bio_prompt(user_data)}],
+        ) as stream:
+            async for text in stream.text_stream:
+                parts.append(text)
+                queue.put_nowait(text)
+    except Exception as e:
+        print(f"Claude bio stream failed for {user_id}: {e}")
+        error = HTTPException(status_code=500, detail=f"Claude API error: {str(e)}")
+        _bio_generations.resolve(content_hash, error=error)
+        queue.put_nowait(error)
+        return
+    finally:
+        record_stage("anthropic", time.perf_counter() - started)
+
+    bio = "".join(parts)
+    try:
+        await run_db(_save_streamed_bio, user_id, content_hash, bio)
+    except Exception as e:
+        print(f"Saving streamed bio failed for {user_id}: {e}")
+    _bio_generations.resolve(content_hash, bio)
+    queue.put_nowait(None)
+
+@router.get("/claude-personality-bio/stream")
+async def stream_personality_bio(user_id: str, client=Depends(get_async_anthropic)):
+    """
+    Stream a music personality bio as Server-Sent Events.
+
+    Emits `token` events with {"text": ...} as Claude generates them, then a
+    `done` event with the full bio once it has been saved to Firestore. A bio
+    cached for unchanged inputs, or generated meanwhile by another request
+    for the same inputs, is sent as a single token.
+    """
+    user_data = await aget_user_profile(user_id)
+    if user_data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    content_hash = bio_hash(user_data)
+    cached = await run_db(cached_bio, user_data, content_hash)
+
+    async def whole_bio(bio: str):
+        if user_data.get("claude_personality_bio_hash") != content_hash:
+            await run_db(store_bio, user_id, content_hash, bio)
+        yield _sse("token", {"text": bio})
+        yield _sse("done", {"personality_bio": bio})
+
+    async def events():
+        if cached is not None:
+            async for event in whole_bio(cached):
+                yield event
+            return
+
+        # Share the generation with any request already paying for these inputs
+        call, leader = _bio_generations.claim(content_hash)
+        if not leader:
+            try:
+                bio = await asyncio.wrap_future(call)
+            except HTTPException as e:
+                yield _sse("error", {"detail": e.detail})
+                return
+            async for event in whole_bio(bio):
+                yield event
+            return
+
+        try:
+            # It may have been generated and saved since the first lookup
+            bio = await run_db(cached_bio, user_data, content_hash)
+        except BaseException as e:
+            _bio_generations.resolve(content_hash, error=e)
+            raise
+        if bio is not None:
+            _bio_generations.resolve(content_hash, bio)
+            async for event in whole_bio(bio):
+                yield event
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(_stream_bio(client, user_id, user_data, content_hash, queue))
+        _bio_streams.add(task)
+        task.add_done_callback(_bio_streams.discard)
+
+        parts = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, HTTPException):
+                yield _sse("error", {"detail": item.detail})
+                return
+            parts.append(item)
+            yield _sse("token", {"text": item})
+        yield _sse("done", {"personality_bio": "".join(parts)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/add-test-user")
 def add_test_user(user_id: str):
     """
@@ -99,5 +304,5 @@ def add_test_user(user_id: str):
         }
     }
     
-    db.collection("users").document(user_id).set(test_user_data)
+    save_user_profile(user_id, test_user_data)
     return {"message": f"Test user {user_id} created successfully", "data": test_user_data}
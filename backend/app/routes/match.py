@@ -1,19 +1,35 @@
-from typing import Dict, List, Tuple
+import asyncio
+from typing import Dict, List, Optional, Tuple
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from dataclasses import dataclass
 from enum import Enum
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from ..database import db
+from ..database import add_profile_listener, aget_user_profile, aget_user_profiles, get_user_profile, run_db
+from ..matching import (
+    CompactProfile,
+    IdfTable,
+    Interner,
+    Population,
+    get_audio_index,
+    get_cluster_index,
+    get_idf,
+    get_item_index,
+    get_population,
+)
+from ..matching.clusters import CLUSTER_PROBES
+from ..matching.profile import overlap, overlap_count, profile_audio, profile_items
+from ..metrics import timed_stage
+from ..services.conditional import (
+    cache_response,
+    cached_response,
+    etag_matches,
+    match_etag,
+    not_modified,
+    set_etag,
+)
+from ..services.match_store import MatchStore
+from ..services.track_features import track_features
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from dotenv import load_dotenv
-import os
-from firebase_admin import firestore
-
-# Load environment variables
-load_dotenv()
 
 router = APIRouter()
 
@@ -28,6 +44,10 @@ class MatchStrength(str, Enum):
     WEAK = "WEAK"         # 30-49%
     NO_MATCH = "NO_MATCH" # 0-29%
 
+class Similarity(str, Enum):
+    OVERLAP = "overlap"  # Weighted counts of shared items
+    TFIDF = "tfidf"      # Cosine of idf-weighted items, rare shared items count most
+
 class MatchRequest(BaseModel):
     user1_spotify_id: str
     user2_spotify_id: str
@@ -40,19 +60,24 @@ class MatchResponse(BaseModel):
     shared_genres: List[str]
     shared_tracks: List[str]
 
+class CandidateMatch(MatchResponse):
+    user_id: str
+
+class AudioNeighbor(BaseModel):
+    user_id: str
+    audio_similarity: float
+
+class BatchMatchItem(BaseModel):
+    result: Optional[MatchResponse] = None
+    error: Optional[str] = None
+
+class BatchMatchResponse(BaseModel):
+    results: List[BatchMatchItem]
+
 # ============================
 # 🎵 SPOTIFY DATA FETCHING 🎵
 # ============================
 
-def get_spotify_client(user_id: str) -> spotipy.Spotify:
-    """Get authenticated Spotify client for user"""
-    user_doc = db.collection('users').document(user_id).get()
-    if not user_doc.exists:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user_data = user_doc.to_dict()
-    return spotipy.Spotify(auth=user_data.get('access_token'))
-
 def get_user_top_artists(sp: spotipy.Spotify, limit=5) -> Tuple[List[str], List[str]]:
     """Fetch user's top artists and their genres"""
     results = sp.current_user_top_artists(limit=limit)
@@ -68,8 +93,7 @@ def get_user_top_tracks(sp: spotipy.Spotify, limit=5) -> List[str]:
 def get_audio_features(sp: spotipy.Spotify, track_ids: List[str]) -> np.ndarray:
     """Get audio features for tracks"""
     features = []
-    for track_id in track_ids:
-        audio_features = sp.audio_features([track_id])[0]
+    for audio_features in track_features.get_features(sp, track_ids).values():
         if audio_features:
             features.append([
                 audio_features['danceability'],
@@ -82,6 +106,19 @@ def get_audio_features(sp: spotipy.Spotify, track_ids: List[str]) -> np.ndarray:
 # 🎵 MATCHING LOGIC 🎵
 # ============================
 
+def cosine_similarity(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Pairwise cosine similarity between the rows of x and y. Same result as
+    sklearn's for these few 3-feature rows, without importing scikit-learn;
+    all-zero rows have similarity 0.
+    """
+    x, y = np.atleast_2d(x).astype(np.float64), np.atleast_2d(y).astype(np.float64)
+    x_norms = np.linalg.norm(x, axis=1, keepdims=True)
+    y_norms = np.linalg.norm(y, axis=1, keepdims=True)
+    x_norms[x_norms == 0] = 1
+    y_norms[y_norms == 0] = 1
+    return (x / x_norms) @ (y / y_norms).T
+
 class FlirtifyMatcher:
     def __init__(self):
         self.weights = {
@@ -98,11 +135,16 @@ class FlirtifyMatcher:
             'weak': 30
         }
 
+    @timed_stage("scoring")
     def calculate_match(self, user1_data: Dict, user2_data: Dict) -> Dict:
+        shared_artists = set(user1_data['artists']) & set(user2_data['artists'])
+        shared_tracks = set(user1_data['tracks']) & set(user2_data['tracks'])
+        shared_genres = set(user1_data['genres']) & set(user2_data['genres'])
+
         # Calculate individual scores
-        artist_score = len(set(user1_data['artists']) & set(user2_data['artists'])) * self.weights['artist_match']
-        track_score = len(set(user1_data['tracks']) & set(user2_data['tracks'])) * self.weights['track_match']
-        genre_score = len(set(user1_data['genres']) & set(user2_data['genres'])) * self.weights['genre_match']
+        artist_score = len(shared_artists) * self.weights['artist_match']
+        track_score = len(shared_tracks) * self.weights['track_match']
+        genre_score = len(shared_genres) * self.weights['genre_match']
         
         # Audio features similarity
         if user1_data['audio_features'].size and user2_data['audio_features'].size:
@@ -113,86 +155,420 @@ class FlirtifyMatcher:
             
         total_score = artist_score + track_score + genre_score + audio_score
         
-        # Determine match strength
-        if total_score >= self.thresholds['perfect']:
-            strength = MatchStrength.PERFECT
-        elif total_score >= self.thresholds['strong']:
-            strength = MatchStrength.STRONG
-        elif total_score >= self.thresholds['moderate']:
-            strength = MatchStrength.MODERATE
-        elif total_score >= self.thresholds['weak']:
-            strength = MatchStrength.WEAK
-        else:
-            strength = MatchStrength.NO_MATCH
+        strength = self.strength_for(total_score)
             
         return {
             'score': total_score,
             'strength': strength,
-            'shared_artists': list(set(user1_data['artists']) & set(user2_data['artists'])),
-            'shared_tracks': list(set(user1_data['tracks']) & set(user2_data['tracks'])),
-            'shared_genres': list(set(user1_data['genres']) & set(user2_data['genres']))
+            'shared_artists': list(shared_artists),
+            'shared_tracks': list(shared_tracks),
+            'shared_genres': list(shared_genres)
         }
 
+    def score_compact(self, profile1: CompactProfile, profile2: CompactProfile) -> float:
+        """calculate_match's score for two interned profiles, without allocating"""
+        return (
+            overlap_count(profile1.artists, profile2.artists) * self.weights['artist_match']
+            + overlap_count(profile1.tracks, profile2.tracks) * self.weights['track_match']
+            + overlap_count(profile1.genres, profile2.genres) * self.weights['genre_match']
+            + float(np.dot(profile1.audio, profile2.audio)) * self.weights['audio_match']
+        )
+
+    @timed_stage("scoring")
+    def calculate_compact(self, profile1: CompactProfile, profile2: CompactProfile, interner: Interner) -> Dict:
+        """calculate_match for two profiles interned by the same Interner"""
+        shared = {
+            kind: overlap(getattr(profile1, kind), getattr(profile2, kind))
+            for kind in ('artists', 'tracks', 'genres')
+        }
+        total_score = (
+            len(shared['artists']) * self.weights['artist_match']
+            + len(shared['tracks']) * self.weights['track_match']
+            + len(shared['genres']) * self.weights['genre_match']
+            + float(np.dot(profile1.audio, profile2.audio)) * self.weights['audio_match']
+        )
+        return {
+            'score': total_score,
+            'strength': self.strength_for(total_score),
+            'shared_artists': interner.names('artists', shared['artists']),
+            'shared_tracks': interner.names('tracks', shared['tracks']),
+            'shared_genres': interner.names('genres', shared['genres'])
+        }
+
+    # Matcher weight of each item kind, for the per-kind similarities of the tfidf mode
+    ITEM_WEIGHTS = {'artists': 'artist_match', 'tracks': 'track_match', 'genres': 'genre_match'}
+
+    @timed_stage("scoring")
+    def calculate_tfidf(self, user1_data: Dict, user2_data: Dict, idf: IdfTable) -> Dict:
+        """
+        Similarity mode weighting items by inverse popularity. Each kind
+        scores the cosine of the two users' idf-weighted item vectors, so a
+        shared niche artist counts far more than a shared chart-topper, and
+        the weights summing to 100 bound the score to [0, 100].
+        Takes Firestore user documents.
+        """
+        total_score = 0.0
+        shared = {}
+        for kind, weight in self.ITEM_WEIGHTS.items():
+            items1, items2 = profile_items(user1_data, kind), profile_items(user2_data, kind)
+            items2_set = set(items2)
+            shared[kind] = [item for item in items1 if item in items2_set]
+            if shared[kind]:
+                norm1 = np.linalg.norm(idf.weights(kind, items1))
+                norm2 = np.linalg.norm(idf.weights(kind, items2))
+                shared_weights = idf.weights(kind, shared[kind])
+                total_score += float(shared_weights @ shared_weights / (norm1 * norm2)) * self.weights[weight]
+
+        audio1, audio2 = profile_audio(user1_data), profile_audio(user2_data)
+        if audio1.any() and audio2.any():
+            total_score += float(cosine_similarity(audio1[np.newaxis], audio2[np.newaxis])[0, 0]) \
+                * self.weights['audio_match']
+        total_score = min(total_score, 100.0)  # float32 idf rounding on identical profiles
+
+        return {
+            'score': total_score,
+            'strength': self.strength_for(total_score),
+            'shared_artists': shared['artists'],
+            'shared_tracks': shared['tracks'],
+            'shared_genres': shared['genres']
+        }
+
+    def strength_for(self, score: float) -> MatchStrength:
+        """Map a match score to its MatchStrength bucket"""
+        if score >= self.thresholds['perfect']:
+            return MatchStrength.PERFECT
+        elif score >= self.thresholds['strong']:
+            return MatchStrength.STRONG
+        elif score >= self.thresholds['moderate']:
+            return MatchStrength.MODERATE
+        elif score >= self.thresholds['weak']:
+            return MatchStrength.WEAK
+        return MatchStrength.NO_MATCH
+
+    @timed_stage("scoring")
+    def score_population(self, query: Dict[str, np.ndarray], population: Population,
+                         rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score a query profile against every user in the population (or just `rows`) at once"""
+        counts = population.overlap_counts(query, rows)
+        return (
+            counts['artists'] * self.weights['artist_match']
+            + counts['tracks'] * self.weights['track_match']
+            + counts['genres'] * self.weights['genre_match']
+            + population.audio_similarity(query, rows) * self.weights['audio_match']
+        )
+
+    @timed_stage("scoring")
+    def score_population_tfidf(self, query: Dict[str, np.ndarray], user_data: Dict,
+                               population: Population, idf: IdfTable,
+                               rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        calculate_tfidf of a query profile against every user (or just
+        `rows`) at once: per kind, one sparse mat-vec with the query's
+        idf^2-weighted indicators over precomputed weighted row norms.
+        """
+        scores = population.audio_similarity(query, rows) * self.weights['audio_match']
+        for kind, weight in self.ITEM_WEIGHTS.items():
+            # The query's norm includes items nobody else has: they dilute, not match
+            query_norm = np.linalg.norm(idf.weights(kind, profile_items(user_data, kind)))
+            if query_norm == 0:
+                continue
+            weights = idf.idf(kind)
+            matrix, norms = population.matrices[kind], idf.row_norms(kind)
+            if rows is not None:
+                matrix, norms = matrix[rows], norms[rows]
+            dots = matrix @ (query[kind] * weights * weights)
+            norms = norms * query_norm
+            norms[norms == 0] = 1
+            scores += dots / norms * self.weights[weight]
+        return np.minimum(scores, 100.0)
+
+    @timed_stage("scoring")
+    def score_pairs(self, population: Population, rows1: np.ndarray, rows2: np.ndarray) -> np.ndarray:
+        """Score many (rows1[i], rows2[i]) pairs of a population in one vectorized pass"""
+        counts = population.pair_overlaps(rows1, rows2)
+        return (
+            counts['artists'] * self.weights['artist_match']
+            + counts['tracks'] * self.weights['track_match']
+            + counts['genres'] * self.weights['genre_match']
+            + population.pair_audio_similarity(rows1, rows2) * self.weights['audio_match']
+        )
+
+    @timed_stage("scoring")
+    def rank_candidates(self, user_id: str, user_data: Dict, population: Population, k: int,
+                        idf: Optional[IdfTable] = None, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Return the top k matches for a user across the population, best first,
+        in the same shape as calculate_match plus the candidate's user_id.
+        Scores with the tfidf similarity when given the population's idf table,
+        and only the given candidate rows when given `rows`.
+        """
+        query = population.query_vectors(user_data)
+        if idf is None:
+            scores = self.score_population(query, population, rows)
+        else:
+            scores = self.score_population_tfidf(query, user_data, population, idf, rows)
+        own_row = population.row_of.get(user_id)
+        if own_row is not None:
+            if rows is None:
+                scores[own_row] = -np.inf
+            else:
+                scores[rows == own_row] = -np.inf
+
+        k = min(k, int(np.count_nonzero(scores > -np.inf)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top_rows = top if rows is None else rows[top]
+
+        return [{
+            'user_id': population.user_ids[row],
+            'score': float(score),
+            'strength': self.strength_for(score),
+            'shared_artists': population.shared_items(row, query, 'artists'),
+            'shared_tracks': population.shared_items(row, query, 'tracks'),
+            'shared_genres': population.shared_items(row, query, 'genres'),
+        } for row, score in zip(top_rows, scores[top])]
+
+def matcher_data(user_data: Dict) -> Dict:
+    """Prepare a Firestore user document for FlirtifyMatcher"""
+    return {
+        'artists': user_data['top_artists'],
+        'tracks': user_data['top_tracks'],
+        'genres': user_data['top_genres'],
+        'audio_features': np.array([[
+            user_data['audio_features']['danceability'],
+            user_data['audio_features']['energy'],
+            user_data['audio_features']['valence']
+        ]])
+    }
+
+def score_pair(user1_data: Dict, user2_data: Dict) -> Dict:
+    """Score two Firestore user documents into a storable match result"""
+    # A throwaway interner: request-supplied strings must not pile up in a shared one
+    interner = Interner()
+    match_result = FlirtifyMatcher().calculate_compact(
+        interner.compact(user1_data), interner.compact(user2_data), interner
+    )
+    return dict(match_result, strength=match_result['strength'].value)
+
+match_store = MatchStore(score_pair)
+add_profile_listener(match_store.schedule_recompute)
+
+def prefilter_rows(matcher: "FlirtifyMatcher", user_id: str, user_data: Dict,
+                   population: Population, k: int) -> Optional[np.ndarray]:
+    """
+    Population rows of the users sharing an artist, track or genre with
+    this one, from the inverted item index. None, meaning score everyone,
+    when too few users share anything to fill the top k.
+    """
+    index = get_item_index()
+    if index.population is not population:
+        return None
+    weights = {kind: matcher.weights[weight] for kind, weight in matcher.ITEM_WEIGHTS.items()}
+    rows = index.candidate_rows(user_data, weights)
+    # Usually includes the user's own row, which is never returned
+    return rows if len(rows) > k else None
+
+def cluster_rows(user_data: Dict, population: Population, k: int, probes: int) -> Optional[np.ndarray]:
+    """
+    Population rows in the `probes` clusters nearest this user, from the
+    offline k-means table. None, meaning score everyone, when they hold too
+    few users to fill the top k.
+    """
+    index = get_cluster_index()
+    if index.population is not population:
+        return None
+    rows = index.candidate_rows(user_data, probes)
+    return rows if len(rows) > k else None
+
+def score_pair_tfidf(user1_data: Dict, user2_data: Dict) -> Dict:
+    """Score two Firestore user documents with the tfidf similarity"""
+    return FlirtifyMatcher().calculate_tfidf(user1_data, user2_data, get_idf())
+
+def compatibility_reasons(match_result: Dict) -> List[str]:
+    """Human-readable summary of what two users have in common"""
+    return [
+        f"You share {len(match_result['shared_artists'])} favorite artists",
+        f"You share {len(match_result['shared_tracks'])} favorite tracks",
+        f"You have {len(match_result['shared_genres'])} music genres in common"
+    ]
+
 # ============================
 # 🎵 API ENDPOINTS 🎵
 # ============================
 
 @router.post("/match")
-async def match_users(request: MatchRequest):
-    """Match two users based on their music preferences"""
+async def match_users(request: MatchRequest, http_request: Request, response: Response,
+                      similarity: Similarity = Similarity.OVERLAP):
+    """
+    Match two users based on their music preferences.
+
+    The ETag combines both users' profile versions: a client sending it back
+    as If-None-Match gets a 304 without the pair being scored or looked up.
+    tfidf scores depend on every profile's items, so they are computed
+    fresh and sent without an ETag.
+    """
     try:
-        # Get user data from Firestore
-        user1_doc = db.collection('users').document(request.user1_spotify_id).get()
-        user2_doc = db.collection('users').document(request.user2_spotify_id).get()
+        # Get both users from Firestore concurrently
+        user1_data, user2_data = await asyncio.gather(
+            aget_user_profile(request.user1_spotify_id),
+            aget_user_profile(request.user2_spotify_id),
+        )
         
-        if not user1_doc.exists or not user2_doc.exists:
+        if user1_data is None or user2_data is None:
             raise HTTPException(status_code=404, detail="One or both users not found")
-            
-        user1_data = user1_doc.to_dict()
-        user2_data = user2_doc.to_dict()
-        
-        # Prepare data for matcher
-        matcher_data1 = {
-            'artists': user1_data['top_artists'],
-            'tracks': user1_data['top_tracks'],
-            'genres': user1_data['top_genres'],
-            'audio_features': np.array([[
-                user1_data['audio_features']['danceability'],
-                user1_data['audio_features']['energy'],
-                user1_data['audio_features']['valence']
-            ]])
-        }
-        
-        matcher_data2 = {
-            'artists': user2_data['top_artists'],
-            'tracks': user2_data['top_tracks'],
-            'genres': user2_data['top_genres'],
-            'audio_features': np.array([[
-                user2_data['audio_features']['danceability'],
-                user2_data['audio_features']['energy'],
-                user2_data['audio_features']['valence']
-            ]])
-        }
+
+        if similarity is Similarity.TFIDF:
+            match_result = await run_db(score_pair_tfidf, user1_data, user2_data)
+            return MatchResponse(
+                match_score=match_result['score'],
+                match_strength=match_result['strength'],
+                compatibility_reasons=compatibility_reasons(match_result),
+                shared_artists=match_result['shared_artists'],
+                shared_genres=match_result['shared_genres'],
+                shared_tracks=match_result['shared_tracks']
+            )
+
+        etag = match_etag(request.user1_spotify_id, user1_data, request.user2_spotify_id, user2_data)
+        if etag_matches(http_request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+
+        cached = cached_response(etag)
+        if cached is not None:
+            return cached
         
-        # Calculate match using FlirtifyMatcher
-        matcher = FlirtifyMatcher()
-        match_result = matcher.calculate_match(matcher_data1, matcher_data2)
+        # Look up the materialized match, scoring it only if either profile changed
+        match_result = await run_db(
+            match_store.get,
+            request.user1_spotify_id, user1_data,
+            request.user2_spotify_id, user2_data,
+        )
         
-        # Generate compatibility reasons
-        compatibility_reasons = [
-            f"You share {len(match_result['shared_artists'])} favorite artists",
-            f"You share {len(match_result['shared_tracks'])} favorite tracks",
-            f"You have {len(match_result['shared_genres'])} music genres in common"
-        ]
-            
-        return MatchResponse(
+        match_response = MatchResponse(
             match_score=match_result['score'],
             match_strength=match_result['strength'],
-            compatibility_reasons=compatibility_reasons,
+            compatibility_reasons=compatibility_reasons(match_result),
             shared_artists=match_result['shared_artists'],
             shared_genres=match_result['shared_genres'],
             shared_tracks=match_result['shared_tracks']
         )
+        cache_response(etag, match_response)
+        return match_response
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/candidates", response_model=List[CandidateMatch])
+def match_candidates(user_id: str, k: int = Query(10, ge=1, le=100),
+                     similarity: Similarity = Similarity.OVERLAP, prefilter: bool = True,
+                     probes: int = Query(CLUSTER_PROBES, ge=0, le=1024)):
+    """
+    Rank the population against one user and return the top k matches.
+    With probes, only users in that many of the user's nearest clusters
+    are scored: more probes, better recall, slower requests. Otherwise,
+    with prefilter, only users sharing at least one not-too-popular item
+    are; probes=0&prefilter=false scores everyone.
+    """
+    user_data = get_user_profile(user_id)
+    if user_data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    matcher = FlirtifyMatcher()
+    idf = get_idf() if similarity is Similarity.TFIDF else None
+    population = idf.population if idf is not None else get_population()
+    if probes:
+        rows = cluster_rows(user_data, population, k, probes)
+    else:
+        rows = prefilter_rows(matcher, user_id, user_data, population, k) if prefilter else None
+    ranked = matcher.rank_candidates(user_id, user_data, population, k, idf, rows)
+
+    return [
+        CandidateMatch(
+            user_id=match_result['user_id'],
+            match_score=match_result['score'],
+            match_strength=match_result['strength'],
+            compatibility_reasons=compatibility_reasons(match_result),
+            shared_artists=match_result['shared_artists'],
+            shared_genres=match_result['shared_genres'],
+            shared_tracks=match_result['shared_tracks']
+        )
+        for match_result in ranked
+    ]
+
+@router.get("/audio-neighbors", response_model=List[AudioNeighbor])
+def match_audio_neighbors(user_id: str, k: int = Query(10, ge=1, le=100),
+                          probes: Optional[int] = Query(None, ge=1, le=1024)):
+    """
+    Users whose music sounds most like this user's (danceability, energy,
+    valence), from the approximate audio index rather than a full scan.
+    More probes trade speed for recall.
+    """
+    user_data = get_user_profile(user_id)
+    if user_data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    neighbors = get_audio_index().search(profile_audio(user_data), k, exclude=user_id, probes=probes)
+    return [AudioNeighbor(user_id=other_id, audio_similarity=similarity) for other_id, similarity in neighbors]
+
+# Largest number of pairs accepted by /match/batch
+MAX_BATCH_PAIRS = 1000
+
+def score_batch(requests: List[MatchRequest], profiles: Dict[str, Optional[Dict]]) -> List[BatchMatchItem]:
+    """Score every requested pair whose users exist, in one vectorized pass"""
+    found = [user_id for user_id, profile in profiles.items() if profile is not None]
+    # Interned per batch and dropped with it, so request input can't grow process memory
+    interner = Interner()
+    compact = {user_id: interner.compact(profiles[user_id]) for user_id in found}
+    population = Population.from_compact(((user_id, compact[user_id]) for user_id in found), interner)
+
+    valid = [
+        i for i, request in enumerate(requests)
+        if profiles.get(request.user1_spotify_id) is not None and profiles.get(request.user2_spotify_id) is not None
+    ]
+    matcher = FlirtifyMatcher()
+    scores = matcher.score_pairs(
+        population,
+        np.array([population.row_of[requests[i].user1_spotify_id] for i in valid], dtype=np.int64),
+        np.array([population.row_of[requests[i].user2_spotify_id] for i in valid], dtype=np.int64),
+    ) if valid else []
+
+    items = [BatchMatchItem(error="One or both users not found") for _ in requests]
+    for i, score in zip(valid, scores):
+        profile1 = compact[requests[i].user1_spotify_id]
+        profile2 = compact[requests[i].user2_spotify_id]
+        match_result = {
+            'score': float(score),
+            'strength': matcher.strength_for(score),
+        }
+        for kind in ('artists', 'tracks', 'genres'):
+            shared = overlap(getattr(profile1, kind), getattr(profile2, kind))
+            match_result[f'shared_{kind}'] = interner.names(kind, shared)
+        items[i] = BatchMatchItem(result=MatchResponse(
+            match_score=match_result['score'],
+            match_strength=match_result['strength'],
+            compatibility_reasons=compatibility_reasons(match_result),
+            shared_artists=match_result['shared_artists'],
+            shared_genres=match_result['shared_genres'],
+            shared_tracks=match_result['shared_tracks']
+        ))
+    return items
+
+@router.post("/batch", response_model=BatchMatchResponse)
+async def match_batch(requests: List[MatchRequest]):
+    """
+    Match many pairs of users at once. Every distinct user is read in a
+    single Firestore round trip; results come back in request order, with a
+    per-item error for pairs that can't be scored.
+    """
+    if len(requests) > MAX_BATCH_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_PAIRS} pairs per batch")
+    try:
+        user_ids = [u for request in requests for u in (request.user1_spotify_id, request.user2_spotify_id)]
+        profiles = await aget_user_profiles(user_ids)
+        return BatchMatchResponse(results=score_batch(requests, profiles))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,20 +1,50 @@
-from fastapi import APIRouter, HTTPException
-from firebase_admin import firestore
-from ..database import db
+import json
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from ..database import (
+    aget_user_profile,
+    asave_user_profile,
+    db,
+    get_user_profile,
+    profile_cache,
+    run_db,
+    save_user_profile,
+)
+from ..metrics import timed, timed_iter
+from ..services.conditional import etag_matches, not_modified, profile_etag, set_etag
+from ..services.ingest import aingest_ndjson, ingest_profiles
+from ..services.profile_sync import sync_profile
+from ..services.spotify_clients import TOKEN_FIELDS, SpotifyAuthError, get_spotify_client
+from ..services.track_features import track_features
 
 router = APIRouter()
 
+# Credentials never leave the server, including those older profiles still carry
+PRIVATE_FIELDS = set(TOKEN_FIELDS)
+
+def _without_private(user_data: dict) -> dict:
+    return {key: value for key, value in user_data.items() if key not in PRIVATE_FIELDS}
+
 @router.get("/users/{user_id}")
-async def get_user(user_id: str):
-    """Get a user's profile by their ID"""
+async def get_user(user_id: str, request: Request, response: Response):
+    """
+    Get a user's profile by their ID. Responses carry an ETag from the
+    profile version; send it back as If-None-Match to get a 304 when the
+    profile hasn't changed.
+    """
     try:
-        doc_ref = db.collection('users').document(user_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()
-        raise HTTPException(status_code=404, detail="User not found")
+        user_data = await aget_user_profile(user_id)
+        if user_data is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        etag = profile_etag(user_data)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return _without_private(user_data)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -22,22 +52,113 @@ async def get_user(user_id: str):
 async def create_user(user_id: str, user_data: dict):
     """Create or update a user's profile"""
     try:
-        doc_ref = db.collection('users').document(user_id)
-        doc_ref.set(user_data)
+        await asave_user_profile(user_id, user_data)
         return {"message": "User profile updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/bulk")
+async def bulk_create_users(request: Request):
+    """
+    Create or replace many user profiles at once.
+
+    Send NDJSON (one profile object with an "id" per line) or a JSON array of
+    such objects. Profiles are written in batches of 500 with bounded
+    parallelism; invalid lines are reported individually and skipped.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        records = await request.json()
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of profiles")
+        return await run_db(ingest_profiles, enumerate(records, start=1))
+    return await aingest_ndjson(request.stream())
+
+@router.get("/cache-stats")
+def get_profile_cache_stats():
+    """Hit/miss counters for the in-process profile cache"""
+    return profile_cache.stats()
+
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 1000
+
+def _users_query(limit: Optional[int], start_after: Optional[str], fields: Optional[List[str]]):
+    """Firestore query over users ordered by document id, for cursor pagination"""
+    query = db.collection('users').order_by('__name__')
+    if fields:
+        query = query.select(fields)
+    if start_after:
+        query = query.start_after({'__name__': start_after})
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def _public_user(doc) -> dict:
+    user_data = _without_private(doc.to_dict())
+    user_data["id"] = doc.id
+    return user_data
+
+def _read_users(query) -> List[dict]:
+    with timed("firestore"):
+        docs = list(query.stream())
+    return [_public_user(doc) for doc in docs]
+
+def _ndjson_lines(query):
+    """Serialize users one line at a time as the Firestore stream yields them"""
+    for doc in timed_iter("firestore", query.stream()):
+        yield json.dumps(_public_user(doc), default=str) + "\n"
+
 @router.get("/users")
-async def get_all_users():
-    """Get all users (you might want to add pagination)"""
+async def get_all_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=USERS_MAX_PAGE_SIZE),
+    start_after: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    List users ordered by user id: all of them, or a page at a time once a
+    `limit` or `start_after` is given (USERS_PAGE_SIZE when only the cursor
+    is). Pass the X-Next-Cursor response header back as `start_after` to get
+    the next page, and `fields=a,b` to fetch only those fields.
+    `format=ndjson` streams one user per line straight from the Firestore
+    stream; it reads the whole collection unless a `limit` is given.
+    """
     try:
-        users_ref = db.collection('users')
-        docs = users_ref.stream()
-        return [doc.to_dict() for doc in docs]
+        selected = [f for f in (fields or "").split(",") if f and f not in PRIVATE_FIELDS] or None
+        if fields and not selected:
+            raise HTTPException(status_code=400, detail="No readable fields requested")
+
+        if format == "ndjson":
+            query = _users_query(limit, start_after, selected)
+            return StreamingResponse(_ndjson_lines(query), media_type="application/x-ndjson")
+
+        # Without paging parameters every user is returned, as before pagination existed
+        page_size = limit or (USERS_PAGE_SIZE if start_after else None)
+        query = _users_query(page_size, start_after, selected)
+        users = await run_db(_read_users, query)
+        if page_size and len(users) == page_size:
+            response.headers["X-Next-Cursor"] = users[-1]["id"]
+        return users
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@router.post("/{user_id}/sync")
+def sync_user_profile(user_id: str):
+    """
+    Refresh the user's top artists, genres, top and recent tracks and audio
+    features from Spotify concurrently, and save them in one write.
+    """
+    try:
+        profile = sync_profile(user_id)
+    except SpotifyAuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except spotipy.SpotifyException as e:
+        raise HTTPException(status_code=502, detail=f"Spotify error: {e.msg}")
+    return {key: value for key, value in profile.items() if key != "last_synced_at"}
+
 @router.get("/user/top-artists")
 def get_user_top_artists(user_id: str):
     """Gets user's top 10 artists and their genres"""
@@ -49,7 +170,7 @@ def get_user_top_artists(user_id: str):
     genres = list(set(genre for artist in top_artists for genre in artist["genres"]))
     
     # Store in Firebase
-    db.collection("users").document(user_id).set({
+    save_user_profile(user_id, {
         "top_artists": artist_names, 
         "genres": genres
     }, merge=True)
@@ -65,7 +186,7 @@ def get_user_top_tracks(user_id: str):
     track_names = [track["name"] for track in top_tracks]
     track_ids = [track["id"] for track in top_tracks]  # Used for audio features
 
-    db.collection("users").document(user_id).set({"top_tracks": track_names}, merge=True)
+    save_user_profile(user_id, {"top_tracks": track_names, "track_ids": track_ids}, merge=True)
 
     return {"top_tracks": track_names, "track_ids": track_ids}
 
@@ -78,7 +199,7 @@ def get_user_recent_tracks(user_id: str):
     track_names = [track["track"]["name"] for track in recent_tracks]
     track_ids = [track["track"]["id"] for track in recent_tracks]
 
-    db.collection("users").document(user_id).set({"recent_tracks": track_names}, merge=True)
+    save_user_profile(user_id, {"recent_tracks": track_names}, merge=True)
 
     return {"recent_tracks": track_names, "track_ids": track_ids}
 
@@ -87,41 +208,23 @@ def get_user_audio_features(user_id: str):
     """Fetch user's top tracks' audio features from Spotify and store in Firestore."""
     try:
         sp = get_spotify_client(user_id)
-        user_doc = db.collection("users").document(user_id).get()
-        if not user_doc.exists:
+        user_data = get_user_profile(user_id)
+        if user_data is None:
             return {"error": "User not found"}
 
-        track_ids = user_doc.to_dict().get("track_ids", [])
+        track_ids = user_data.get("track_ids", [])
         if not track_ids:
             return {"error": "No top tracks found"}
 
-        audio_features = sp.audio_features(track_ids)
-        features_dict = {track["id"]: {
+        audio_features = track_features.get_features(sp, track_ids)
+        features_dict = {track_id: {
             "danceability": track["danceability"],
             "energy": track["energy"],
             "tempo": track["tempo"]
-        } for track in audio_features if track}
+        } for track_id, track in audio_features.items() if track}
 
-        db.collection("users").document(user_id).set({"audio_features": features_dict}, merge=True)
+        save_user_profile(user_id, {"audio_features": features_dict}, merge=True)
 
         return {"audio_features": features_dict}
     except Exception as e:
         return {"error": str(e)}
-
-def get_spotify_client(user_id: str):
-    """Create a Spotify client for a specific user using their stored token"""
-    try:
-        # Get user's token from database
-        user_doc = db.collection("users").document(user_id).get()
-        if not user_doc.exists:
-            raise Exception("User not found")
-        
-        token = user_doc.to_dict().get("access_token")
-        if not token:
-            raise Exception("No access token found")
-            
-        # Create Spotify client with user's token
-        return spotipy.Spotify(auth=token)
-    except Exception as e:
-        raise Exception(f"Failed to create Spotify client: {str(e)}")
-
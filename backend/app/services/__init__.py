@@ -0,0 +1 @@
+# Shared services used across routes (Spotify, Firestore-backed caches)
@@ -0,0 +1,73 @@
+import hashlib
+import os
+from typing import Dict, Optional
+
+from fastapi import Response
+
+from ..database import ProfileCache, annotations_version, profile_version
+
+# Responses cached by ETag; 0 disables the cache. Keys embed profile
+# versions, so entries never go stale and the TTL only bounds memory.
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "0"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+# Clients may keep responses but must revalidate them with If-None-Match
+REVALIDATE = "private, no-cache"
+
+
+def profile_etag(user_data: Dict) -> Optional[str]:
+    """
+    ETag of a profile document, from the versions stamped by its last write
+    and its last annotation write, e.g. a generated bio
+    """
+    version = profile_version(user_data)
+    if version is None:
+        return None
+    annotated = annotations_version(user_data)
+    return f'"p{version}"' if annotated is None else f'"p{version}.{annotated}"'
+
+
+def match_etag(user1_id: str, user1_data: Dict, user2_id: str, user2_data: Dict) -> Optional[str]:
+    """
+    ETag of a match result: both users' ids and profile versions, in pair
+    order, since stored matches are shared by (a, b) and (b, a).
+    """
+    version1, version2 = profile_version(user1_data), profile_version(user2_data)
+    if version1 is None or version2 is None:
+        return None
+    pair = sorted(((user1_id, version1), (user2_id, version2)))
+    key = "|".join(f"{user_id}:{version}" for user_id, version in pair)
+    return f'"m{hashlib.sha1(key.encode()).hexdigest()[:24]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Whether an If-None-Match header matches the current ETag (weak comparison)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE})
+
+
+def set_etag(response: Response, etag: Optional[str]):
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = REVALIDATE
+
+
+response_cache = ProfileCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS) if RESPONSE_CACHE_SIZE > 0 else None
+
+
+def cached_response(etag: Optional[str]):
+    """The response cached under an ETag, or None"""
+    if response_cache is None or etag is None:
+        return None
+    return response_cache.get(etag, None)
+
+
+def cache_response(etag: Optional[str], value):
+    if response_cache is not None and etag is not None:
+        response_cache.put(etag, value)
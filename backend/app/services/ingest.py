@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import AsyncIterable, Dict, Iterable, Iterator, List, Tuple
+
+from ..database import db, profile_cache, run_db, server_timestamp
+from ..metrics import timed
+
+# Firestore caps a write batch at 500 operations
+FIRESTORE_BATCH_SIZE = 500
+INGEST_PARALLELISM = int(os.getenv("INGEST_PARALLELISM", "8"))
+# Errors beyond this many are counted but not reported individually
+MAX_REPORTED_ERRORS = 100
+
+
+def parse_ndjson(lines: Iterable) -> Iterator[Tuple[int, str]]:
+    """Yield (line_number, line) for every non-blank NDJSON line; parsing is left to split_profile"""
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if line.strip():
+            yield line_number, line
+
+
+def split_profile(record) -> Tuple[str, Dict]:
+    """Split an ingestion record (a dict or one NDJSON line) into its user id and profile fields"""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(record, dict):
+        raise ValueError("Profile must be a JSON object")
+    profile = dict(record)
+    user_id = profile.pop("id", None) or profile.get("spotify_id")
+    if not user_id or not isinstance(user_id, str):
+        raise ValueError("Profile has no 'id'")
+    return user_id, profile
+
+
+def write_profiles(profiles: List[Tuple[str, Dict]]) -> int:
+    """
+    Write up to 500 profiles in one Firestore batch. Profiles are stamped with
+    a version like save_user_profile, but profile listeners are not notified:
+    bulk loads are picked up by the next population rebuild instead.
+    """
+    users = db.collection("users")
+    batch = db.batch()
+    version, updated_at = time.time_ns(), server_timestamp()
+    for offset, (user_id, profile) in enumerate(profiles):
+        batch.set(users.document(user_id), dict(
+            profile, version=version + offset, updated_at=updated_at
+        ))
+    with timed("firestore"):
+        batch.commit()
+    for user_id, _ in profiles:
+        profile_cache.invalidate(user_id)
+    return len(profiles)
+
+
+class IngestReport:
+    """Running totals for one ingestion job"""
+
+    def __init__(self):
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def error(self, detail: str, line: int = None):
+        with self._lock:
+            self.failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({"line": line, "error": detail} if line else {"error": detail})
+
+    def committed(self, count: int):
+        with self._lock:
+            self.written += count
+            self.batches += 1
+
+    def to_dict(self) -> Dict:
+        return {"written": self.written, "failed": self.failed, "batches": self.batches, "errors": self.errors}
+
+
+def ingest_profiles(records: Iterable[Tuple[int, object]], batch_size: int = FIRESTORE_BATCH_SIZE,
+                    parallelism: int = INGEST_PARALLELISM) -> Dict:
+    """
+    Write (line_number, record) pairs to Firestore in batches of up to 500,
+    committing at most `parallelism` batches at a time. Input is consumed
+    lazily, so memory stays bounded however many profiles are streamed in.
+    """
+    report = IngestReport()
+    batch_size = min(batch_size, FIRESTORE_BATCH_SIZE)
+    in_flight: Dict[Future, int] = {}
+
+    def collect(done):
+        for future in done:
+            count = in_flight.pop(future)
+            try:
+                report.committed(future.result())
+            except Exception as e:
+                for _ in range(count):
+                    report.error(f"Batch write failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="ingest") as executor:
+        pending: List[Tuple[str, Dict]] = []
+        for line_number, record in records:
+            try:
+                pending.append(split_profile(record))
+            except ValueError as e:
+                report.error(str(e), line_number)
+                continue
+            if len(pending) == batch_size:
+                if len(in_flight) >= parallelism:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[executor.submit(write_profiles, pending)] = len(pending)
+                pending = []
+        if pending:
+            in_flight[executor.submit(write_profiles, pending)] = len(pending)
+        collect(wait(in_flight).done)
+
+    return report.to_dict()
+
+
+async def aingest_ndjson(chunks: AsyncIterable[bytes], batch_size: int = FIRESTORE_BATCH_SIZE,
+                         parallelism: int = INGEST_PARALLELISM) -> Dict:
+    """
+    Async ingest_profiles for an NDJSON request body: lines are parsed as the
+    body arrives and batches are committed on the Firestore executor, at most
+    `parallelism` at a time.
+    """
+    report = IngestReport()
+    batch_size = min(batch_size, FIRESTORE_BATCH_SIZE)
+    slots = asyncio.Semaphore(parallelism)
+    tasks = set()
+
+    async def commit(profiles: List[Tuple[str, Dict]]):
+        try:
+            report.committed(await run_db(write_profiles, profiles))
+        except Exception as e:
+            for _ in profiles:
+                report.error(f"Batch write failed: {e}")
+        finally:
+            slots.release()
+
+    async def submit(profiles: List[Tuple[str, Dict]]):
+        await slots.acquire()
+        task = asyncio.create_task(commit(profiles))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    pending: List[Tuple[str, Dict]] = []
+    buffer, line_number = b"", 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                pending.append(split_profile(line.decode("utf-8")))
+            except (ValueError, UnicodeDecodeError) as e:
+                report.error(str(e), line_number)
+                continue
+            if len(pending) == batch_size:
+                await submit(pending)
+                pending = []
+
+    if buffer.strip():
+        try:
+            pending.append(split_profile(buffer.decode("utf-8")))
+        except (ValueError, UnicodeDecodeError) as e:
+            report.error(str(e), line_number + 1)
+    if pending:
+        await submit(pending)
+    await asyncio.gather(*tasks)
+    return report.to_dict()
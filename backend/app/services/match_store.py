@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set
+
+from ..database import db, get_user_profiles, profile_version
+from ..metrics import timed, timed_iter
+
+MATCHES_COLLECTION = "matches"
+# Firestore caps a write batch at 500 operations
+FIRESTORE_BATCH_SIZE = 500
+
+
+def pair_id(user1_id: str, user2_id: str) -> str:
+    """Order-independent document id for a pair of users"""
+    return "__".join(sorted((user1_id, user2_id)))
+
+
+class MatchStore:
+    """
+    Materialized match results, one `matches` document per user pair.
+
+    Each row is stamped with the versions of both profiles it was scored
+    from, so a read is a single lookup while both profiles are unchanged.
+    When a profile is written, only the rows involving that user are
+    rescored, on a background thread.
+    """
+
+    def __init__(self, score: Callable[[Dict, Dict], Dict]):
+        self.score = score
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _row(self, user1_id: str, user1_data: Dict, user2_id: str, user2_data: Dict) -> Dict:
+        result = self.score(user1_data, user2_data)
+        return {
+            "users": sorted((user1_id, user2_id)),
+            "versions": {
+                user1_id: profile_version(user1_data),
+                user2_id: profile_version(user2_data),
+            },
+            "result": result,
+        }
+
+    @staticmethod
+    def _is_current(row: Dict, user1_id: str, user1_data: Dict, user2_id: str, user2_data: Dict) -> bool:
+        versions = row.get("versions", {})
+        version1, version2 = profile_version(user1_data), profile_version(user2_data)
+        # Profiles written before versioning can't be checked, so always rescore them
+        return (
+            version1 is not None and version2 is not None
+            and versions.get(user1_id) == version1
+            and versions.get(user2_id) == version2
+        )
+
+    def get(self, user1_id: str, user1_data: Dict, user2_id: str, user2_data: Dict) -> Dict:
+        """Return the match result for a pair, scoring and storing it if stale"""
+        doc_ref = db.collection(MATCHES_COLLECTION).document(pair_id(user1_id, user2_id))
+        with timed("firestore"):
+            doc = doc_ref.get()
+        if doc.exists:
+            row = doc.to_dict()
+            if self._is_current(row, user1_id, user1_data, user2_id, user2_data):
+                return row["result"]
+
+        row = self._row(user1_id, user1_data, user2_id, user2_data)
+        with timed("firestore"):
+            doc_ref.set(row)
+        return row["result"]
+
+    def recompute_for(self, user_id: str):
+        """Rescore every stored match involving a user against their current profile"""
+        with self._lock:
+            self._pending.discard(user_id)
+        try:
+            self._recompute(user_id)
+        except Exception as e:
+            print(f"Match recompute failed for {user_id}: {e}")
+
+    def _recompute(self, user_id: str):
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        matches = db.collection(MATCHES_COLLECTION)
+        rows = timed_iter("firestore", matches.where(filter=FieldFilter("users", "array_contains", user_id)).stream())
+        page = []
+        for doc in rows:
+            page.append(doc)
+            if len(page) == FIRESTORE_BATCH_SIZE:
+                self._rescore_page(user_id, page)
+                page = []
+        if page:
+            self._rescore_page(user_id, page)
+
+    def _rescore_page(self, user_id: str, docs):
+        """Rescore up to one write batch of a user's rows, reading every counterpart in one get_all"""
+        other_ids = [next((u for u in doc.to_dict()["users"] if u != user_id), user_id) for doc in docs]
+        profiles = get_user_profiles([user_id] + other_ids)
+        user_data = profiles[user_id]
+
+        batch = db.batch()
+        for doc, other_id in zip(docs, other_ids):
+            other_data = profiles[other_id]
+            if user_data is None or other_data is None:
+                batch.delete(doc.reference)
+            else:
+                try:
+                    batch.set(doc.reference, self._row(user_id, user_data, other_id, other_data))
+                except Exception as e:
+                    # Profiles missing matcher fields are rescored lazily on the next read
+                    print(f"Could not rescore {doc.id}: {e}")
+                    batch.delete(doc.reference)
+        with timed("firestore"):
+            batch.commit()
+
+    def schedule_recompute(self, user_id: str):
+        """Queue a background rescore for a user, coalescing repeated writes"""
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="match-store")
+            executor = self._executor
+        executor.submit(self.recompute_for, user_id)
+
+    def shutdown(self):
+        """Finish queued rescores and stop the background thread"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,86 @@
+import contextvars
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import spotipy
+
+from ..database import save_user_profile
+from .spotify_clients import spotify_clients
+from .track_features import FEATURE_KEYS, track_features
+
+SYNC_TOP_LIMIT = int(os.getenv("SYNC_TOP_LIMIT", "10"))
+SYNC_RECENT_LIMIT = int(os.getenv("SYNC_RECENT_LIMIT", "10"))
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "16"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="spotify-sync")
+        return _executor
+
+
+def shutdown_sync_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def aggregate_features(features: Dict[str, Optional[Dict]]) -> Dict[str, float]:
+    """Mean of every audio feature over the tracks that have it"""
+    aggregated = {}
+    for key in FEATURE_KEYS:
+        values = [f[key] for f in features.values() if f and f.get(key) is not None]
+        if values:
+            aggregated[key] = sum(values) / len(values)
+    return aggregated
+
+
+def sync_profile(user_id: str, sp: Optional[spotipy.Spotify] = None) -> Dict:
+    """
+    Refresh a user's music profile from Spotify in one concurrent wave.
+
+    Top artists and recent tracks are fetched while top tracks resolve into
+    audio features, and the whole profile (everything the matcher reads) is
+    committed with a single Firestore write. Returns the fields written.
+    """
+    sp = sp or spotify_clients.client(user_id)
+    executor = _get_executor()
+    # Run in copies of the caller's context so request metrics see these calls
+    artists_call = executor.submit(
+        contextvars.copy_context().run, sp.current_user_top_artists, limit=SYNC_TOP_LIMIT
+    )
+    recent_call = executor.submit(
+        contextvars.copy_context().run, sp.current_user_recently_played, limit=SYNC_RECENT_LIMIT
+    )
+
+    top_tracks = sp.current_user_top_tracks(limit=SYNC_TOP_LIMIT)["items"]
+    track_ids: List[str] = [track["id"] for track in top_tracks if track.get("id")]
+    features = track_features.get_features(sp, track_ids)
+
+    top_artists = artists_call.result()["items"]
+    recent_tracks = recent_call.result()["items"]
+    genres = list(dict.fromkeys(genre for artist in top_artists for genre in artist.get("genres", [])))
+
+    profile = {
+        "top_artists": [artist["name"] for artist in top_artists],
+        "top_genres": genres,
+        "genres": genres,
+        "top_tracks": [track["name"] for track in top_tracks],
+        "track_ids": track_ids,
+        "recent_tracks": [item["track"]["name"] for item in recent_tracks],
+        "track_audio_features": {track_id: f for track_id, f in features.items() if f},
+        "audio_features": aggregate_features(features),
+        "last_synced_at": datetime.datetime.utcnow(),
+    }
+    save_user_profile(user_id, profile, merge=True)
+    return profile
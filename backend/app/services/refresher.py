@@ -0,0 +1,215 @@
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+import spotipy
+
+from ..database import db
+from ..metrics import timed
+from .profile_sync import sync_profile
+from .spotify_clients import SpotifyAuthError, retry_after_seconds, spotify_clients
+
+# Spotify requests per second the refresher may spend, across all its workers
+SPOTIFY_REFRESH_RATE = float(os.getenv("SPOTIFY_REFRESH_RATE", "5"))
+SPOTIFY_REFRESH_BURST = float(os.getenv("SPOTIFY_REFRESH_BURST", "20"))
+SPOTIFY_REFRESH_CONCURRENCY = int(os.getenv("SPOTIFY_REFRESH_CONCURRENCY", "4"))
+# Profiles synced more recently than this are skipped
+SPOTIFY_REFRESH_MAX_AGE_SECONDS = float(os.getenv("SPOTIFY_REFRESH_MAX_AGE_SECONDS", str(24 * 3600)))
+# Pause between the end of one pass over the users and the start of the next
+SPOTIFY_REFRESH_INTERVAL_SECONDS = float(os.getenv("SPOTIFY_REFRESH_INTERVAL_SECONDS", "3600"))
+SPOTIFY_REFRESH_PAGE_SIZE = 100
+# Top artists, top tracks, recent tracks and one audio-features batch
+REQUESTS_PER_SYNC = 4
+
+JOBS_COLLECTION = "jobs"
+REFRESH_JOB_ID = "spotify_refresh"
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1, stop: Optional[threading.Event] = None) -> bool:
+        """Wait until `tokens` are available and take them; False if `stop` was set first"""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                delay = (tokens - self._tokens) / self.rate
+            if stop is not None:
+                if stop.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Empty the bucket so nothing is sent for roughly `seconds`, e.g. after a 429"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class SpotifyRefresher:
+    """
+    Walks every connected user in document id order and re-syncs profiles
+    older than SPOTIFY_REFRESH_MAX_AGE_SECONDS from Spotify.
+
+    Spotify calls go through one token bucket shared by all workers, at most
+    SPOTIFY_REFRESH_CONCURRENCY profiles sync at a time, and a 429 empties the
+    bucket for its Retry-After. After every page of users the position is
+    checkpointed in Firestore, so a restarted worker resumes the pass where
+    the last one stopped. Run it in one process only: either the app with
+    SPOTIFY_REFRESH_ENABLED=1 or `python -m scripts.refresh_profiles`.
+    """
+
+    def __init__(self, rate: float = SPOTIFY_REFRESH_RATE, burst: float = SPOTIFY_REFRESH_BURST,
+                 concurrency: int = SPOTIFY_REFRESH_CONCURRENCY,
+                 max_age: float = SPOTIFY_REFRESH_MAX_AGE_SECONDS, sync=sync_profile):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.max_age = max_age
+        self.sync = sync
+        self.stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- checkpoints ----
+
+    @staticmethod
+    def _job():
+        return db.collection(JOBS_COLLECTION).document(REFRESH_JOB_ID)
+
+    def load_checkpoint(self) -> Dict:
+        with timed("firestore"):
+            snapshot = self._job().get()
+        return snapshot.to_dict() if snapshot.exists else {}
+
+    def save_checkpoint(self, state: Dict):
+        with timed("firestore"):
+            self._job().set(dict(state, updated_at=datetime.datetime.utcnow()))
+
+    # ---- one pass ----
+
+    def _is_stale(self, user_data: Dict) -> bool:
+        synced_at = user_data.get("last_synced_at")
+        if synced_at is None:
+            return True
+        if synced_at.tzinfo is not None:
+            synced_at = synced_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return (datetime.datetime.utcnow() - synced_at).total_seconds() > self.max_age
+
+    def _refresh_user(self, user_id: str):
+        try:
+            self.sync(user_id)
+        except spotipy.SpotifyException as e:
+            if e.http_status == 429:
+                self.bucket.pause(retry_after_seconds((e.headers or {}).get("Retry-After")) or 1)
+            raise
+
+    def _page(self, cursor: Optional[str]):
+        # Ordered by document id so the checkpointed cursor is a stable
+        # position, and users without a last_login are still walked
+        query = (db.collection("users").order_by("__name__")
+                 .select(["last_synced_at", "access_token", "refresh_token"]))
+        if cursor:
+            query = query.start_after({"__name__": cursor})
+        with timed("firestore"):
+            return list(query.limit(SPOTIFY_REFRESH_PAGE_SIZE).stream())
+
+    def run_pass(self) -> Dict:
+        """
+        Refresh stale users from the checkpointed position to the end of the
+        user list. Returns the pass totals; stops early if stop() is called.
+        """
+        state = self.load_checkpoint()
+        if not state.get("cursor"):
+            state = {"cursor": None, "refreshed": 0, "skipped": 0, "failed": 0,
+                     "pass_started_at": datetime.datetime.utcnow()}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="spotify-refresh") as executor:
+            while not self.stop_event.is_set():
+                docs = self._page(state["cursor"])
+                if not docs:
+                    break
+
+                connected = spotify_clients.connected(doc.id for doc in docs)
+                in_flight: Dict[Future, str] = {}
+                for doc in docs:
+                    user_data = doc.to_dict()
+                    has_tokens = doc.id in connected or user_data.get("access_token") or user_data.get("refresh_token")
+                    if not has_tokens or not self._is_stale(user_data):
+                        state["skipped"] += 1
+                        continue
+                    if len(in_flight) >= self.concurrency:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self._collect(done, in_flight, state)
+                    if not self.bucket.acquire(REQUESTS_PER_SYNC, self.stop_event):
+                        break
+                    in_flight[executor.submit(self._refresh_user, doc.id)] = doc.id
+                self._collect(wait(in_flight).done, in_flight, state)
+
+                if self.stop_event.is_set():
+                    break  # The unfinished page is redone on resume
+                state["cursor"] = docs[-1].id
+                self.save_checkpoint(state)
+
+        if not self.stop_event.is_set():
+            totals = dict(state, cursor=None, pass_finished_at=datetime.datetime.utcnow())
+            self.save_checkpoint(totals)
+            return totals
+        return state
+
+    @staticmethod
+    def _collect(done, in_flight: Dict[Future, str], state: Dict):
+        for future in done:
+            user_id = in_flight.pop(future)
+            try:
+                future.result()
+                state["refreshed"] += 1
+            except SpotifyAuthError as e:
+                # Revoked or missing tokens: nothing to refresh until the user logs in again
+                state["skipped"] += 1
+                print(f"Skipping Spotify refresh for {user_id}: {e.detail}")
+            except Exception as e:
+                state["failed"] += 1
+                print(f"Spotify refresh failed for {user_id}: {e}")
+
+    # ---- scheduling ----
+
+    def run_forever(self, interval: float = SPOTIFY_REFRESH_INTERVAL_SECONDS):
+        while not self.stop_event.is_set():
+            try:
+                totals = self.run_pass()
+                print(f"Spotify refresh pass: {totals['refreshed']} refreshed, "
+                      f"{totals['skipped']} skipped, {totals['failed']} failed")
+            except Exception as e:
+                print(f"Spotify refresh pass failed: {e}")
+            self.stop_event.wait(interval)
+
+    def start(self):
+        """Run passes forever on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="spotify-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Join the in-flight call for a key, or start one. Returns its Future and
+        whether the caller leads it; a leader must settle it with resolve().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = Future()
+            return call, True
+
+    def resolve(self, key: Hashable, result=None, error: Optional[BaseException] = None):
+        """Settle a claimed call with its result (or exception), waking every waiter"""
+        with self._lock:
+            call = self._calls.pop(key)
+        if error is not None:
+            call.set_exception(error)
+        else:
+            call.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        call, leader = self.claim(key)
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, result)
+        return result
@@ -0,0 +1,345 @@
+import email.utils
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+import requests
+import spotipy
+from fastapi import HTTPException, status
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+from urllib3.util.retry import Retry
+
+from ..config import require_env
+from ..database import db, get_user_profile
+from ..metrics import timed
+from .singleflight import SingleFlight
+
+SPOTIFY_SCOPE = "user-top-read playlist-modify-public user-follow-modify"
+
+SPOTIFY_POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", "32"))
+SPOTIFY_TIMEOUT_SECONDS = float(os.getenv("SPOTIFY_TIMEOUT_SECONDS", "10"))
+SPOTIFY_TOKEN_CACHE_SIZE = int(os.getenv("SPOTIFY_TOKEN_CACHE_SIZE", "10000"))
+# Tokens are refreshed this long before they expire, so requests never carry a stale one
+SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+# 429s are retried after Spotify's Retry-After unless it asks for longer than this
+SPOTIFY_MAX_RETRY_AFTER_SECONDS = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER_SECONDS", "30"))
+SPOTIFY_RATE_LIMIT_RETRIES = 3
+
+# Fields holding a user's Spotify tokens; older profiles still carry them
+TOKEN_FIELDS = ("access_token", "refresh_token", "token_expires_at")
+# Tokens are kept out of the public users documents, one document per user
+SPOTIFY_TOKENS_COLLECTION = "spotify_tokens"
+
+
+class SpotifyAuthError(Exception):
+    """A user's Spotify client can't be built: unknown user, or no usable token"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that honours Retry-After on 429 responses.
+
+    Spotify rate limits the whole app, not one user, so a 429 pauses every
+    request sent through this adapter until the Retry-After has passed, then
+    the throttled request is retried. Waits longer than
+    SPOTIFY_MAX_RETRY_AFTER_SECONDS are not slept through: the 429 is
+    returned to the caller instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_for_window(self):
+        with self._lock:
+            delay = self._blocked_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _block_for(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def send(self, request, **kwargs):
+        for attempt in range(SPOTIFY_RATE_LIMIT_RETRIES + 1):
+            self._wait_for_window()
+            response = super().send(request, **kwargs)
+            if response.status_code != 429 or attempt == SPOTIFY_RATE_LIMIT_RETRIES:
+                return response
+            delay = retry_after_seconds(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = 2 ** attempt
+            if delay > SPOTIFY_MAX_RETRY_AFTER_SECONDS:
+                return response
+            self._block_for(delay)
+            response.close()
+        return response
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session shared by every Spotify client.
+
+    spotipy closes the session of a client when that client is garbage
+    collected, which would drop the shared connection pool, so close() is a
+    no-op here and the pool is only released by shutdown().
+    """
+
+    def __init__(self, pool_size: int = SPOTIFY_POOL_SIZE):
+        super().__init__()
+        adapter = RateLimitedAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            # Server errors are retried with backoff; 429s are handled by the adapter
+            max_retries=Retry(
+                total=3, connect=None, read=False, status=3, backoff_factor=0.3,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+                raise_on_status=False,
+            ),
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, *args, **kwargs):
+        with timed("spotify"):
+            return super().request(*args, **kwargs)
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class _UserTokenAuth:
+    """spotipy auth manager that asks the client manager for a user's current token"""
+
+    def __init__(self, manager: "SpotifyClientManager", user_id: str):
+        self.manager = manager
+        self.user_id = user_id
+
+    def get_access_token(self, as_dict: bool = False):
+        token_info = self.manager.token_info(self.user_id)
+        return token_info if as_dict else token_info["access_token"]
+
+
+class SpotifyClientManager:
+    """
+    Hands out spotipy clients for users.
+
+    Every client shares one pooled HTTP session, so connections (and their
+    TLS handshakes) are reused across users. Tokens are cached in memory with
+    their expiry, refreshed shortly before they expire, and a user's
+    concurrent requests share a single refresh call.
+    """
+
+    def __init__(self, token_cache_size: int = SPOTIFY_TOKEN_CACHE_SIZE):
+        self.token_cache_size = token_cache_size
+        self._tokens: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshes = SingleFlight()
+        self._session: Optional[PooledSession] = None
+        self._oauth: Optional[SpotifyOAuth] = None
+
+    @property
+    def session(self) -> PooledSession:
+        with self._lock:
+            if self._session is None:
+                self._session = PooledSession()
+            return self._session
+
+    def oauth(self) -> SpotifyOAuth:
+        """
+        The app's SpotifyOAuth, built on first use. Tokens are never cached
+        by spotipy itself: its default file cache is shared by every user.
+        """
+        if self._oauth is None:
+            session = self.session
+            with self._lock:
+                if self._oauth is None:
+                    self._oauth = SpotifyOAuth(
+                        client_id=require_env("SPOTIFY_CLIENT_ID", "Spotify client ID"),
+                        client_secret=require_env("SPOTIFY_CLIENT_SECRET", "Spotify client secret"),
+                        redirect_uri=require_env("SPOTIFY_REDIRECT_URI", "Spotify redirect URI"),
+                        scope=SPOTIFY_SCOPE,
+                        cache_handler=MemoryCacheHandler(),
+                        requests_session=session,
+                        requests_timeout=SPOTIFY_TIMEOUT_SECONDS,
+                    )
+        return self._oauth
+
+    # ---- tokens ----
+
+    def _cached(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            token_info = self._tokens.get(user_id)
+            if token_info is not None:
+                self._tokens.move_to_end(user_id)
+            return token_info
+
+    def remember(self, user_id: str, token_info: Dict):
+        """Cache a user's token_info (access_token, refresh_token, expires_at)"""
+        with self._lock:
+            self._tokens[user_id] = token_info
+            self._tokens.move_to_end(user_id)
+            while len(self._tokens) > self.token_cache_size:
+                self._tokens.popitem(last=False)
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._tokens.pop(user_id, None)
+
+    def store(self, user_id: str, token_info: Dict):
+        """
+        Cache a user's token_info and save it to their spotify_tokens document.
+        Profile listeners aren't notified: a token rotation is not a profile change.
+        """
+        self.remember(user_id, token_info)
+        with timed("firestore"):
+            db.collection(SPOTIFY_TOKENS_COLLECTION).document(user_id).set(token_fields(token_info))
+
+    @staticmethod
+    def connected(user_ids: Iterable[str]) -> Set[str]:
+        """The users among `user_ids` with stored Spotify tokens, in one get_all round trip"""
+        tokens = db.collection(SPOTIFY_TOKENS_COLLECTION)
+        with timed("firestore"):
+            docs = list(db.get_all([tokens.document(user_id) for user_id in user_ids]))
+        return {doc.id for doc in docs if doc.exists}
+
+    def _load(self, user_id: str) -> Dict:
+        with timed("firestore"):
+            doc = db.collection(SPOTIFY_TOKENS_COLLECTION).document(user_id).get()
+        user_data = doc.to_dict() if doc.exists else None
+        if user_data is None:
+            # Users who last logged in before tokens moved out of their profile
+            user_data = get_user_profile(user_id)
+            if user_data is None:
+                raise SpotifyAuthError(status.HTTP_404_NOT_FOUND, "User not found")
+        if not user_data.get("access_token") and not user_data.get("refresh_token"):
+            raise SpotifyAuthError(status.HTTP_401_UNAUTHORIZED, "No access token found")
+        return {
+            "access_token": user_data.get("access_token"),
+            "refresh_token": user_data.get("refresh_token"),
+            # Tokens saved before expiries were tracked are used until Spotify rejects them
+            "expires_at": user_data.get("token_expires_at"),
+        }
+
+    @staticmethod
+    def _expiring(token_info: Dict) -> bool:
+        if not token_info.get("access_token"):
+            return True
+        expires_at = token_info.get("expires_at")
+        return expires_at is not None and expires_at - time.time() < SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS
+
+    def _refresh(self, user_id: str, token_info: Dict) -> Dict:
+        # Another caller may have refreshed while this one waited for the lock
+        current = self._cached(user_id)
+        if current is not None and not self._expiring(current):
+            return current
+        try:
+            refreshed = self.oauth().refresh_access_token(token_info["refresh_token"])
+        except spotipy.SpotifyOauthError as e:
+            self.forget(user_id)
+            raise SpotifyAuthError(status.HTTP_401_UNAUTHORIZED, f"Spotify token refresh failed: {e}")
+        token_info = {
+            "access_token": refreshed["access_token"],
+            "refresh_token": refreshed.get("refresh_token") or token_info["refresh_token"],
+            "expires_at": refreshed["expires_at"],
+        }
+        self.store(user_id, token_info)
+        return token_info
+
+    def token_info(self, user_id: str) -> Dict:
+        """A user's token, refreshed first if it expires within the refresh margin"""
+        token_info = self._cached(user_id)
+        if token_info is None:
+            token_info = self._load(user_id)
+            self.remember(user_id, token_info)
+        if self._expiring(token_info):
+            if not token_info.get("refresh_token"):
+                if token_info.get("access_token"):
+                    return token_info  # Nothing to refresh with; let Spotify decide
+                raise SpotifyAuthError(status.HTTP_401_UNAUTHORIZED, "No access token found")
+            token_info = self._refreshes.do(user_id, self._refresh, user_id, token_info)
+        return token_info
+
+    # ---- clients ----
+
+    def client(self, user_id: str) -> spotipy.Spotify:
+        """
+        A Spotify client for the user. Its token is looked up on every
+        request, so long-lived clients keep working across refreshes.
+        """
+        self.token_info(user_id)  # Fail fast for unknown or disconnected users
+        return spotipy.Spotify(
+            auth_manager=_UserTokenAuth(self, user_id),
+            requests_session=self.session,
+            requests_timeout=SPOTIFY_TIMEOUT_SECONDS,
+        )
+
+    def client_for_token(self, access_token: str) -> spotipy.Spotify:
+        """A Spotify client for a raw access token, e.g. during the OAuth callback"""
+        return spotipy.Spotify(
+            auth=access_token,
+            requests_session=self.session,
+            requests_timeout=SPOTIFY_TIMEOUT_SECONDS,
+        )
+
+    def shutdown(self):
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.shutdown()
+
+
+def token_fields(token_info: Dict) -> Dict:
+    """spotify_tokens document fields storing a token_info"""
+    return {
+        "access_token": token_info["access_token"],
+        "refresh_token": token_info.get("refresh_token"),
+        "token_expires_at": token_info.get("expires_at"),
+    }
+
+
+spotify_clients = SpotifyClientManager()
+
+
+def get_sp_oauth() -> SpotifyOAuth:
+    """Dependency returning the shared SpotifyOAuth helper"""
+    try:
+        return spotify_clients.oauth()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+
+def get_spotify_client(user_id: str) -> spotipy.Spotify:
+    """Get authenticated Spotify client for user"""
+    try:
+        return spotify_clients.client(user_id)
+    except SpotifyAuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
@@ -0,0 +1,156 @@
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+# Listening archetypes modelled on the profiles in scripts/add_test_users.py.
+# Each one has a pool of well-known artists, the genres they map to and the
+# centre of its audio features (danceability, energy, valence, tempo,
+# instrumentalness).
+ARCHETYPES = [
+    {
+        "name": "pop",
+        "artists": ["Drake", "The Weeknd", "Doja Cat", "Post Malone", "Ariana Grande",
+                    "Dua Lipa", "Taylor Swift", "Ed Sheeran", "Bad Bunny", "Travis Scott"],
+        "genres": ["pop", "dance pop", "pop rock", "r&b", "hip hop"],
+        "audio": [0.8, 0.75, 0.65, 128, 0.1],
+    },
+    {
+        "name": "rnb",
+        "artists": ["SZA", "Frank Ocean", "The Weeknd", "Drake", "Post Malone", "Daniel Caesar"],
+        "genres": ["r&b", "alternative r&b", "pop", "soul"],
+        "audio": [0.75, 0.7, 0.6, 125, 0.15],
+    },
+    {
+        "name": "hiphop",
+        "artists": ["Travis Scott", "Drake", "Kendrick Lamar", "Post Malone", "21 Savage", "J. Cole"],
+        "genres": ["hip hop", "rap", "trap", "pop rap"],
+        "audio": [0.85, 0.8, 0.7, 130, 0.1],
+    },
+    {
+        "name": "metal",
+        "artists": ["Metallica", "Slipknot", "System of a Down", "Tool", "Rammstein", "Gojira"],
+        "genres": ["metal", "nu metal", "alternative metal", "progressive metal"],
+        "audio": [0.4, 0.9, 0.3, 140, 0.3],
+    },
+    {
+        "name": "indie",
+        "artists": ["Arctic Monkeys", "The Strokes", "Tame Impala", "The 1975", "Vampire Weekend",
+                    "Mac DeMarco", "MGMT", "Beach House"],
+        "genres": ["indie rock", "indie pop", "psychedelic rock", "dream pop"],
+        "audio": [0.62, 0.68, 0.58, 121, 0.27],
+    },
+    {
+        "name": "classical",
+        "artists": ["Ludwig van Beethoven", "Wolfgang Amadeus Mozart", "Johann Sebastian Bach",
+                    "Frédéric Chopin", "Claude Debussy"],
+        "genres": ["classical", "baroque", "romantic era", "impressionism"],
+        "audio": [0.25, 0.45, 0.5, 95, 0.95],
+    },
+    {
+        "name": "electronic",
+        "artists": ["Daft Punk", "Deadmau5", "Aphex Twin", "Chemical Brothers", "Boards of Canada"],
+        "genres": ["electronic", "house", "idm", "techno", "big beat"],
+        "audio": [0.85, 0.9, 0.7, 135, 0.8],
+    },
+]
+
+AUDIO_KEYS = ("danceability", "energy", "valence", "tempo", "instrumentalness")
+AUDIO_JITTER = np.array([0.08, 0.08, 0.1, 8, 0.08])
+
+TOP_ARTISTS = 5
+TOP_TRACKS = 5
+TOP_GENRES = 3
+
+# Popularity follows a Zipf law: the archetypes' headliners take the top
+# ranks of a long tail of lesser-known artists and genres
+ARTIST_VOCABULARY = 50_000
+GENRE_VOCABULARY = 1_500
+TRACKS_PER_ARTIST = 20
+GLOBAL_ZIPF_EXPONENT = 1.1
+LOCAL_ZIPF_EXPONENT = 1.6
+# Chance that an artist or genre slot comes from the user's archetype
+ARCHETYPE_AFFINITY = 0.6
+
+CHUNK_SIZE = 10_000
+
+
+def _vocabulary(headliners, size: int, label: str):
+    names = list(dict.fromkeys(headliners))
+    names += [f"{label} {rank}" for rank in range(len(names), size)]
+    return names
+
+
+ARTISTS = _vocabulary((a for archetype in ARCHETYPES for a in archetype["artists"]), ARTIST_VOCABULARY, "Artist")
+GENRES = _vocabulary((g for archetype in ARCHETYPES for g in archetype["genres"]), GENRE_VOCABULARY, "genre")
+
+
+def _zipf_probabilities(size: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _draw(rng, archetype_ids, pools, vocabulary, slots: int) -> np.ndarray:
+    """
+    Draw `slots` candidate items per user: Zipf over the user's archetype
+    pool with probability ARCHETYPE_AFFINITY, otherwise Zipf over the whole
+    vocabulary. Returns names, one row per user.
+    """
+    shape = (len(archetype_ids), slots)
+    global_picks = rng.choice(len(vocabulary), size=shape, p=_zipf_probabilities(len(vocabulary), GLOBAL_ZIPF_EXPONENT))
+
+    pool_sizes = np.array([len(pool) for pool in pools])[archetype_ids][:, np.newaxis]
+    local_ranks = (rng.zipf(LOCAL_ZIPF_EXPONENT, size=shape) - 1) % pool_sizes
+    index = {name: i for i, name in enumerate(vocabulary)}
+    pool_ids = [np.array([index[name] for name in pool]) for pool in pools]
+    local_picks = np.empty(shape, dtype=np.int64)
+    for archetype_id, ids in enumerate(pool_ids):
+        rows = archetype_ids == archetype_id
+        local_picks[rows] = ids[local_ranks[rows]]
+
+    picks = np.where(rng.random(shape) < ARCHETYPE_AFFINITY, local_picks, global_picks)
+    return np.asarray(vocabulary, dtype=object)[picks]
+
+
+def _first_unique(names, count: int):
+    return list(dict.fromkeys(names))[:count]
+
+
+def generate_profiles(count: int, seed: int = 0) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yield `count` reproducible (user_id, profile) pairs shaped like the
+    Firestore user documents the matcher reads, with Zipf-distributed
+    artists, tracks and genres. Generated a chunk at a time, so millions of
+    profiles can be streamed with constant memory.
+    """
+    rng = np.random.default_rng(seed)
+    artist_pools = [archetype["artists"] for archetype in ARCHETYPES]
+    genre_pools = [archetype["genres"] for archetype in ARCHETYPES]
+    centres = np.array([archetype["audio"] for archetype in ARCHETYPES])
+
+    for chunk_start in range(0, count, CHUNK_SIZE):
+        n = min(CHUNK_SIZE, count - chunk_start)
+        archetype_ids = rng.integers(len(ARCHETYPES), size=n)
+        # Oversample so duplicates can be dropped and still fill every slot
+        artists = _draw(rng, archetype_ids, artist_pools, ARTISTS, TOP_ARTISTS * 3)
+        genres = _draw(rng, archetype_ids, genre_pools, GENRES, TOP_GENRES * 3)
+        track_numbers = (rng.zipf(LOCAL_ZIPF_EXPONENT, size=(n, TOP_TRACKS)) - 1) % TRACKS_PER_ARTIST
+
+        audio = centres[archetype_ids] + rng.normal(0, 1, (n, len(AUDIO_KEYS))) * AUDIO_JITTER
+        audio[:, [0, 1, 2, 4]] = np.clip(audio[:, [0, 1, 2, 4]], 0, 1)
+        audio = audio.round(3)
+
+        for i in range(n):
+            number = chunk_start + i
+            user_artists = _first_unique(artists[i], TOP_ARTISTS)
+            user_genres = _first_unique(genres[i], TOP_GENRES)
+            tracks = [f"{artist} - Track {track}" for artist, track in zip(user_artists, track_numbers[i])]
+            name = ARCHETYPES[archetype_ids[i]]["name"].title()
+
+            yield f"synthetic_{seed}_{number}", {
+                "username": f"{name}Fan{number}",
+                "top_artists": user_artists,
+                "top_tracks": tracks,
+                "top_genres": user_genres,
+                "genres": user_genres,
+                "audio_features": dict(zip(AUDIO_KEYS, audio[i].tolist())),
+            }
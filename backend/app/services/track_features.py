@@ -0,0 +1,122 @@
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import spotipy
+
+from ..database import db
+from ..metrics import timed
+
+# Spotify accepts at most 100 ids per audio-features request
+AUDIO_FEATURES_BATCH_SIZE = 100
+# Firestore caps a write batch at 500 operations
+FIRESTORE_BATCH_SIZE = 500
+
+TRACK_FEATURES_COLLECTION = "track_features"
+FEATURE_KEYS = (
+    "danceability", "energy", "valence", "tempo", "instrumentalness",
+    "acousticness", "speechiness", "liveness", "loudness",
+)
+
+TRACK_FEATURE_CACHE_SIZE = int(os.getenv("TRACK_FEATURE_CACHE_SIZE", "100000"))
+TRACK_FEATURE_WORKERS = int(os.getenv("TRACK_FEATURE_WORKERS", "4"))
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TrackFeatureService:
+    """
+    Process-wide track id -> audio features lookup.
+
+    Features never change for a track, so they are resolved from memory first,
+    then from the shared Firestore collection, and only then from Spotify in
+    batches of 100 ids issued concurrently. Anything fetched from Spotify is
+    written back to Firestore so other workers never fetch it again.
+    """
+
+    def __init__(self, maxsize: int = TRACK_FEATURE_CACHE_SIZE, max_workers: int = TRACK_FEATURE_WORKERS):
+        self.maxsize = maxsize
+        self.max_workers = max_workers
+        self._cache: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _remember(self, features: Dict[str, Optional[Dict]]):
+        with self._lock:
+            for track_id, track_features in features.items():
+                self._cache[track_id] = track_features
+                self._cache.move_to_end(track_id)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _lookup_memory(self, track_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        found = {}
+        with self._lock:
+            for track_id in track_ids:
+                if track_id in self._cache:
+                    self._cache.move_to_end(track_id)
+                    found[track_id] = self._cache[track_id]
+        return found
+
+    def _lookup_firestore(self, track_ids: List[str]) -> Dict[str, Dict]:
+        collection = db.collection(TRACK_FEATURES_COLLECTION)
+        with timed("firestore"):
+            docs = list(db.get_all([collection.document(track_id) for track_id in track_ids]))
+        return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+
+    def _fetch_spotify(self, sp: spotipy.Spotify, track_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="track-features"
+                )
+        batches = list(_chunks(track_ids, AUDIO_FEATURES_BATCH_SIZE))
+        fetched: Dict[str, Optional[Dict]] = dict.fromkeys(track_ids)
+        calls = [self._executor.submit(contextvars.copy_context().run, sp.audio_features, batch) for batch in batches]
+        for batch, call in zip(batches, calls):
+            for track_id, track in zip(batch, call.result() or []):
+                if track:
+                    fetched[track_id] = {key: track.get(key) for key in FEATURE_KEYS}
+        return fetched
+
+    def _persist(self, features: Dict[str, Optional[Dict]]):
+        collection = db.collection(TRACK_FEATURES_COLLECTION)
+        found = [(track_id, f) for track_id, f in features.items() if f is not None]
+        for start in range(0, len(found), FIRESTORE_BATCH_SIZE):
+            batch = db.batch()
+            for track_id, track_features in found[start:start + FIRESTORE_BATCH_SIZE]:
+                batch.set(collection.document(track_id), track_features)
+            with timed("firestore"):
+                batch.commit()
+
+    def get_features(self, sp: spotipy.Spotify, track_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Returns {track_id: features} for every requested id, in request order.
+        Tracks Spotify has no features for map to None.
+        """
+        track_ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id]
+        features = self._lookup_memory(track_ids)
+
+        missing = [track_id for track_id in track_ids if track_id not in features]
+        if missing:
+            stored = self._lookup_firestore(missing)
+            self._remember(stored)
+            features.update(stored)
+
+        missing = [track_id for track_id in missing if track_id not in features]
+        if missing:
+            fetched = self._fetch_spotify(sp, missing)
+            self._remember(fetched)
+            self._persist(fetched)
+            features.update(fetched)
+
+        return {track_id: features[track_id] for track_id in track_ids}
+
+
+track_features = TrackFeatureService()
@@ -0,0 +1 @@
+# Benchmarks run against in-memory fakes; see bench.py
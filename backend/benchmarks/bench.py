@@ -0,0 +1,265 @@
+"""
+Benchmarks for the matching engine and the HTTP routes.
+
+The whole FastAPI app runs in-process against in-memory fakes of Firestore,
+Spotify and Anthropic, over synthetic populations, so numbers are
+reproducible and need no credentials. Run from backend/:
+
+    python -m benchmarks.bench --sizes 1000,10000 --requests 300
+    python -m benchmarks.bench --sizes 1000000 --only calculate_match,rank_candidates
+    python -m benchmarks.bench --output results.json
+    python -m benchmarks.bench --baseline results.json   # exits 1 on a p95 regression
+
+Pass --firestore-latency-ms to model network round trips.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .fakes import FakeAnthropic, FakeFirestore, FakeSpotify
+
+BENCHMARKS = [
+    "calculate_match",
+    "score_compact",
+    "population_build",
+    "rank_candidates",
+    "rank_candidates_tfidf",
+    "rank_candidates_prefiltered",
+    "rank_candidates_clustered",
+    "parallel_top_k",
+    "audio_index_search",
+    "route_match",
+    "route_users",
+    "route_candidates",
+]
+
+
+def install_fakes(firestore_latency: float = 0.0) -> FakeFirestore:
+    """Point the app at fake Firestore, Spotify and Anthropic clients"""
+    for name in ("ANTHROPIC_API_KEY", "SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("SPOTIFY_REDIRECT_URI", "http://localhost:8000/auth/callback")
+
+    from app import database
+    fake_db = FakeFirestore(latency=firestore_latency)
+    database.set_db(fake_db)
+
+    import spotipy
+    spotipy.Spotify = FakeSpotify
+
+    from app.main import app
+    from app.routes import ai_claude
+    # A lambda: FastAPI would read FakeAnthropic's *args and **kwargs as query parameters
+    app.dependency_overrides[ai_claude.get_anthropic] = lambda: FakeAnthropic()
+    return fake_db
+
+
+def summarize(name: str, size: int, samples: List[float], wall: float) -> Dict:
+    latencies = np.array(samples) * 1000
+    return {
+        "benchmark": name,
+        "users": size,
+        "calls": len(samples),
+        "throughput_per_s": len(samples) / wall if wall else float("inf"),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def measure(name: str, size: int, calls: int, fn: Callable[[int], None]) -> Dict:
+    """Time `calls` sequential invocations of fn(i)"""
+    samples = []
+    started = time.perf_counter()
+    for i in range(calls):
+        call_started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - call_started)
+    return summarize(name, size, samples, time.perf_counter() - started)
+
+
+def run_size(size: int, args, selected: List[str]) -> List[Dict]:
+    fake_db = install_fakes(args.firestore_latency_ms / 1000)
+
+    from fastapi.testclient import TestClient
+
+    from app.database import profile_cache
+    from app.main import app
+    from app.matching import (
+        AudioIndex, ClusterIndex, IdfTable, Interner, ItemIndex, ParallelScorer, Population, fit_clusters, population,
+    )
+    from app.routes.match import FlirtifyMatcher, matcher_data
+    from app.services.synthetic import generate_profiles
+
+    profile_cache.clear()
+    population._population = None
+
+    started = time.perf_counter()
+    profiles = [(user_id, dict(profile, version=1)) for user_id, profile in generate_profiles(size, args.seed)]
+    fake_db.collection("users").load(profiles)
+    print(f"  generated {size} users in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = [user_id for user_id, _ in profiles]
+    pairs = rng.integers(size, size=(args.requests, 2))
+    queries = rng.integers(size, size=args.requests)
+    results = []
+
+    if "calculate_match" in selected:
+        matcher = FlirtifyMatcher()
+        data = [matcher_data(profile) for _, profile in profiles]
+        results.append(measure("calculate_match", size, args.requests * 10, lambda i: matcher.calculate_match(
+            data[pairs[i % len(pairs), 0]], data[pairs[i % len(pairs), 1]])))
+
+    if "score_compact" in selected:
+        matcher, interner = FlirtifyMatcher(), Interner()
+        compact = [interner.compact(profile) for _, profile in profiles]
+        results.append(measure("score_compact", size, args.requests * 10, lambda i: matcher.score_compact(
+            compact[pairs[i % len(pairs), 0]], compact[pairs[i % len(pairs), 1]])))
+
+    built = None
+    if {"population_build", "rank_candidates", "rank_candidates_tfidf", "rank_candidates_prefiltered",
+        "rank_candidates_clustered", "parallel_top_k", "audio_index_search"} & set(selected):
+        started = time.perf_counter()
+        built = Population.from_profiles(profiles)
+        if "population_build" in selected:
+            results.append(summarize("population_build", size, [time.perf_counter() - started],
+                                     time.perf_counter() - started))
+
+    if "rank_candidates" in selected:
+        matcher = FlirtifyMatcher()
+        results.append(measure("rank_candidates", size, args.requests, lambda i: matcher.rank_candidates(
+            user_ids[queries[i]], profiles[queries[i]][1], built, args.k)))
+
+    if "rank_candidates_tfidf" in selected:
+        matcher, idf = FlirtifyMatcher(), IdfTable(built)
+        results.append(measure("rank_candidates_tfidf", size, args.requests, lambda i: matcher.rank_candidates(
+            user_ids[queries[i]], profiles[queries[i]][1], built, args.k, idf)))
+
+    if "rank_candidates_prefiltered" in selected:
+        matcher, item_index = FlirtifyMatcher(), ItemIndex(built)
+        weights = {kind: matcher.weights[weight] for kind, weight in matcher.ITEM_WEIGHTS.items()}
+
+        def rank_prefiltered(i):
+            rows = item_index.candidate_rows(profiles[queries[i]][1], weights)
+            return matcher.rank_candidates(user_ids[queries[i]], profiles[queries[i]][1], built, args.k,
+                                           rows=rows if len(rows) > args.k else None)
+        results.append(measure("rank_candidates_prefiltered", size, args.requests, rank_prefiltered))
+
+    if "rank_candidates_clustered" in selected:
+        matcher, cluster_index = FlirtifyMatcher(), ClusterIndex(fit_clusters(built), built)
+
+        def rank_clustered(i):
+            rows = cluster_index.candidate_rows(profiles[queries[i]][1], args.probes)
+            return matcher.rank_candidates(user_ids[queries[i]], profiles[queries[i]][1], built, args.k,
+                                           rows=rows if len(rows) > args.k else None)
+        results.append(measure("rank_candidates_clustered", size, args.requests, rank_clustered))
+
+    if "parallel_top_k" in selected:
+        # One batch of every query user, over the pool; per-user cost is wall / requests
+        with ParallelScorer(built, FlirtifyMatcher().weights, args.workers or os.cpu_count() or 1) as scorer:
+            scorer.top_k_rows(queries, args.k)  # Start the workers and fault in the shared pages
+            started = time.perf_counter()
+            scorer.top_k_rows(queries, args.k)
+            wall = time.perf_counter() - started
+        results.append(summarize("parallel_top_k", size, [wall / len(queries)] * len(queries), wall))
+
+    if "audio_index_search" in selected:
+        index = AudioIndex.from_population(built)
+        results.append(measure("audio_index_search", size, args.requests, lambda i: index.search(
+            built.audio[queries[i]], args.k, exclude=user_ids[queries[i]])))
+
+    with TestClient(app) as client:
+        if "route_match" in selected:
+            def match(i):
+                response = client.post("/match/match", json={
+                    "user1_spotify_id": user_ids[pairs[i, 0]],
+                    "user2_spotify_id": user_ids[pairs[i, 1]],
+                })
+                response.raise_for_status()
+            results.append(measure("route_match", size, args.requests, match))
+
+        if "route_users" in selected:
+            def list_users(i):
+                response = client.get("/users/users", params={"limit": 100, "start_after": user_ids[queries[i]]})
+                response.raise_for_status()
+            results.append(measure("route_users", size, args.requests, list_users))
+
+        if "route_candidates" in selected:
+            client.get("/match/candidates", params={"user_id": user_ids[0], "k": args.k})  # build the population
+
+            def candidates(i):
+                response = client.get("/match/candidates", params={"user_id": user_ids[queries[i]], "k": args.k})
+                response.raise_for_status()
+            results.append(measure("route_candidates", size, args.requests, candidates))
+
+    return results
+
+
+def print_table(results: List[Dict]):
+    header = f"{'benchmark':<28}{'users':>10}{'calls':>8}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['benchmark']:<28}{r['users']:>10}{r['calls']:>8}{r['throughput_per_s']:>12.1f}"
+              f"{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+
+
+def regressions(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Benchmarks whose p95 got more than `tolerance` slower than the baseline"""
+    previous = {(r["benchmark"], r["users"]): r for r in baseline}
+    slower = []
+    for r in results:
+        before = previous.get((r["benchmark"], r["users"]))
+        if before and r["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            slower.append(f"{r['benchmark']} @ {r['users']} users: "
+                          f"p95 {before['p95_ms']:.3f}ms -> {r['p95_ms']:.3f}ms")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated population sizes")
+    parser.add_argument("--requests", type=int, default=200, help="calls per benchmark")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmarks to run")
+    parser.add_argument("--k", type=int, default=10, help="top-k for ranking benchmarks")
+    parser.add_argument("--probes", type=int, default=8, help="clusters scored by rank_candidates_clustered")
+    parser.add_argument("--workers", type=int, default=0, help="processes for parallel_top_k (0: every core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    selected = [name for name in args.only.split(",") if name]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"Population of {size} users", file=sys.stderr)
+        results.extend(run_size(size, args, selected))
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+In-memory stand-ins for Firestore, Spotify and Anthropic, implementing just
+the parts of each client API the app uses.
+"""
+import bisect
+import copy
+import datetime
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from google.cloud.firestore_v1 import transforms
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+
+def _apply_transforms(current: Dict, data: Dict) -> Dict:
+    for key, value in data.items():
+        if value is transforms.SERVER_TIMESTAMP:
+            current[key] = datetime.datetime.now(datetime.timezone.utc)
+        elif value is transforms.DELETE_FIELD:
+            current.pop(key, None)
+        elif isinstance(value, transforms.Increment):
+            current[key] = current.get(key, 0) + value.value
+        elif isinstance(value, transforms.ArrayUnion):
+            existing = list(current.get(key) or [])
+            current[key] = existing + [v for v in value.values if v not in existing]
+        elif isinstance(value, transforms.ArrayRemove):
+            current[key] = [v for v in current.get(key) or [] if v not in value.values]
+        else:
+            current[key] = copy.deepcopy(value)
+    return current
+
+
+class FakeDocumentReference:
+    def __init__(self, collection: "FakeCollection", doc_id: str):
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self, *args, **kwargs) -> FakeSnapshot:
+        self.collection.client.rpc()
+        return self.collection.snapshot(self.id)
+
+    def set(self, data: Dict, merge: bool = False):
+        self.collection.client.rpc()
+        self.collection.write(self.id, data, merge)
+
+    def update(self, data: Dict):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self.collection.client.rpc()
+        self.collection.remove(self.id)
+
+
+class FakeQuery:
+    def __init__(self, collection: "FakeCollection"):
+        self.collection = collection
+        self.filters: List = []
+        self.fields: Optional[List[str]] = None
+        self.after: Optional[str] = None
+        self.after_value = None
+        self.limit_to: Optional[int] = None
+        self.order_field: Optional[str] = None
+        self.descending = False
+
+    def _copy(self, **changes) -> "FakeQuery":
+        query = copy.copy(self)
+        query.filters = list(self.filters)
+        query.__dict__.update(changes)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING") -> "FakeQuery":
+        field = str(field_path)
+        return self._copy(
+            order_field=None if field == "__name__" else field,
+            descending=direction == "DESCENDING",
+        )
+
+    def select(self, field_paths: Iterable[str]) -> "FakeQuery":
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, values) -> "FakeQuery":
+        if isinstance(values, FakeSnapshot):
+            return self._copy(after=values.id, after_value=values.get(self.order_field) if self.order_field else None)
+        values = {str(key): value for key, value in values.items()}
+        return self._copy(after=values.get("__name__"), after_value=values.get(self.order_field))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit_to=count)
+
+    def _matches(self, data: Dict) -> bool:
+        for field, op, value in self.filters:
+            current = data.get(field)
+            if op == "==" and current != value:
+                return False
+            if op == "array_contains" and value not in (current or []):
+                return False
+            if op == "in" and current not in value:
+                return False
+            if op == "<" and not (current is not None and current < value):
+                return False
+            if op == ">" and not (current is not None and current > value):
+                return False
+        return True
+
+    def _ids(self) -> Iterable[str]:
+        if self.order_field is None:
+            ids = self.collection.sorted_ids()
+            start = bisect.bisect_right(ids, self.after) if self.after is not None else 0
+            return ids[start:]
+
+        def sort_key(doc_id):
+            value = self.collection.docs[doc_id].get(self.order_field)
+            return (value is not None, value, doc_id)
+
+        with self.collection.client.lock:
+            ids = sorted(self.collection.docs, key=sort_key, reverse=self.descending)
+        if self.after is not None and self.after in self.collection.docs:
+            return ids[ids.index(self.after) + 1:]
+        if self.after_value is not None:
+            key = (True, self.after_value, chr(0x10FFFF) if not self.descending else "")
+            if self.descending:
+                return [doc_id for doc_id in ids if sort_key(doc_id) < key]
+            return [doc_id for doc_id in ids if sort_key(doc_id) > key]
+        return ids
+
+    def stream(self, *args, **kwargs):
+        self.collection.client.rpc()
+        returned = 0
+        for doc_id in self._ids():
+            data = self.collection.docs.get(doc_id)
+            if data is None or not self._matches(data):
+                continue
+            if self.fields is not None:
+                data = {field: data[field] for field in self.fields if field in data}
+            yield FakeSnapshot(FakeDocumentReference(self.collection, doc_id), data)
+            returned += 1
+            if self.limit_to is not None and returned >= self.limit_to:
+                return
+
+    def get(self, *args, **kwargs) -> List[FakeSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollection:
+    def __init__(self, client: "FakeFirestore", name: str):
+        self.client = client
+        self.name = name
+        self.docs: Dict[str, Dict] = {}
+        self._sorted: Optional[List[str]] = None
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self, doc_id or uuid.uuid4().hex)
+
+    def snapshot(self, doc_id: str) -> FakeSnapshot:
+        return FakeSnapshot(FakeDocumentReference(self, doc_id), self.docs.get(doc_id))
+
+    def sorted_ids(self) -> List[str]:
+        with self.client.lock:
+            if self._sorted is None:
+                self._sorted = sorted(self.docs)
+            return self._sorted
+
+    def write(self, doc_id: str, data: Dict, merge: bool = False):
+        with self.client.lock:
+            current = dict(self.docs.get(doc_id) or {}) if merge else {}
+            if doc_id not in self.docs:
+                self._sorted = None
+            self.docs[doc_id] = _apply_transforms(current, data)
+
+    def remove(self, doc_id: str):
+        with self.client.lock:
+            if self.docs.pop(doc_id, None) is not None:
+                self._sorted = None
+
+    def load(self, documents: Iterable):
+        """Bulk-insert (doc_id, data) pairs without copying or simulated latency"""
+        with self.client.lock:
+            self.docs.update(documents)
+            self._sorted = None
+
+    def __getattr__(self, name):
+        # where/order_by/select/limit/stream on a collection start a query
+        if name in ("where", "order_by", "select", "start_after", "limit", "stream", "get"):
+            return getattr(FakeQuery(self), name)
+        raise AttributeError(name)
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestore"):
+        self.client = client
+        self.ops = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict, merge: bool = False):
+        self.ops.append((reference, data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: Dict):
+        self.ops.append((reference, data, True))
+
+    def delete(self, reference: FakeDocumentReference):
+        self.ops.append((reference, None, False))
+
+    def commit(self):
+        self.client.rpc()
+        for reference, data, merge in self.ops:
+            if data is None:
+                reference.collection.remove(reference.id)
+            else:
+                reference.collection.write(reference.id, data, merge)
+        self.ops = []
+
+
+class FakeFirestore:
+    """
+    Thread-safe in-memory Firestore client. `latency` seconds are slept on
+    every simulated round trip to model the network.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.collections: Dict[str, FakeCollection] = {}
+        self.round_trips = 0
+
+    def rpc(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollection:
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = FakeCollection(self, name)
+            return self.collections[name]
+
+    def get_all(self, references: Iterable[FakeDocumentReference], *args, **kwargs):
+        self.rpc()
+        for reference in references:
+            yield reference.collection.snapshot(reference.id)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+
+# ============================
+# 🎵 SPOTIFY 🎵
+# ============================
+
+class FakeSpotify:
+    """Deterministic spotipy.Spotify replacement; accepts and ignores auth"""
+
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        self.latency = latency
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _features(track_id: str) -> Dict:
+        seed = sum(map(ord, track_id))
+        return {
+            "id": track_id,
+            "danceability": (seed % 100) / 100,
+            "energy": (seed * 7 % 100) / 100,
+            "valence": (seed * 13 % 100) / 100,
+            "tempo": 80 + seed % 80,
+            "instrumentalness": (seed * 3 % 100) / 100,
+        }
+
+    def current_user(self):
+        self._call()
+        return {"id": "fake_user", "display_name": "Fake User", "images": []}
+
+    def current_user_top_artists(self, limit=20, **kwargs):
+        self._call()
+        return {"items": [
+            {"id": f"artist{i}", "name": f"Artist {i}", "genres": [f"genre {i % 4}"]}
+            for i in range(limit)
+        ]}
+
+    def current_user_top_tracks(self, limit=20, **kwargs):
+        self._call()
+        return {"items": [{"id": f"track{i}", "name": f"Track {i}"} for i in range(limit)]}
+
+    def current_user_recently_played(self, limit=50, **kwargs):
+        self._call()
+        return {"items": [{"track": {"id": f"recent{i}", "name": f"Recent {i}"}} for i in range(limit)]}
+
+    def audio_features(self, tracks=None):
+        self._call()
+        return [self._features(track_id) for track_id in tracks or []]
+
+
+# ============================
+# 🎵 ANTHROPIC 🎵
+# ============================
+
+class _FakeText:
+    def __init__(self, text: str):
+        self.type = "text"
+        self.text = text
+
+
+class _FakeMessage:
+    def __init__(self, text: str):
+        self.content = [_FakeText(text)]
+
+
+class _FakeMessages:
+    def __init__(self, owner: "FakeAnthropic"):
+        self.owner = owner
+
+    def create(self, **kwargs) -> _FakeMessage:
+        if self.owner.latency:
+            time.sleep(self.owner.latency)
+        return _FakeMessage(self.owner.reply)
+
+
+class FakeAnthropic:
+    """Anthropic client replacement returning a canned reply"""
+
+    def __init__(self, *args, reply: str = "A fake personality bio.", latency: float = 0.0, **kwargs):
+        self.reply = reply
+        self.latency = latency
+        self.messages = _FakeMessages(self)
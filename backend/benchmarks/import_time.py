@@ -0,0 +1,83 @@
+"""
+Import-time budget for the app: how long a fresh worker spends importing
+app.main before it can serve. Each run is a clean interpreter with no
+credentials in the environment, so it also checks that the app still starts
+when secrets are missing. Run from backend/:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 800 --runs 7
+
+Exits 1 when the median import time is over budget and lists the slowest
+top-level imports from `python -X importtime`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = 1500.0
+MODULE = "app.main"
+
+
+def clean_env() -> Dict[str, str]:
+    """Environment of a worker that has not been given any credentials"""
+    env = {name: os.environ[name] for name in ("PATH", "HOME", "SYSTEMROOT") if name in os.environ}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def time_import(module: str) -> float:
+    """Seconds for a fresh interpreter to import `module` (minus bare interpreter startup)"""
+    def run(code: str) -> float:
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=clean_env(), check=True)
+        return time.perf_counter() - started
+    return run(f"import {module}") - run("pass")
+
+
+def slowest_imports(module: str, count: int) -> List[Tuple[float, str]]:
+    """(cumulative ms, name) of the slowest imports, with children folded into their parent"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=clean_env(), capture_output=True, text=True, check=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Report packages up to two levels below the root import
+        if len(name) - len(name.lstrip()) <= 5:
+            timings.append((int(cumulative) / 1000, name.strip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=MODULE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="number of slow imports to list")
+    args = parser.parse_args(argv)
+
+    samples = [time_import(args.module) * 1000 for _ in range(args.runs)]
+    median = statistics.median(samples)
+    print(f"import {args.module}: median {median:.0f}ms over {args.runs} runs "
+          f"(min {min(samples):.0f}ms, max {max(samples):.0f}ms), budget {args.budget_ms:.0f}ms")
+
+    print("slowest imports (cumulative ms):")
+    for elapsed, name in slowest_imports(args.module, args.top):
+        print(f"  {elapsed:>8.1f}  {name}")
+
+    if median > args.budget_ms:
+        print(f"OVER BUDGET by {median - args.budget_ms:.0f}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
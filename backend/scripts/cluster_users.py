@@ -0,0 +1,52 @@
+# scripts/cluster_users.py
+"""
+Offline k-means over every user's audio features and genres.
+
+Writes the centroid table and each user's cluster id to CLUSTER_TABLE_PATH
+(or --output), which API workers pick up on their next population refresh
+and use to score only a user's nearest clusters. Users who sign up in
+between join their nearest existing cluster, so run this often enough to
+keep clusters balanced, e.g. nightly from cron. Run from backend/:
+
+    python -m scripts.cluster_users --output /var/lib/flirtify/clusters.npz
+    python -m scripts.cluster_users --output clusters.npz --clusters 500
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.matching.clusters import CLUSTER_GENRE_DIMS, CLUSTER_TABLE_PATH, fit_clusters
+from app.matching.population import load_population
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=CLUSTER_TABLE_PATH or None, help="cluster table (.npz) to write")
+    parser.add_argument("--clusters", type=int, default=None, help="number of clusters (default: one per CLUSTER_SIZE users)")
+    parser.add_argument("--genres", type=int, default=CLUSTER_GENRE_DIMS, help="most common genres used as dimensions")
+    parser.add_argument("--iterations", type=int, default=20, help="k-means iterations")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if not args.output:
+        parser.error("set --output or CLUSTER_TABLE_PATH")
+
+    started = time.perf_counter()
+    population = load_population()
+    print(f"Loaded {len(population)} users in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    table = fit_clusters(population, args.clusters, args.genres, args.iterations, args.seed)
+    sizes = np.bincount(table.labels, minlength=len(table))
+    print(f"Fitted {len(table)} clusters over {len(table.genres)} genres in {time.perf_counter() - started:.1f}s")
+    if len(sizes):
+        print(f"Cluster sizes: min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}")
+
+    table.save(args.output)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
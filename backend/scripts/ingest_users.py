@@ -0,0 +1,68 @@
+# scripts/ingest_users.py
+"""
+Bulk-load user profiles into Firestore, or generate a synthetic population.
+
+Run from backend/ so the app package is importable:
+
+    # Load an NDJSON file (one profile with an "id" per line)
+    python -m scripts.ingest_users --file profiles.ndjson
+
+    # Generate and load a million Zipf-distributed profiles
+    python -m scripts.ingest_users --generate 1000000 --seed 42
+
+    # Generate to a file instead of Firestore
+    python -m scripts.ingest_users --generate 1000000 --output staging.ndjson
+"""
+import argparse
+import json
+import sys
+import time
+
+from app.services.ingest import FIRESTORE_BATCH_SIZE, INGEST_PARALLELISM, ingest_profiles, parse_ndjson
+from app.services.synthetic import generate_profiles
+
+
+def generated_records(count: int, seed: int):
+    for line_number, (user_id, profile) in enumerate(generate_profiles(count, seed), start=1):
+        yield line_number, dict(profile, id=user_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="NDJSON file of profiles ('-' for stdin)")
+    source.add_argument("--generate", type=int, metavar="COUNT", help="generate COUNT synthetic profiles")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --generate")
+    parser.add_argument("--output", help="write generated profiles as NDJSON instead of to Firestore")
+    parser.add_argument("--batch-size", type=int, default=FIRESTORE_BATCH_SIZE)
+    parser.add_argument("--parallelism", type=int, default=INGEST_PARALLELISM)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+
+    if args.output:
+        if not args.generate:
+            parser.error("--output only applies to --generate")
+        with open(args.output, "w") as f:
+            for _, record in generated_records(args.generate, args.seed):
+                f.write(json.dumps(record) + "\n")
+        print(f"Wrote {args.generate} profiles to {args.output} in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    if args.generate:
+        report = ingest_profiles(generated_records(args.generate, args.seed), args.batch_size, args.parallelism)
+    else:
+        f = sys.stdin if args.file == "-" else open(args.file)
+        with f:
+            report = ingest_profiles(parse_ndjson(f), args.batch_size, args.parallelism)
+
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {report['written']} profiles in {report['batches']} batches "
+          f"({report['written'] / elapsed:.0f}/s), {report['failed']} failed")
+    for error in report["errors"]:
+        print(f"  {error}")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# scripts/refresh_profiles.py
+"""
+Refresh every connected user's Spotify data under a global rate limit.
+
+Run from backend/ as a standalone worker (instead of SPOTIFY_REFRESH_ENABLED=1
+in the app):
+
+    # Keep refreshing forever, one pass per interval
+    python -m scripts.refresh_profiles
+
+    # One pass, resuming from the last checkpoint if a previous run stopped
+    python -m scripts.refresh_profiles --once --rate 10 --concurrency 8
+"""
+import argparse
+import signal
+import sys
+
+from app.services.refresher import (
+    SPOTIFY_REFRESH_BURST,
+    SPOTIFY_REFRESH_CONCURRENCY,
+    SPOTIFY_REFRESH_INTERVAL_SECONDS,
+    SPOTIFY_REFRESH_MAX_AGE_SECONDS,
+    SPOTIFY_REFRESH_RATE,
+    SpotifyRefresher,
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    parser.add_argument("--rate", type=float, default=SPOTIFY_REFRESH_RATE, help="Spotify requests per second")
+    parser.add_argument("--burst", type=float, default=SPOTIFY_REFRESH_BURST)
+    parser.add_argument("--concurrency", type=int, default=SPOTIFY_REFRESH_CONCURRENCY)
+    parser.add_argument("--max-age", type=float, default=SPOTIFY_REFRESH_MAX_AGE_SECONDS,
+                        help="skip profiles synced less than this many seconds ago")
+    parser.add_argument("--interval", type=float, default=SPOTIFY_REFRESH_INTERVAL_SECONDS,
+                        help="seconds between passes")
+    args = parser.parse_args(argv)
+
+    refresher = SpotifyRefresher(args.rate, args.burst, args.concurrency, args.max_age)
+    # Finish the in-flight page, then exit; the next run resumes from the checkpoint
+    signal.signal(signal.SIGTERM, lambda *_: refresher.stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: refresher.stop_event.set())
+
+    if args.once:
+        totals = refresher.run_pass()
+        print(f"{totals['refreshed']} refreshed, {totals['skipped']} skipped, {totals['failed']} failed")
+        return 1 if totals["failed"] else 0
+    refresher.run_forever(args.interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# scripts/score_population.py
+"""
+Nightly all-pairs pass: every user's top-K matches, scored on every core.
+
+The population is streamed from Firestore once, placed in shared memory and
+scored by a process pool. Results go to one `candidates` document per user
+(or to an NDJSON file). Run from backend/:
+
+    python -m scripts.score_population --k 50
+    python -m scripts.score_population --k 50 --workers 8 --output candidates.ndjson
+    python -m scripts.score_population --users alice,bob
+"""
+import argparse
+import json
+import sys
+import time
+
+from app.database import db, server_timestamp
+from app.matching import ParallelScorer
+from app.matching.population import load_population
+from app.metrics import timed
+from app.routes.match import FlirtifyMatcher
+from app.services.match_store import FIRESTORE_BATCH_SIZE
+
+CANDIDATES_COLLECTION = "candidates"
+
+
+def candidate_list(matches):
+    return [{"user_id": other, "score": score} for other, score in matches]
+
+
+def write_candidates(results, batch_size: int = FIRESTORE_BATCH_SIZE):
+    """Write {user_id: [(user_id, score)]} as one candidates document per user"""
+    candidates = db.collection(CANDIDATES_COLLECTION)
+    batch, ops = db.batch(), 0
+    scored_at = server_timestamp()
+    for user_id, matches in results:
+        batch.set(candidates.document(user_id), {"matches": candidate_list(matches), "scored_at": scored_at})
+        ops += 1
+        if ops == batch_size:
+            with timed("firestore"):
+                batch.commit()
+            batch, ops = db.batch(), 0
+    if ops:
+        with timed("firestore"):
+            batch.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=50, help="matches kept per user")
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: every core)")
+    parser.add_argument("--users", help="comma-separated user ids to score instead of everyone")
+    parser.add_argument("--output", help="write NDJSON here instead of to Firestore")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    population = load_population()
+    print(f"Loaded {len(population)} users in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    options = {} if args.workers is None else {"workers": args.workers}
+    with ParallelScorer(population, FlirtifyMatcher().weights, **options) as scorer:
+        if args.users:
+            top = scorer.top_k(args.users.split(","), args.k)
+        else:
+            rows, scores = scorer.all_top_k(args.k)
+            user_ids = population.user_ids
+            top = {
+                user_ids[row]: [(user_ids[other], float(score)) for other, score in zip(others, row_scores)]
+                for row, (others, row_scores) in enumerate(zip(rows, scores))
+            }
+    elapsed = time.perf_counter() - started
+    print(f"Scored {len(top)} users in {elapsed:.1f}s ({len(top) / max(elapsed, 1e-9):.0f}/s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for user_id, matches in top.items():
+                f.write(json.dumps({"id": user_id, "matches": candidate_list(matches)}) + "\n")
+    else:
+        write_candidates(top.items())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
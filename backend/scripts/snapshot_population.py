@@ -0,0 +1,40 @@
+# scripts/snapshot_population.py
+"""
+Write a fresh population snapshot for workers to memory-map at startup.
+
+Streams every user from Firestore once and makes the result the current
+snapshot in POPULATION_SNAPSHOT_DIR (or --dir). Workers replay the delta log
+on top of it, so run this often enough to keep that log short, e.g. hourly
+from cron. Run from backend/:
+
+    python -m scripts.snapshot_population --dir /var/lib/flirtify/snapshots
+"""
+import argparse
+import sys
+import time
+
+from app.matching.population import POPULATION_SNAPSHOT_DIR, stream_population
+from app.matching.snapshot import snapshot_lock, write_snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=POPULATION_SNAPSHOT_DIR or None, help="snapshot directory")
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("set --dir or POPULATION_SNAPSHOT_DIR")
+
+    with snapshot_lock(args.dir):
+        taken_at = time.time_ns()
+        started = time.perf_counter()
+        population = stream_population()
+        print(f"Loaded {len(population)} users in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        name = write_snapshot(population, args.dir, taken_at)
+        print(f"Wrote snapshot {name} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
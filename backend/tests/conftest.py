@@ -0,0 +1,35 @@
+"""
+Unit tests run against the in-memory fakes the benchmarks use, so they need
+no credentials. Run from backend/:
+
+    python -m pytest
+"""
+import pytest
+
+from benchmarks.bench import install_fakes
+
+# The app reads its settings at import time, so the fakes go in first
+install_fakes()
+
+
+@pytest.fixture
+def fake_db():
+    """A fresh, empty fake Firestore, with everything cached from the last one dropped"""
+    from app.database import profile_cache
+    from app.matching import inverted, population
+
+    fake = install_fakes()
+    profile_cache.clear()
+    population._population = None
+    # Its profile listener re-reads written profiles in the background
+    inverted._item_index = None
+    return fake
+
+
+@pytest.fixture
+def client(fake_db):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    return TestClient(app)
@@ -0,0 +1,50 @@
+from benchmarks.fakes import FakeAnthropic
+
+from app.database import get_user_profile, save_user_profile
+from app.main import app
+from app.routes import ai_claude
+from app.routes.ai_claude import BIOS_COLLECTION, bio_hash
+
+
+def _reply_with(monkeypatch, reply: str):
+    monkeypatch.setitem(app.dependency_overrides, ai_claude.get_anthropic, lambda: FakeAnthropic(reply=reply))
+
+
+def test_add_test_user_is_readable(client):
+    response = client.post("/ai/add-test-user", params={"user_id": "tester"})
+    assert response.status_code == 200
+
+    user = client.get("/users/users/tester").json()
+    assert user["top_artists"] == response.json()["data"]["top_artists"]
+    assert user["audio_features"]["tempo"] == 120
+
+
+def test_bio_is_generated_once_per_input(client, fake_db, monkeypatch):
+    save_user_profile("alice", {"top_artists": ["Drake"], "audio_features": {"energy": 0.5}})
+    _reply_with(monkeypatch, "First bio.")
+    assert client.get("/ai/claude-personality-bio", params={"user_id": "alice"}).json() == {
+        "personality_bio": "First bio."}
+
+    profile = get_user_profile("alice")
+    assert profile["claude_personality_bio"] == "First bio."
+    assert fake_db.collection(BIOS_COLLECTION).snapshot(bio_hash(profile)).to_dict() == {"bio": "First bio."}
+
+    # Same inputs: served from the cache, not generated again
+    _reply_with(monkeypatch, "Second bio.")
+    save_user_profile("bob", {"top_artists": ["Drake"], "audio_features": {"energy": 0.5}})
+    for user_id in ("alice", "bob"):
+        response = client.get("/ai/claude-personality-bio", params={"user_id": user_id})
+        assert response.json()["personality_bio"] == "First bio."
+
+    # Changed inputs: a new bio
+    save_user_profile("alice", {"top_artists": ["Adele"]}, merge=True)
+    response = client.get("/ai/claude-personality-bio", params={"user_id": "alice"})
+    assert response.json()["personality_bio"] == "Second bio."
+
+
+def test_empty_cached_bio_is_regenerated(client, fake_db):
+    save_user_profile("bob", {"top_artists": ["Drake"]})
+    fake_db.collection(BIOS_COLLECTION).write(bio_hash(get_user_profile("bob")), {"bio": ""})
+
+    response = client.get("/ai/claude-personality-bio", params={"user_id": "bob"})
+    assert response.json()["personality_bio"]
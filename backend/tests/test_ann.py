@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from app.database import save_user_profile
+from app.matching import AudioIndex
+from app.matching.profile import profile_audio
+from app.routes.match import cosine_similarity
+from app.services.synthetic import generate_profiles
+
+
+def _index(n=50, dims=5, seed=0):
+    rng = np.random.default_rng(seed)
+    user_ids = [f"u{i}" for i in range(n)]
+    return AudioIndex(user_ids, rng.random((n, dims)), n_lists=4, probes=4), rng
+
+
+def _check_bookkeeping(index: AudioIndex):
+    # Every indexed user sits exactly once in the list and slot its handle points at
+    seen = set()
+    for cell, inverted in enumerate(index.lists):
+        for slot, handle in enumerate(inverted.handles[:inverted.size]):
+            assert index._cell_of[handle] == cell
+            assert index._slot_of[handle] == slot
+            seen.add(index._user_ids[handle])
+    assert seen == set(index._handle_of)
+
+
+def test_exact_match_with_every_list_probed():
+    index, rng = _index()
+    vector = rng.random(5)
+    index.upsert("query", vector)
+    assert index.search(vector, 1)[0][0] == "query"
+    assert all(user_id != "query" for user_id, _ in index.search(vector, 5, exclude="query"))
+
+
+def test_remove_swaps_the_last_slot_in():
+    index, _ = _index()
+    for user_id in ("u3", "u10", "u11", "u49"):
+        index.remove(user_id)
+        assert user_id not in index
+        _check_bookkeeping(index)
+    assert len(index) == 46
+
+
+def test_upsert_moves_and_reuses_handles():
+    index, rng = _index()
+    index.remove("u0")
+    index.upsert("new", rng.random(5))
+    assert index._handle_of["new"] == 0  # The freed handle is reused
+    for i in range(1, 20):
+        index.upsert(f"u{i}", rng.random(5))
+    _check_bookkeeping(index)
+    assert len(index) == 50
+
+    index.upsert("u1", np.zeros(5))  # No audio: dropped from the index
+    assert "u1" not in index
+    _check_bookkeeping(index)
+
+
+def test_upserts_grow_lists_and_handles():
+    index, rng = _index(n=4)
+    for i in range(100):
+        index.upsert(f"extra{i}", rng.random(5))
+    _check_bookkeeping(index)
+    assert len(index) == 104
+    assert len(index.search(rng.random(5), 200)) == 104
+
+
+def test_users_without_audio_are_not_indexed():
+    vectors = np.array([[1, 0, 0], [0, 0, 0], [0, 1, 0]], dtype=np.float32)
+    index = AudioIndex(["a", "b", "c"], vectors)
+    assert "b" not in index and len(index) == 2
+    assert [user_id for user_id, _ in index.search([1, 0, 0], 3)] == ["a", "c"]
+
+
+def test_audio_neighbors_route_with_every_list_probed(client, fake_db):
+    profiles = dict(generate_profiles(60, seed=23))
+    for user_id, profile in profiles.items():
+        save_user_profile(user_id, profile)
+    user_id = "synthetic_23_0"
+
+    def exact(query_id, candidates):
+        query = profile_audio(candidates[query_id])
+        similarity = {other: float(cosine_similarity(query, profile_audio(profile))[0, 0])
+                      for other, profile in candidates.items() if other != query_id}
+        return sorted(similarity.items(), key=lambda item: -item[1])[:5]
+
+    params = {"user_id": user_id, "k": 5, "probes": 1024}
+    neighbors = client.get("/match/audio-neighbors", params=params).json()
+    expected = exact(user_id, profiles)
+    assert [n["user_id"] for n in neighbors] == [other for other, _ in expected]
+    assert [n["audio_similarity"] for n in neighbors] == pytest.approx([s for _, s in expected], abs=1e-4)
+
+    # A profile written since the index was built is upserted into it
+    twin = dict(profiles["synthetic_23_1"], audio_features=profiles[user_id]["audio_features"])
+    save_user_profile("twin", twin)
+    neighbors = client.get("/match/audio-neighbors", params=params).json()
+    assert neighbors[0]["user_id"] == "twin"
+    assert neighbors[0]["audio_similarity"] == pytest.approx(1.0, abs=1e-4)
+
+    assert client.get("/match/audio-neighbors", params={"user_id": "nobody"}).status_code == 404
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from app.database import get_user_profile, save_user_profile
+from app.main import app
+from app.routes import ai_claude
+from app.routes.ai_claude import BIOS_COLLECTION, bio_hash
+
+
+class _FakeStream:
+    def __init__(self, chunks, fail):
+        self.chunks = chunks
+        self.fail = fail
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.fail:
+            raise RuntimeError("overloaded")
+
+
+class FakeAsyncAnthropic:
+    """AsyncAnthropic stand-in streaming canned chunks, optionally failing after them"""
+
+    def __init__(self, chunks=("A ", "streamed ", "bio."), fail=False):
+        self.calls = 0
+        self.messages = self
+        self.chunks = chunks
+        self.fail = fail
+
+    def stream(self, **kwargs):
+        self.calls += 1
+        return _FakeStream(self.chunks, self.fail)
+
+
+@pytest.fixture
+def anthropic(monkeypatch):
+    fake = FakeAsyncAnthropic()
+    monkeypatch.setitem(app.dependency_overrides, ai_claude.get_async_anthropic, lambda: fake)
+    return fake
+
+
+def _events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_tokens_then_saves_the_bio(client, fake_db, anthropic):
+    save_user_profile("alice", {"top_artists": ["Drake"]})
+    response = client.get("/ai/claude-personality-bio/stream", params={"user_id": "alice"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _events(response)
+    assert [data["text"] for event, data in events if event == "token"] == ["A ", "streamed ", "bio."]
+    assert events[-1] == ("done", {"personality_bio": "A streamed bio."})
+
+    profile = get_user_profile("alice")
+    assert profile["claude_personality_bio"] == "A streamed bio."
+    assert fake_db.collection(BIOS_COLLECTION).snapshot(bio_hash(profile)).to_dict() == {"bio": "A streamed bio."}
+
+
+def test_stream_and_plain_requests_share_saved_bios(client, fake_db, anthropic):
+    save_user_profile("alice", {"top_artists": ["Drake"]})
+    save_user_profile("bob", {"top_artists": ["Drake"]})
+    client.get("/ai/claude-personality-bio/stream", params={"user_id": "alice"})
+
+    # Same inputs: the streamed bio is reused by both endpoints without calling Claude again
+    events = _events(client.get("/ai/claude-personality-bio/stream", params={"user_id": "bob"}))
+    assert events == [("token", {"text": "A streamed bio."}), ("done", {"personality_bio": "A streamed bio."})]
+    plain = client.get("/ai/claude-personality-bio", params={"user_id": "bob"}).json()
+    assert plain == {"personality_bio": "A streamed bio."}
+    assert anthropic.calls == 1
+
+
+def test_stream_failure_is_an_error_event(client, fake_db, monkeypatch):
+    failing = FakeAsyncAnthropic(chunks=("Half",), fail=True)
+    monkeypatch.setitem(app.dependency_overrides, ai_claude.get_async_anthropic, lambda: failing)
+    save_user_profile("alice", {"top_artists": ["Drake"]})
+
+    events = _events(client.get("/ai/claude-personality-bio/stream", params={"user_id": "alice"}))
+    assert events[0] == ("token", {"text": "Half"})
+    assert events[-1][0] == "error"
+    assert "claude_personality_bio" not in get_user_profile("alice")
+
+
+def test_stream_unknown_user_is_404(client, fake_db, anthropic):
+    response = client.get("/ai/claude-personality-bio/stream", params={"user_id": "nobody"})
+    assert response.status_code == 404
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from app.database import save_user_profile
+from app.matching import population
+from app.routes.match import FlirtifyMatcher, matcher_data
+from app.services.synthetic import generate_profiles
+
+
+@pytest.fixture
+def profiles(fake_db):
+    profiles = dict(generate_profiles(60, seed=5))
+    for user_id, profile in profiles.items():
+        save_user_profile(user_id, profile)
+    return profiles
+
+
+def test_candidates_match_pairwise_scoring(client, profiles):
+    user_id = "synthetic_5_0"
+    response = client.get("/match/candidates", params={"user_id": user_id, "k": 10, "prefilter": False})
+    assert response.status_code == 200
+    candidates = response.json()
+    assert len(candidates) == 10
+    assert user_id not in {c["user_id"] for c in candidates}
+
+    matcher = FlirtifyMatcher()
+    query = matcher_data(profiles[user_id])
+    expected = {other: matcher.calculate_match(query, matcher_data(profile))
+                for other, profile in profiles.items() if other != user_id}
+    best = sorted(expected.values(), key=lambda m: -m["score"])[9]["score"]
+    for candidate in candidates:
+        match = expected[candidate["user_id"]]
+        assert candidate["match_score"] == pytest.approx(match["score"], abs=1e-3)
+        assert candidate["match_score"] >= best - 1e-3
+        assert sorted(candidate["shared_artists"]) == sorted(match["shared_artists"])
+    scores = [c["match_score"] for c in candidates]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_candidates_of_unknown_user_is_404(client, profiles):
+    assert client.get("/match/candidates", params={"user_id": "nobody"}).status_code == 404
+
+
+def test_k_larger_than_the_population(client, fake_db):
+    for user_id, profile in generate_profiles(3, seed=5):
+        save_user_profile(user_id, profile)
+    candidates = client.get("/match/candidates", params={"user_id": "synthetic_5_0", "k": 50}).json()
+    assert len(candidates) == 2
+
+
+def test_expired_population_is_served_while_rebuilt(profiles, monkeypatch):
+    first = population.get_population()
+    assert len(first) == 60
+
+    release = threading.Event()
+    built = threading.Event()
+    load = population.load_population
+
+    def slow_load():
+        release.wait(5)
+        rebuilt = load()
+        built.set()
+        return rebuilt
+
+    monkeypatch.setattr(population, "POPULATION_TTL_SECONDS", 0)
+    monkeypatch.setattr(population, "load_population", slow_load)
+    save_user_profile("newcomer", dict(profiles["synthetic_5_1"]))
+
+    # Stale but immediate, with a single rebuild running in the background
+    assert population.get_population() is first
+    assert population.get_population() is first
+    release.set()
+    assert built.wait(5)
+    for thread in threading.enumerate():
+        if thread.name == "population-refresh":
+            thread.join(5)
+    monkeypatch.setattr(population, "POPULATION_TTL_SECONDS", 300)
+    assert "newcomer" in population.get_population().row_of
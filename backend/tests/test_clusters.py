@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from app.database import save_user_profile
+from app.matching import clusters
+from app.matching.clusters import ClusterIndex, ClusterTable, fit_clusters
+from app.matching.population import Population
+from app.services.synthetic import generate_profiles
+
+
+@pytest.fixture
+def profiles():
+    return dict(generate_profiles(120, seed=25))
+
+
+@pytest.fixture
+def population(profiles):
+    return Population.from_profiles(profiles.items())
+
+
+def test_users_are_labeled_with_their_nearest_centroid(population):
+    table = fit_clusters(population, n_clusters=6)
+    assert len(table) == 6
+    assert table.user_ids == list(population.user_ids)
+    features = table.features(population, np.arange(len(population)))
+    assert np.array_equal(table.labels, np.argmax(features @ table.centroids.T, axis=1))
+
+
+def test_nearest_clusters_come_first(population, profiles):
+    table = fit_clusters(population, n_clusters=6)
+    query = profiles["synthetic_25_0"]
+    sims = table.centroids @ table.query_vector(query)
+    assert table.nearest(query, 3).tolist() == np.argsort(-sims, kind="stable")[:3].tolist()
+    assert len(table.nearest(query, 100)) == 6
+    assert len(table.nearest(query, 0)) == 0
+
+
+def test_candidate_rows_are_the_members_of_the_probed_clusters(population, profiles):
+    table = fit_clusters(population, n_clusters=6)
+    index = ClusterIndex(table, population)
+    query = profiles["synthetic_25_0"]
+
+    assert index.candidate_rows(query, 6).tolist() == list(range(len(population)))
+    nearest = table.nearest(query, 2)
+    rows = index.candidate_rows(query, 2)
+    assert set(index.labels[rows]) == set(nearest.tolist())
+    assert len(rows) == sum(len(index.members(cluster)) for cluster in nearest)
+
+
+def test_users_new_since_the_fit_join_their_nearest_cluster(population, profiles):
+    table = fit_clusters(population, n_clusters=6)
+    grown = Population.from_profiles(list(profiles.items()) + [("newcomer", profiles["synthetic_25_3"])])
+    index = ClusterIndex(table, grown)
+    new_row = grown.row_of["newcomer"]
+    assert index.labels[new_row] == table.label(grown, np.array([new_row]))[0]
+    assert np.array_equal(index.labels[:len(population)], table.labels)
+
+
+def test_save_and_load(population, tmp_path):
+    table = fit_clusters(population, n_clusters=4)
+    path = str(tmp_path / "clusters.npz")
+    table.save(path)
+    loaded = ClusterTable.load(path)
+    assert np.array_equal(loaded.centroids, table.centroids)
+    assert loaded.genres == table.genres
+    assert loaded.user_ids == table.user_ids
+    assert np.array_equal(loaded.labels, table.labels)
+
+
+def test_candidates_with_probes(client, fake_db, profiles, monkeypatch):
+    monkeypatch.setattr(clusters, "CLUSTER_SIZE", 20)
+    monkeypatch.setattr(clusters, "_cluster_table", None)
+    monkeypatch.setattr(clusters, "_cluster_index", None)
+    for user_id, profile in profiles.items():
+        save_user_profile(user_id, profile)
+    user_id = "synthetic_25_0"
+    params = {"user_id": user_id, "k": 5, "prefilter": False}
+
+    full = client.get("/match/candidates", params=dict(params, probes=0)).json()
+    every_cluster = client.get("/match/candidates", params=dict(params, probes=1024)).json()
+    assert [c["match_score"] for c in every_cluster] == pytest.approx([c["match_score"] for c in full], abs=1e-3)
+
+    index = clusters.get_cluster_index()
+    assert len(index.table) == 6
+    nearest = set(index.table.nearest(profiles[user_id], 1).tolist())
+    one_cluster = client.get("/match/candidates", params=dict(params, probes=1)).json()
+    assert one_cluster
+    for candidate in one_cluster:
+        assert index.labels[index.population.row_of[candidate["user_id"]]] in nearest
@@ -0,0 +1,50 @@
+from array import array
+
+import pytest
+
+from app.matching.profile import Interner, overlap, overlap_count
+from app.routes.match import FlirtifyMatcher, matcher_data, score_pair
+from app.services.synthetic import generate_profiles
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    return [profile for _, profile in generate_profiles(40, seed=11)]
+
+
+def test_compact_scores_equal_calculate_match(profiles):
+    matcher, interner = FlirtifyMatcher(), Interner()
+    compact = [interner.compact(profile) for profile in profiles]
+    for i in range(0, len(profiles), 3):
+        for j in range(1, len(profiles), 7):
+            expected = matcher.calculate_match(matcher_data(profiles[i]), matcher_data(profiles[j]))
+            result = matcher.calculate_compact(compact[i], compact[j], interner)
+            assert matcher.score_compact(compact[i], compact[j]) == pytest.approx(expected["score"], abs=1e-4)
+            assert result["score"] == pytest.approx(expected["score"], abs=1e-4)
+            assert result["strength"] == expected["strength"]
+            for kind in ("artists", "tracks", "genres"):
+                assert sorted(result[f"shared_{kind}"]) == sorted(expected[f"shared_{kind}"])
+
+
+def test_interner_shares_ids_and_names():
+    interner = Interner()
+    a = interner.compact({"top_artists": ["Drake", "Adele", "Drake"], "audio_features": {"danceability": 3, "energy": 4, "valence": 0}})
+    b = interner.compact({"top_artists": ["Adele", "Björk"]})
+    assert len(a.artists) == 2 and list(a.artists) == sorted(a.artists)
+    assert interner.names("artists", overlap(a.artists, b.artists)) == ["Adele"]
+    assert list(a.audio) == pytest.approx([0.6, 0.8, 0])  # Unit length
+    assert not b.audio.any()  # No audio features
+
+
+def test_overlap_of_sorted_arrays():
+    a, b = array("i", [1, 3, 5, 9]), array("i", [2, 3, 9, 10])
+    assert overlap(a, b) == [3, 9]
+    assert overlap_count(a, b) == 2
+    assert overlap_count(a, array("i")) == 0
+
+
+def test_score_pair_returns_a_storable_result(profiles):
+    result = score_pair(profiles[0], profiles[1])
+    expected = FlirtifyMatcher().calculate_match(matcher_data(profiles[0]), matcher_data(profiles[1]))
+    assert result["score"] == pytest.approx(expected["score"], abs=1e-4)
+    assert result["strength"] == expected["strength"].value
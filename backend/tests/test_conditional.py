@@ -0,0 +1,74 @@
+from app.database import save_user_profile
+from app.services.synthetic import generate_profiles
+
+
+def _save_users(count=2):
+    user_ids = []
+    for user_id, profile in generate_profiles(count, seed=3):
+        save_user_profile(user_id, profile)
+        user_ids.append(user_id)
+    return user_ids
+
+
+def _revalidate(client, method, url, etag, **kwargs):
+    return client.request(method, url, headers={"If-None-Match": etag}, **kwargs)
+
+
+def test_profile_304_until_the_profile_changes(client, fake_db):
+    (user_id,) = _save_users(1)
+    url = f"/users/users/{user_id}"
+    first = client.get(url)
+    etag = first.headers["etag"]
+
+    response = _revalidate(client, "GET", url, etag)
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    save_user_profile(user_id, {"username": "Renamed"}, merge=True)
+    response = _revalidate(client, "GET", url, etag)
+    assert response.status_code == 200
+    assert response.json()["username"] == "Renamed"
+    assert response.headers["etag"] != etag
+
+
+def test_bio_write_changes_the_profile_etag(client, fake_db):
+    (user_id,) = _save_users(1)
+    url = f"/users/users/{user_id}"
+    etag = client.get(url).headers["etag"]
+
+    bio = client.get("/ai/claude-personality-bio", params={"user_id": user_id}).json()["personality_bio"]
+    response = _revalidate(client, "GET", url, etag)
+    assert response.status_code == 200
+    assert response.json()["claude_personality_bio"] == bio
+
+    assert _revalidate(client, "GET", url, response.headers["etag"]).status_code == 304
+
+
+def test_match_304_until_either_profile_changes(client, fake_db):
+    user1, user2 = _save_users(2)
+    body = {"user1_spotify_id": user1, "user2_spotify_id": user2}
+    first = client.post("/match/match", json=body)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    # The pair in either order shares the ETag
+    swapped = {"user1_spotify_id": user2, "user2_spotify_id": user1}
+    assert _revalidate(client, "POST", "/match/match", etag, json=swapped).status_code == 304
+
+    # Bios don't affect matching, so they don't invalidate match results
+    client.get("/ai/claude-personality-bio", params={"user_id": user1})
+    assert _revalidate(client, "POST", "/match/match", etag, json=body).status_code == 304
+
+    save_user_profile(user2, {"top_artists": ["Someone Else"]}, merge=True)
+    response = _revalidate(client, "POST", "/match/match", etag, json=body)
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_tfidf_matches_carry_no_etag(client, fake_db):
+    user1, user2 = _save_users(2)
+    response = client.post("/match/match", params={"similarity": "tfidf"},
+                           json={"user1_spotify_id": user1, "user2_spotify_id": user2})
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert 0 <= response.json()["match_score"] <= 100
@@ -0,0 +1,74 @@
+from app.database import (
+    ProfileCache, get_user_profile, get_user_profiles, profile_cache, save_user_profile,
+)
+
+
+def test_save_drops_the_cached_profile(fake_db):
+    save_user_profile("alice", {"name": "Alice"})
+    assert get_user_profile("alice")["name"] == "Alice"
+
+    save_user_profile("alice", {"name": "Alicia"}, merge=True)
+    assert get_user_profile("alice")["name"] == "Alicia"
+
+
+def test_missing_profiles_are_cached_as_none(fake_db):
+    assert get_user_profile("nobody") is None
+    assert profile_cache.get("nobody") is None
+
+    save_user_profile("nobody", {"name": "Somebody"})
+    assert get_user_profile("nobody")["name"] == "Somebody"
+
+
+def test_batch_reads_fill_the_cache(fake_db):
+    save_user_profile("alice", {"name": "Alice"})
+    save_user_profile("bob", {"name": "Bob"})
+    round_trips = fake_db.round_trips
+    profiles = get_user_profiles(["alice", "nobody", "alice", "bob"])
+    assert fake_db.round_trips == round_trips + 1  # One get_all for every miss
+    assert profiles["alice"]["name"] == "Alice"
+    assert profiles["nobody"] is None
+
+    save_user_profile("alice", {"name": "Alicia"}, merge=True)
+    assert get_user_profiles(["alice"])["alice"]["name"] == "Alicia"
+
+
+def test_cached_reads_skip_firestore(fake_db):
+    save_user_profile("alice", {"name": "Alice"})
+    get_user_profile("alice")
+    round_trips = fake_db.round_trips
+    profile = get_user_profile("alice")
+    assert fake_db.round_trips == round_trips
+
+    profile["name"] = "Mutated"  # Callers get copies
+    assert get_user_profile("alice")["name"] == "Alice"
+
+
+def test_read_racing_an_invalidation_is_not_cached():
+    cache = ProfileCache(maxsize=10, ttl=60)
+    token = cache.token()
+    cache.invalidate("alice")  # Written while the old copy was being read
+    cache.put("alice", {"name": "Old"}, token)
+    assert cache.get("alice", None) is None
+
+    cache.put("alice", {"name": "New"}, cache.token())
+    assert cache.get("alice") == {"name": "New"}
+
+
+def test_forgotten_invalidations_still_block_stale_reads():
+    cache = ProfileCache(maxsize=1, ttl=60)
+    token = cache.token()
+    cache.invalidate("alice")
+    cache.invalidate("bob")  # Pushes alice out of the remembered invalidations
+    cache.put("alice", {"name": "Old"}, token)
+    assert cache.get("alice", None) is None
+
+
+def test_lru_eviction():
+    cache = ProfileCache(maxsize=2, ttl=60)
+    cache.put("a", {})
+    cache.put("b", {})
+    cache.get("a")
+    cache.put("c", {})
+    assert cache.get("b", None) is None
+    assert cache.get("a") == {} and cache.get("c") == {}
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,61 @@
+import json
+
+from app.database import get_user_profile, save_user_profile
+from app.services import ingest
+from app.services.ingest import ingest_profiles
+from app.services.synthetic import generate_profiles
+
+
+def _ndjson(profiles):
+    return "\n".join(json.dumps(dict(profile, id=user_id)) for user_id, profile in profiles)
+
+
+def test_ndjson_ingest_writes_batches_of_500(client, fake_db):
+    profiles = list(generate_profiles(1200, seed=7))
+    lines = _ndjson(profiles).split("\n")
+    lines[10:10] = ["{not json", "", json.dumps({"username": "no id"})]
+    response = client.post("/users/bulk", content="\n".join(lines), headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+
+    report = response.json()
+    assert (report["written"], report["failed"], report["batches"]) == (1200, 2, 3)
+    assert [error["line"] for error in report["errors"]] == [11, 13]
+    user_id, profile = profiles[-1]
+    stored = get_user_profile(user_id)
+    assert stored["top_artists"] == profile["top_artists"]
+    assert stored["version"] is not None
+
+
+def test_json_array_ingest_replaces_cached_profiles(client, fake_db):
+    save_user_profile("alice", {"username": "Old"})
+    get_user_profile("alice")
+    response = client.post("/users/bulk", json=[{"id": "alice", "username": "New"}, 42])
+    assert response.json()["written"] == 1
+    assert response.json()["errors"] == [{"line": 2, "error": "Profile must be a JSON object"}]
+    assert get_user_profile("alice")["username"] == "New"
+
+
+def test_failed_batches_are_reported_per_profile(fake_db, monkeypatch):
+    write = ingest.write_profiles
+
+    def flaky(profiles):
+        if profiles[0][0] == "u5":
+            raise RuntimeError("deadline exceeded")
+        return write(profiles)
+
+    monkeypatch.setattr(ingest, "write_profiles", flaky)
+    report = ingest_profiles(((i, {"id": f"u{i}"}) for i in range(12)), batch_size=5, parallelism=2)
+    assert (report["written"], report["failed"], report["batches"]) == (7, 5, 2)
+    assert get_user_profile("u4") is not None and get_user_profile("u5") is None
+
+
+def test_generated_profiles_are_reproducible():
+    first = list(generate_profiles(50, seed=9))
+    assert first == list(generate_profiles(50, seed=9))
+    assert first != list(generate_profiles(50, seed=10))
+    user_ids = [user_id for user_id, _ in first]
+    assert len(set(user_ids)) == 50
+    for _, profile in first:
+        assert len(profile["top_artists"]) == len(set(profile["top_artists"]))
+        assert {"danceability", "energy", "valence"} <= set(profile["audio_features"])
+        assert 0 <= profile["audio_features"]["energy"] <= 1
@@ -0,0 +1,99 @@
+import pytest
+
+from app.database import save_user_profile
+from app.matching.inverted import ITEM_INDEX_COLLECTION, ItemIndex, item_doc_id, persist_postings
+from app.matching.population import Population
+from app.matching.profile import ITEM_FIELDS, profile_items
+from app.services.synthetic import generate_profiles
+
+WEIGHTS = {"artists": 3.0, "tracks": 2.0, "genres": 1.0}
+
+
+@pytest.fixture
+def profiles():
+    return dict(generate_profiles(100, seed=24))
+
+
+def _scan(profiles, kind, item):
+    return sorted(user_id for user_id, profile in profiles.items() if item in profile_items(profile, kind))
+
+
+def _shared_weight(profile, other):
+    return sum(weight * len(set(profile_items(profile, kind)) & set(profile_items(other, kind)))
+               for kind, weight in WEIGHTS.items())
+
+
+def test_postings_stay_exact_through_updates(profiles):
+    index = ItemIndex(Population.from_profiles(profiles.items()))
+    current = dict(profiles)
+    current["synthetic_24_1"] = dict(profiles["synthetic_24_2"], top_artists=["Brand New Artist"])
+    current["newcomer"] = profiles["synthetic_24_3"]
+    del current["synthetic_24_4"]
+    for user_id in ("synthetic_24_1", "newcomer", "synthetic_24_4"):
+        index.update(user_id, current.get(user_id))
+
+    for kind in ITEM_FIELDS:
+        items = {item for profile in profiles.values() for item in profile_items(profile, kind)}
+        for item in items | {"Brand New Artist"}:
+            assert sorted(index.posting(kind, item)) == _scan(current, kind, item), (kind, item)
+
+
+def test_candidate_rows_recall_every_user_sharing_an_item(profiles):
+    population = Population.from_profiles(profiles.items())
+    index = ItemIndex(population)
+    query = profiles["synthetic_24_0"]
+
+    rows = index.candidate_rows(query, WEIGHTS)
+    found = [population.user_ids[row] for row in rows]
+    expected = {user_id for user_id, profile in profiles.items() if _shared_weight(query, profile)}
+    assert set(found) == expected
+    weights = [_shared_weight(query, profiles[user_id]) for user_id in found]
+    assert weights == sorted(weights, reverse=True)
+
+    limited = index.candidate_rows(query, WEIGHTS, limit=5)
+    assert [_shared_weight(query, profiles[population.user_ids[row]]) for row in limited] == weights[:5]
+
+
+def test_items_over_the_cap_are_skipped(profiles):
+    popular = {"top_artists": [], "top_tracks": [], "top_genres": []}
+    crowd = {f"fan{i}": dict(popular, top_genres=["pop"]) for i in range(10)}
+    crowd["niche"] = dict(popular, top_genres=["pop", "zydeco"])
+    index = ItemIndex(Population.from_profiles(crowd.items()), cap=5)
+    query = dict(popular, top_genres=["pop", "zydeco"])
+    assert [index.population.user_ids[row] for row in index.candidate_rows(query, WEIGHTS)] == ["niche"]
+
+
+def test_candidates_include_users_added_since_the_build(profiles):
+    index = ItemIndex(Population.from_profiles(profiles.items()))
+    query = profiles["synthetic_24_0"]
+    index.update("twin", query)
+    index.update("synthetic_24_0", None)
+
+    candidates = dict(index.candidates(query, WEIGHTS))
+    assert candidates["twin"] == pytest.approx(_shared_weight(query, query))
+    assert "synthetic_24_0" not in candidates
+    # Without a population row they can't be scored by rank_candidates yet
+    rows = index.candidate_rows(query, WEIGHTS)
+    assert index.population.row_of["synthetic_24_0"] not in rows
+
+
+def test_popular_postings_are_persisted_without_user_ids(fake_db):
+    crowd = {f"fan{i}": {"top_artists": ["Everyone"] + (["Rare"] if i == 0 else [])} for i in range(4)}
+    index = ItemIndex(Population.from_profiles(crowd.items()), cap=2)
+    persist_postings(index, {"artists": {"Everyone", "Rare"}})
+
+    postings = fake_db.collection(ITEM_INDEX_COLLECTION)
+    everyone = postings.snapshot(item_doc_id("artists", "Everyone")).to_dict()
+    assert everyone["popular"] and everyone["count"] == 4 and everyone["user_ids"] == []
+    rare = postings.snapshot(item_doc_id("artists", "Rare")).to_dict()
+    assert not rare["popular"] and rare["user_ids"] == ["fan0"]
+
+
+def test_prefiltered_candidates_equal_a_full_scan(client, fake_db, profiles):
+    for user_id, profile in profiles.items():
+        save_user_profile(user_id, profile)
+    for user_id in ("synthetic_24_0", "synthetic_24_7", "synthetic_24_42"):
+        params = {"user_id": user_id, "k": 10, "probes": 0}
+        full = client.get("/match/candidates", params=dict(params, prefilter=False)).json()
+        prefiltered = client.get("/match/candidates", params=dict(params, prefilter=True)).json()
+        assert [c["match_score"] for c in prefiltered] == pytest.approx([c["match_score"] for c in full], abs=1e-3)
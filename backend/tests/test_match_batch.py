@@ -0,0 +1,55 @@
+import pytest
+
+from app.database import profile_cache, save_user_profile
+from app.routes.match import MAX_BATCH_PAIRS, match_store
+from app.services.synthetic import generate_profiles
+
+
+@pytest.fixture
+def user_ids(fake_db):
+    user_ids = []
+    for user_id, profile in generate_profiles(6, seed=12):
+        save_user_profile(user_id, profile)
+        user_ids.append(user_id)
+    match_store.shutdown()  # Let rescores queued by these writes finish
+    return user_ids
+
+
+def _pair(user1, user2):
+    return {"user1_spotify_id": user1, "user2_spotify_id": user2}
+
+
+def test_batch_results_equal_single_matches(client, user_ids):
+    pairs = [_pair(user_ids[0], other) for other in user_ids[1:]] + [_pair(user_ids[3], user_ids[4])]
+    response = client.post("/match/batch", json=pairs)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == len(pairs)
+    for pair, item in zip(pairs, results):
+        single = client.post("/match/match", json=pair).json()
+        assert item["error"] is None
+        assert item["result"]["match_score"] == pytest.approx(single["match_score"], abs=1e-4)
+        assert item["result"]["match_strength"] == single["match_strength"]
+        for kind in ("shared_artists", "shared_tracks", "shared_genres"):
+            assert sorted(item["result"][kind]) == sorted(single[kind])
+
+
+def test_missing_users_fail_only_their_own_items(client, user_ids):
+    pairs = [_pair(user_ids[0], "nobody"), _pair(user_ids[0], user_ids[1]), _pair("nobody", "ghost")]
+    results = client.post("/match/batch", json=pairs).json()["results"]
+    assert [item["error"] for item in results] == ["One or both users not found", None, "One or both users not found"]
+    assert results[1]["result"]["match_score"] > 0
+
+
+def test_each_user_is_read_once(client, fake_db, user_ids):
+    pairs = [_pair(a, b) for a in user_ids for b in user_ids if a != b]
+    profile_cache.clear()
+    round_trips = fake_db.round_trips
+    client.post("/match/batch", json=pairs)
+    assert fake_db.round_trips - round_trips == 1  # One get_all for every distinct user
+
+
+def test_oversized_and_empty_batches(client, user_ids):
+    pair = _pair(user_ids[0], user_ids[1])
+    assert client.post("/match/batch", json=[pair] * (MAX_BATCH_PAIRS + 1)).status_code == 413
+    assert client.post("/match/batch", json=[]).json() == {"results": []}
@@ -0,0 +1,56 @@
+import pytest
+
+from app.database import get_user_profile, profile_cache, save_user_profile
+from app.routes.match import match_store
+from app.services.match_store import MATCHES_COLLECTION, MatchStore, pair_id
+from app.services.synthetic import generate_profiles
+
+
+@pytest.fixture
+def users(fake_db):
+    user_ids = []
+    for user_id, profile in generate_profiles(3, seed=6):
+        save_user_profile(user_id, profile)
+        user_ids.append(user_id)
+    match_store.shutdown()  # Let rescores queued by these writes finish
+    return user_ids
+
+
+def test_rows_are_reused_while_both_profiles_are_unchanged(users):
+    scored = []
+    store = MatchStore(lambda a, b: scored.append(1) or {"score": len(scored)})
+    user1, user2, _ = users
+    profile1, profile2 = get_user_profile(user1), get_user_profile(user2)
+
+    assert store.get(user1, profile1, user2, profile2) == {"score": 1}
+    assert store.get(user2, profile2, user1, profile1) == {"score": 1}  # Same row either way round
+    assert len(scored) == 1
+
+    # A newer version of either profile makes the row stale. Saving through
+    # save_user_profile would also queue the app's own rescore of this row.
+    changed = dict(profile2, username="Changed", version=f"{profile2['version']}-changed")
+    assert store.get(user1, profile1, user2, changed) == {"score": 2}
+
+
+def test_profile_write_rescores_the_users_rows(client, fake_db, users):
+    user1, user2, user3 = users
+    for other in (user2, user3):
+        client.post("/match/match", json={"user1_spotify_id": user1, "user2_spotify_id": other})
+    matches = fake_db.collection(MATCHES_COLLECTION)
+
+    save_user_profile(user1, {"top_artists": ["Only Me"], "top_tracks": [], "top_genres": []}, merge=True)
+    match_store.shutdown()
+    version = get_user_profile(user1)["version"]
+    for other in (user2, user3):
+        row = matches.snapshot(pair_id(user1, other)).to_dict()
+        assert row["versions"][user1] == version
+        assert row["result"]["shared_artists"] == []
+
+
+def test_rows_of_deleted_users_are_dropped(client, fake_db, users):
+    user1, user2, _ = users
+    client.post("/match/match", json={"user1_spotify_id": user1, "user2_spotify_id": user2})
+    fake_db.collection("users").remove(user2)
+    profile_cache.invalidate(user2)
+    match_store.recompute_for(user1)
+    assert not fake_db.collection(MATCHES_COLLECTION).snapshot(pair_id(user1, user2)).exists
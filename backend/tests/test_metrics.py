@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from app.database import save_user_profile
+from app.metrics import BACKGROUND_ROUTE, request_duration, stage_duration, timed, timed_iter
+from app.services.synthetic import generate_profiles
+
+
+@pytest.fixture(autouse=True)
+def histograms():
+    request_duration.clear()
+    stage_duration.clear()
+
+
+def _stage_calls(route: str, stage: str) -> int:
+    series = stage_duration._series.get((route, stage))
+    return series[2] if series else 0
+
+
+def _server_timing(response):
+    stages = {}
+    for entry in response.headers["server-timing"].split(", "):
+        name, *params = entry.split(";")
+        stages[name] = dict(param.split("=", 1) for param in params)
+    return stages
+
+
+def _save_users(count):
+    user_ids = []
+    for user_id, profile in generate_profiles(count, seed=4):
+        save_user_profile(user_id, profile)
+        user_ids.append(user_id)
+    return user_ids
+
+
+def test_profile_reads_report_firestore_time(client, fake_db):
+    (user_id,) = _save_users(1)
+    response = client.get(f"/users/users/{user_id}")
+    assert "firestore" in _server_timing(response)
+    assert _stage_calls("/users/users/{user_id}", "firestore") == 1
+    assert request_duration._series[("/users/users/{user_id}", "GET", "200")][2] == 1
+
+
+def test_candidates_report_scoring_once_and_the_population_stream(client, fake_db):
+    user_ids = _save_users(30)
+    response = client.get("/match/candidates", params={"user_id": user_ids[0], "k": 5, "prefilter": False})
+    assert response.status_code == 200
+    stages = _server_timing(response)
+    # rank_candidates calls score_population: one scoring call, not two
+    assert stages["scoring"]["desc"] == '"1 calls"'
+    assert "firestore" in stages
+
+
+def test_batch_reports_scoring(client, fake_db):
+    user1, user2, user3 = _save_users(3)
+    response = client.post("/match/batch", json=[
+        {"user1_spotify_id": user1, "user2_spotify_id": user2},
+        {"user1_spotify_id": user1, "user2_spotify_id": user3},
+    ])
+    assert "scoring" in _server_timing(response)
+
+
+def test_streamed_responses_record_their_firestore_stream(client, fake_db):
+    _save_users(5)
+    response = client.get("/users/users", params={"format": "ndjson"})
+    assert len(response.text.splitlines()) == 5
+    assert _stage_calls("/users/users", "firestore") == 1
+
+
+def test_routes_are_labelled_with_their_full_path(client, fake_db):
+    client.get("/users/cache-stats")
+    client.get("/no/such/route")
+    exposed = client.get("/metrics").text
+    assert 'route="/users/cache-stats",method="GET",status="200"' in exposed
+    assert 'route="unmatched",method="GET",status="404"' in exposed
+
+
+def test_nested_blocks_of_a_stage_count_once():
+    with timed("scoring"):
+        with timed("scoring"):
+            pass
+        with timed("firestore"):
+            pass
+    assert _stage_calls(BACKGROUND_ROUTE, "scoring") == 1
+    assert _stage_calls(BACKGROUND_ROUTE, "firestore") == 1
+
+
+def test_timed_iter_counts_only_the_waits_for_items():
+    def slow_source():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    items = []
+    for item in timed_iter("firestore", slow_source()):
+        items.append(item)
+        time.sleep(0.05)  # Consumer time: not counted
+    assert items == [0, 1, 2]
+    _, seconds, calls = stage_duration._series[(BACKGROUND_ROUTE, "firestore")]
+    assert calls == 1
+    assert 0.03 <= seconds < 0.15
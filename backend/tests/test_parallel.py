@@ -0,0 +1,45 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from app.matching import ParallelScorer, Population
+from app.matching.parallel import top_k_block
+from app.routes.match import FlirtifyMatcher
+from app.services.synthetic import generate_profiles
+
+
+def test_parallel_scores_match_rank_candidates():
+    profiles = list(generate_profiles(200, seed=2))
+    population = Population.from_profiles(profiles)
+    matcher = FlirtifyMatcher()
+    queries = [user_id for user_id, _ in profiles[:12]]
+
+    with ParallelScorer(population, matcher.weights, workers=2, task_size=5) as scorer:
+        top = scorer.top_k(queries + ["unknown"], k=10)
+
+    assert list(top) == queries
+    by_id = dict(profiles)
+    for user_id in queries:
+        expected = matcher.rank_candidates(user_id, by_id[user_id], population, k=10)
+        got = top[user_id]
+        assert [m["user_id"] for m in expected] == [candidate for candidate, _ in got]
+        for match, (_, score) in zip(expected, got):
+            assert abs(match["score"] - score) < 1e-3
+
+
+def test_all_top_k_and_shared_memory_release():
+    population = Population.from_profiles(generate_profiles(40, seed=21))
+    with ParallelScorer(population, FlirtifyMatcher().weights, workers=2, task_size=7) as scorer:
+        name = scorer.shared.name
+        rows, scores = scorer.all_top_k(k=5)
+    assert rows.shape == scores.shape == (40, 5)
+    assert not (rows == np.arange(40)[:, np.newaxis]).any()  # Never a user's own row
+    assert (np.diff(scores, axis=1) <= 0).all()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_top_k_block_of_a_single_user():
+    rows, scores = top_k_block(np.ones((1, 1)), np.array([0]), k=10)
+    assert rows.shape == scores.shape == (1, 0)
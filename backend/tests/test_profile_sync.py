@@ -0,0 +1,69 @@
+import time
+
+import pytest
+from benchmarks.fakes import FakeSpotify
+
+from app.database import get_user_profile, save_user_profile
+from app.services import profile_sync
+from app.services.profile_sync import SYNC_RECENT_LIMIT, SYNC_TOP_LIMIT, aggregate_features, sync_profile
+from app.services.spotify_clients import spotify_clients
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Every profile write the sync makes"""
+    saves = []
+
+    def save(user_id, profile, merge=False):
+        saves.append((user_id, merge))
+        save_user_profile(user_id, profile, merge=merge)
+
+    monkeypatch.setattr(profile_sync, "save_user_profile", save)
+    return saves
+
+
+def test_sync_saves_the_whole_profile_in_one_write(client, fake_db, saves):
+    save_user_profile("alice", {"username": "Alice"})
+    spotify_clients.store("alice", {"access_token": "a", "refresh_token": "r", "expires_at": time.time() + 3600})
+
+    response = client.post("/users/alice/sync")
+    assert response.status_code == 200
+    synced = response.json()
+    assert "last_synced_at" not in synced
+    assert saves == [("alice", True)]
+
+    profile = get_user_profile("alice")
+    assert profile["username"] == "Alice"  # Merged into the existing profile
+    assert profile["last_synced_at"]
+    assert profile["top_artists"] == synced["top_artists"] == [f"Artist {i}" for i in range(SYNC_TOP_LIMIT)]
+    assert profile["top_genres"] == ["genre 0", "genre 1", "genre 2", "genre 3"]
+    assert profile["track_ids"] == [f"track{i}" for i in range(SYNC_TOP_LIMIT)]
+    assert len(profile["recent_tracks"]) == SYNC_RECENT_LIMIT
+    assert set(profile["track_audio_features"]) == set(profile["track_ids"])
+    energies = [FakeSpotify._features(track_id)["energy"] for track_id in profile["track_ids"]]
+    assert profile["audio_features"]["energy"] == pytest.approx(sum(energies) / len(energies))
+
+
+def test_sync_without_spotify_tokens(client, fake_db, saves):
+    save_user_profile("bob", {"username": "Bob"})
+    assert client.post("/users/bob/sync").status_code == 401
+    assert client.post("/users/nobody/sync").status_code == 404
+    assert saves == []
+
+
+def test_spotify_calls_run_concurrently(fake_db, saves):
+    latency = 0.1
+    started = time.perf_counter()
+    sync_profile("carol", FakeSpotify(latency=latency))
+    # Top artists and recent tracks overlap top tracks then their audio features
+    assert time.perf_counter() - started < 2.5 * latency
+    assert saves == [("carol", True)]
+
+
+def test_aggregate_features_skips_missing_values():
+    features = {
+        "t1": {"energy": 0.2, "valence": 0.4},
+        "t2": {"energy": 0.6, "valence": None},
+        "t3": None,
+    }
+    assert aggregate_features(features) == pytest.approx({"energy": 0.4, "valence": 0.4})
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+import pytest
+from benchmarks.fakes import FakeAnthropic
+
+from app import profiling
+from app.main import app
+from app.profiling import PROFILE_SUFFIX, _is_idle, write_profile
+from app.routes import ai_claude
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    """An admin token, and profiles written to a temporary PROFILE_DIR"""
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    monkeypatch.chdir(tmp_path)  # PROFILE_DIR is relative to the working directory
+    return tmp_path / profiling.PROFILE_DIR
+
+
+def _leaf_frame(thread: threading.Thread):
+    return sys._current_frames()[thread.ident]
+
+
+def test_threads_waiting_for_work_are_idle():
+    event = threading.Event()
+    waiting = threading.Thread(target=event.wait)
+    waiting.start()
+    try:
+        while not _is_idle(_leaf_frame(waiting)):
+            pass  # Until it is blocked in Condition.wait
+    finally:
+        event.set()
+        waiting.join()
+
+    def wait():
+        return sys._getframe()
+
+    # Same function name, but not the threading module's
+    assert not _is_idle(wait())
+
+
+def test_profile_endpoints_are_admin_only(client, profile_dir):
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiles", headers=ADMIN).json() == {"profiles": []}
+    assert client.get("/admin/profiles/missing.folded", headers=ADMIN).status_code == 404
+    assert client.get("/admin/profiles/..%2Fsecrets.folded", headers=ADMIN).status_code == 404
+
+
+def test_x_profile_writes_a_folded_profile(client, profile_dir, monkeypatch):
+    monkeypatch.setitem(app.dependency_overrides, ai_claude.get_anthropic, lambda: FakeAnthropic(latency=0.05))
+
+    # Without the admin token the header is ignored
+    client.get("/ai/test-claude", params={"prompt": "hi"}, headers={"X-Profile": "1"})
+    assert not profile_dir.exists()
+
+    response = client.get("/ai/test-claude", params={"prompt": "hi"}, headers={"X-Profile": "1", **ADMIN})
+    assert response.status_code == 200
+
+    (profile,) = client.get("/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert profile["name"].endswith(PROFILE_SUFFIX)
+    assert "_GET_ai_test-claude_" in profile["name"]
+
+    folded = client.get(f"/admin/profiles/{profile['name']}", headers=ADMIN).text
+    stacks = [line.rsplit(" ", 1) for line in folded.splitlines()]
+    assert all(int(count) > 0 for _, count in stacks)
+    assert any("create (fakes.py" in stack for stack, _ in stacks)  # The sleeping Claude call
+
+
+def test_old_profiles_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+    names = [write_profile(Counter({"main;run": i + 1}), f"/route{i}", "GET", 0.01, directory=str(tmp_path))
+             for i in range(3)]
+    assert write_profile(Counter(), "/empty", "GET", 0.01, directory=str(tmp_path)) is None
+    assert sorted(os.listdir(tmp_path)) == sorted(names)[1:]
@@ -0,0 +1,84 @@
+import datetime
+import threading
+import time
+
+import pytest
+import spotipy
+
+from app.services import refresher
+from app.services.refresher import SpotifyRefresher, TokenBucket
+
+
+@pytest.fixture
+def users(fake_db, monkeypatch):
+    monkeypatch.setattr(refresher, "SPOTIFY_REFRESH_PAGE_SIZE", 3)
+    now = datetime.datetime.utcnow()
+    docs = []
+    for i in range(10):
+        data = {"username": f"User {i}", "access_token": "a", "refresh_token": "r"}
+        if i % 2:
+            data["last_login"] = now - datetime.timedelta(minutes=i)
+        docs.append((f"u{i}", data))
+    docs[4][1]["last_synced_at"] = now  # Fresh: skipped
+    del docs[6][1]["access_token"], docs[6][1]["refresh_token"]  # Never connected: skipped
+    fake_db.collection("users").load(docs)
+    return fake_db
+
+
+def _refresher(sync, **options):
+    return SpotifyRefresher(rate=1000, burst=1000, concurrency=2, sync=sync, **options)
+
+
+def test_pass_refreshes_every_stale_connected_user_once(users):
+    synced = []
+    totals = _refresher(synced.append).run_pass()
+    assert sorted(synced) == ["u0", "u1", "u2", "u3", "u5", "u7", "u8", "u9"]
+    assert (totals["refreshed"], totals["skipped"], totals["failed"]) == (8, 2, 0)
+    assert totals["cursor"] is None
+
+
+def test_stopped_pass_resumes_from_the_checkpoint(users):
+    synced = []
+    first = _refresher(None)
+
+    def sync_then_stop(user_id):
+        synced.append(user_id)
+        if len(synced) == 4:
+            first.stop_event.set()
+
+    first.sync = sync_then_stop
+    state = first.run_pass()
+    assert state["cursor"] == "u2"  # The unfinished second page is redone
+    assert first.load_checkpoint()["cursor"] == "u2"
+
+    resumed = []
+    totals = _refresher(resumed.append).run_pass()
+    assert resumed == ["u3", "u5", "u7", "u8", "u9"]
+    assert totals["refreshed"] == 3 + len(resumed)  # The checkpointed first page, then the rest
+    assert totals["cursor"] is None
+
+
+def test_failures_are_counted_and_spotify_429_pauses_the_bucket(users):
+    def sync(user_id):
+        if user_id == "u1":
+            raise spotipy.SpotifyException(429, -1, "rate limited", headers={"Retry-After": "1"})
+        if user_id == "u2":
+            raise RuntimeError("boom")
+
+    worker = _refresher(sync)
+    totals = worker.run_pass()
+    assert totals["failed"] == 2 and totals["refreshed"] == 6
+    assert worker.bucket._tokens < worker.bucket.capacity
+
+
+def test_token_bucket_waits_for_tokens():
+    bucket = TokenBucket(rate=100, capacity=2)
+    started = time.monotonic()
+    for _ in range(4):
+        assert bucket.acquire()
+    assert time.monotonic() - started >= 0.015
+
+    stop = threading.Event()
+    stop.set()
+    bucket.pause(10)
+    assert bucket.acquire(stop=stop) is False
@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from app import database
+from app.database import aget_user_profile, asave_user_profile, run_db, shutdown_db_executor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_calls_run_on_firestore_threads_with_the_callers_context():
+    async def main():
+        request_id.set("r1")
+        return await run_db(lambda: (threading.current_thread().name, request_id.get()))
+
+    thread_name, seen = asyncio.run(main())
+    assert thread_name.startswith("firestore")
+    assert seen == "r1"
+
+
+def test_blocking_calls_overlap_instead_of_blocking_the_loop():
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*(run_db(time.sleep, 0.1) for _ in range(4)))
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(main())
+    assert elapsed < 0.3
+    assert ticks >= 5
+
+
+def test_async_profile_helpers(fake_db):
+    async def main():
+        await asave_user_profile("alice", {"name": "Alice"})
+        first = await aget_user_profile("alice")
+        round_trips = fake_db.round_trips
+        second = await aget_user_profile("alice")  # A cache hit stays on the loop
+        return first, second, fake_db.round_trips - round_trips
+
+    first, second, round_trips = asyncio.run(main())
+    assert first["name"] == second["name"] == "Alice"
+    assert round_trips == 0
+
+
+def test_executor_is_recreated_after_shutdown():
+    asyncio.run(run_db(int))
+    shutdown_db_executor()
+    assert database._db_executor is None
+    assert asyncio.run(run_db(int, "7")) == 7
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.matching import snapshot
+from app.matching.population import Population
+from app.matching.profile import AUDIO_KEYS, ITEM_FIELDS
+from app.matching.snapshot import (
+    append_delta,
+    apply_deltas,
+    current_snapshot,
+    load_or_build_snapshot,
+    load_snapshot,
+    matcher_fields,
+    write_snapshot,
+)
+from app.services.synthetic import generate_profiles
+
+
+def _rows(population: Population):
+    """{user_id: (items per kind, audio)} of every non-empty row"""
+    rows = {}
+    for row, user_id in enumerate(population.user_ids):
+        items = {}
+        for kind, matrix in population.matrices.items():
+            names = population.vocabs[kind].names
+            items[kind] = sorted(names[i] for i in matrix[row].indices)
+        audio = tuple(np.round(np.asarray(population.audio[row], dtype=np.float64), 5))
+        if any(items.values()) or any(audio):
+            rows[user_id] = (items, audio)
+    return rows
+
+
+@pytest.fixture
+def profiles():
+    return dict(generate_profiles(30))
+
+
+def _deltas(profiles):
+    changed = dict(profiles["synthetic_0_3"], top_artists=["Someone New"], top_genres=["new genre"],
+                   audio_features={key: 0.5 for key in AUDIO_KEYS})
+    added = dict(profiles["synthetic_0_4"], top_tracks=["Someone New - Track 9"])
+    return [
+        ("synthetic_0_3", {"top_artists": ["Overwritten"]}),
+        ("synthetic_0_3", matcher_fields(changed)),  # Last change wins
+        ("synthetic_0_5", None),
+        ("newcomer", matcher_fields(added)),
+    ], changed, added
+
+
+def _expected(profiles, changed, added):
+    final = dict(profiles, synthetic_0_3=changed, newcomer=added)
+    del final["synthetic_0_5"]
+    return _rows(Population.from_profiles(final.items()))
+
+
+def test_apply_deltas_matches_a_rebuild(profiles):
+    deltas, changed, added = _deltas(profiles)
+    population = apply_deltas(Population.from_profiles(profiles.items()), deltas)
+    assert _rows(population) == _expected(profiles, changed, added)
+    assert population.row_of["newcomer"] == len(profiles)
+
+
+def test_apply_deltas_over_a_loaded_snapshot(profiles, tmp_path):
+    write_snapshot(Population.from_profiles(profiles.items()), str(tmp_path), taken_at=1)
+    loaded, meta = load_snapshot(str(tmp_path))
+    assert meta["users"] == len(profiles)
+
+    deltas, changed, added = _deltas(profiles)
+    population = apply_deltas(loaded, deltas)
+    assert _rows(population) == _expected(profiles, changed, added)
+    assert population.row_of.get("newcomer") == len(profiles)
+    assert population.vocabs["artists"].get("Someone New") is not None
+
+
+def test_no_deltas_returns_the_population(profiles):
+    population = Population.from_profiles(profiles.items())
+    assert apply_deltas(population, []) is population
+    assert set(ITEM_FIELDS) == set(population.matrices)
+
+
+def test_workers_starting_together_stream_once(profiles, tmp_path, monkeypatch):
+    streams = []
+
+    def slow_stream():
+        streams.append(1)
+        time.sleep(0.05)
+        return Population.from_profiles(profiles.items())
+
+    monkeypatch.setattr(snapshot, "stream_population", slow_stream)
+    populations = []
+    workers = [threading.Thread(target=lambda: populations.append(load_or_build_snapshot(str(tmp_path))))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(streams) == 1
+    assert [len(population) for population in populations] == [len(profiles)] * 4
+    assert current_snapshot(str(tmp_path)) is not None
+
+
+def test_loading_replays_the_delta_log(profiles, tmp_path, monkeypatch):
+    write_snapshot(Population.from_profiles(profiles.items()), str(tmp_path), taken_at=1)
+    append_delta(str(tmp_path), "synthetic_0_5", None, at=2)
+    append_delta(str(tmp_path), "newcomer", profiles["synthetic_0_4"], at=3)
+    monkeypatch.setattr(snapshot, "stream_population", lambda: pytest.fail("streamed from Firestore"))
+
+    population = load_or_build_snapshot(str(tmp_path))
+    final = dict(profiles, newcomer=profiles["synthetic_0_4"])
+    del final["synthetic_0_5"]
+    assert _rows(population) == _rows(Population.from_profiles(final.items()))
@@ -0,0 +1,164 @@
+import io
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+
+from app.database import save_user_profile
+from app.services import spotify_clients as spotify_clients_module
+from app.services.spotify_clients import (
+    SPOTIFY_TOKENS_COLLECTION,
+    RateLimitedAdapter,
+    SpotifyAuthError,
+    SpotifyClientManager,
+    retry_after_seconds,
+    spotify_clients,
+)
+
+
+class FakeOAuth:
+    """SpotifyOAuth stand-in counting refreshes, each taking `latency` seconds"""
+
+    def __init__(self, latency: float = 0.0, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.refreshes = 0
+
+    def refresh_access_token(self, refresh_token):
+        self.refreshes += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise spotipy.SpotifyOauthError("invalid_grant")
+        return {"access_token": f"fresh-{self.refreshes}", "expires_at": int(time.time()) + 3600}
+
+
+@pytest.fixture
+def manager(fake_db):
+    manager = SpotifyClientManager()
+    manager._oauth = FakeOAuth()
+    return manager
+
+
+def test_get_user_never_returns_tokens(client, fake_db):
+    save_user_profile("alice", {"username": "Alice", "access_token": "legacy", "refresh_token": "legacy"})
+    spotify_clients.store("alice", {"access_token": "a", "refresh_token": "r", "expires_at": 0})
+
+    response = client.get("/users/users/alice")
+    assert response.status_code == 200
+    user = response.json()
+    assert user["username"] == "Alice"
+    assert not {"access_token", "refresh_token", "token_expires_at"} & set(user)
+
+
+def test_tokens_are_stored_apart_from_the_profile(fake_db):
+    save_user_profile("bob", {"username": "Bob"})
+    spotify_clients.store("bob", {"access_token": "a", "refresh_token": "r", "expires_at": 0})
+    assert "access_token" not in fake_db.collection("users").snapshot("bob").to_dict()
+    assert fake_db.collection(SPOTIFY_TOKENS_COLLECTION).snapshot("bob").to_dict()["access_token"] == "a"
+
+
+def test_valid_tokens_are_read_once_and_not_refreshed(manager, fake_db):
+    manager.store("alice", {"access_token": "a", "refresh_token": "r", "expires_at": time.time() + 3600})
+    manager.forget("alice")
+
+    round_trips = fake_db.round_trips
+    assert manager.token_info("alice")["access_token"] == "a"
+    assert manager.token_info("alice")["access_token"] == "a"
+    assert fake_db.round_trips - round_trips == 1
+    assert manager.oauth().refreshes == 0
+
+
+def test_expiring_token_is_refreshed_once_for_concurrent_callers(manager, fake_db):
+    manager._oauth = FakeOAuth(latency=0.05)
+    manager.store("alice", {"access_token": "old", "refresh_token": "r", "expires_at": time.time() + 10})
+
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.token_info("alice")["access_token"]))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["fresh-1"] * 8
+    assert manager.oauth().refreshes == 1
+    stored = fake_db.collection(SPOTIFY_TOKENS_COLLECTION).snapshot("alice").to_dict()
+    assert stored["access_token"] == "fresh-1"
+    assert stored["refresh_token"] == "r"  # Kept when Spotify doesn't rotate it
+
+
+def test_failed_refresh_is_401_and_forgets_the_token(manager):
+    manager._oauth = FakeOAuth(fail=True)
+    manager.store("alice", {"access_token": "old", "refresh_token": "r", "expires_at": 0})
+    with pytest.raises(SpotifyAuthError) as e:
+        manager.token_info("alice")
+    assert e.value.status_code == 401
+    assert manager._cached("alice") is None
+
+
+def test_tokens_of_older_profiles_and_missing_users(manager):
+    save_user_profile("legacy", {"access_token": "a", "refresh_token": "r"})
+    assert manager.token_info("legacy")["access_token"] == "a"
+
+    save_user_profile("disconnected", {"username": "Disconnected"})
+    for user_id, status_code in (("disconnected", 401), ("nobody", 404)):
+        with pytest.raises(SpotifyAuthError) as e:
+            manager.token_info(user_id)
+        assert e.value.status_code == status_code
+
+
+def test_connected_users(manager):
+    manager.store("alice", {"access_token": "a", "refresh_token": "r", "expires_at": 0})
+    save_user_profile("bob", {"username": "Bob"})
+    assert manager.connected(["alice", "bob", "nobody"]) == {"alice"}
+
+
+def test_clients_share_one_session(manager, monkeypatch):
+    monkeypatch.setattr(spotipy, "Spotify", spotipy.client.Spotify)  # The real client, not the fake
+    for user_id in ("alice", "bob"):
+        manager.store(user_id, {"access_token": user_id, "refresh_token": "r", "expires_at": time.time() + 3600})
+    first, second = manager.client("alice"), manager.client("bob")
+    assert first._session is second._session is manager.session
+    assert first.auth_manager.get_access_token() == "alice"
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("3") == 3.0
+    assert retry_after_seconds("-1") == 0.0
+    assert 8 <= retry_after_seconds(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("soon") is None
+
+
+def _response(status_code: int, retry_after: str = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO()
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+
+def test_429s_are_retried_after_retry_after(monkeypatch):
+    responses = [_response(429, "0.05"), _response(200)]
+    sent = []
+
+    def send(self, request, **kwargs):
+        sent.append(time.monotonic())
+        return responses.pop(0)
+
+    monkeypatch.setattr(HTTPAdapter, "send", send)
+    assert RateLimitedAdapter().send(requests.Request("GET", "https://api.spotify.com").prepare()).status_code == 200
+    assert len(sent) == 2
+    assert sent[1] - sent[0] >= 0.05
+
+
+def test_long_retry_after_is_returned_to_the_caller(monkeypatch):
+    monkeypatch.setattr(spotify_clients_module, "SPOTIFY_MAX_RETRY_AFTER_SECONDS", 1)
+    monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kwargs: _response(429, "60"))
+    response = RateLimitedAdapter().send(requests.Request("GET", "https://api.spotify.com").prepare())
+    assert response.status_code == 429
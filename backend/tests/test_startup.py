@@ -0,0 +1,56 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from benchmarks.import_time import BACKEND_DIR, clean_env
+
+from app.routes import ai_claude
+from app.routes.match import cosine_similarity
+from app.services.spotify_clients import spotify_clients
+
+HEAVY_MODULES = ("anthropic", "sklearn", "firebase_admin", "google.cloud.firestore")
+
+
+def test_importing_the_app_needs_no_credentials_or_heavy_clients():
+    script = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=clean_env(),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_anthropic_client_is_built_once_on_first_use(monkeypatch):
+    monkeypatch.setattr(ai_claude, "_clients", {})
+    client = ai_claude.get_async_anthropic()
+    assert ai_claude.get_async_anthropic() is client
+    assert ai_claude.get_anthropic() is not client
+
+
+def test_missing_anthropic_key_answers_503(client, monkeypatch):
+    monkeypatch.setattr(ai_claude, "_clients", {})
+    monkeypatch.delenv("ANTHROPIC_API_KEY")
+    response = client.get("/ai/claude-personality-bio/stream", params={"user_id": "alice"})
+    assert response.status_code == 503
+    assert "Claude API key" in response.json()["detail"]
+
+    # The rest of the app keeps serving
+    assert client.get("/users/users").status_code == 200
+
+
+def test_missing_spotify_credentials_answer_503(client, monkeypatch):
+    monkeypatch.setattr(spotify_clients, "_oauth", None)
+    monkeypatch.delenv("SPOTIFY_CLIENT_ID")
+    response = client.get("/auth/login")
+    assert response.status_code == 503
+    assert "Spotify client ID" in response.json()["detail"]
+
+
+def test_cosine_similarity_matches_the_definition():
+    x = np.array([[0.8, 0.7, 0.6], [0.0, 0.0, 0.0]])
+    y = np.array([[0.1, 0.9, 0.3]])
+    expected = x[0] @ y[0] / (np.linalg.norm(x[0]) * np.linalg.norm(y[0]))
+    assert np.allclose(cosine_similarity(x, y), [[expected], [0.0]])
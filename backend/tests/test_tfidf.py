@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from app.database import save_user_profile
+from app.matching.idf import IdfTable
+from app.matching.population import Population
+from app.routes.match import FlirtifyMatcher
+from app.services.synthetic import generate_profiles
+
+AUDIO = {"danceability": 0.5, "energy": 0.5, "valence": 0.5}
+
+
+def _profile(artists):
+    return {"top_artists": list(artists), "top_tracks": [], "top_genres": [], "audio_features": AUDIO}
+
+
+@pytest.fixture
+def profiles():
+    return dict(generate_profiles(80, seed=20))
+
+
+def test_scores_are_bounded(profiles):
+    matcher = FlirtifyMatcher()
+    idf = IdfTable(Population.from_profiles(profiles.items()))
+    user_ids = list(profiles)
+    scores = [matcher.calculate_tfidf(profiles[a], profiles[b], idf)["score"]
+              for a in user_ids[:10] for b in user_ids]
+    assert 0 <= min(scores) and max(scores) <= 100
+    assert matcher.calculate_tfidf(profiles[user_ids[0]], profiles[user_ids[0]], idf)["score"] == \
+        pytest.approx(100, abs=1e-3)
+
+
+def test_rare_shared_items_count_more():
+    population = {f"fan{i}": _profile(["Chart Topper"]) for i in range(20)}
+    population.update({
+        "alice": _profile(["Chart Topper", "Niche Act"]),
+        "bob": _profile(["Chart Topper", "Niche Act"]),
+        "carol": _profile(["Chart Topper", "Other Act"]),
+    })
+    idf = IdfTable(Population.from_profiles(population.items()))
+    matcher = FlirtifyMatcher()
+    niche = matcher.calculate_tfidf(population["alice"], population["bob"], idf)["score"]
+    popular = matcher.calculate_tfidf(population["alice"], population["carol"], idf)["score"]
+    assert niche > popular
+
+
+def test_updates_match_a_rebuilt_table(profiles):
+    idf = IdfTable(Population.from_profiles(profiles.items()))
+    user_ids = list(profiles)
+    changed = dict(profiles)
+    # Swap two users' items (so every item stays in the vocabulary) and delete a third
+    changed[user_ids[0]], changed[user_ids[1]] = profiles[user_ids[1]], profiles[user_ids[0]]
+    del changed[user_ids[2]]
+    for user_id in user_ids[:3]:
+        idf.update(user_id, changed.get(user_id))
+
+    rebuilt = IdfTable(Population.from_profiles(changed.items()))
+    assert idf.n_users == rebuilt.n_users == len(profiles) - 1
+    for kind, vocab in idf.population.vocabs.items():
+        rebuilt_vocab = rebuilt.population.vocabs[kind]
+        for name in vocab.names:
+            rebuilt_id = rebuilt_vocab.get(name)
+            expected = rebuilt.df[kind][rebuilt_id] if rebuilt_id is not None else 0
+            assert idf.df[kind][vocab.get(name)] == expected, name
+            if rebuilt_id is not None:
+                assert idf.idf(kind)[vocab.get(name)] == pytest.approx(rebuilt.idf(kind)[rebuilt_id])
+
+
+def test_candidates_agree_with_pairwise_tfidf(client, fake_db, profiles):
+    for user_id, profile in profiles.items():
+        save_user_profile(user_id, profile)
+    user_id = "synthetic_20_0"
+
+    response = client.get("/match/candidates", params={
+        "user_id": user_id, "k": 5, "similarity": "tfidf", "prefilter": False, "probes": 0})
+    assert response.status_code == 200
+    candidates = response.json()
+    assert len(candidates) == 5
+
+    pairwise = {}
+    for other in profiles:
+        if other != user_id:
+            match = client.post("/match/match", params={"similarity": "tfidf"},
+                                json={"user1_spotify_id": user_id, "user2_spotify_id": other})
+            assert "etag" not in match.headers
+            pairwise[other] = match.json()["match_score"]
+    best = sorted(pairwise.values(), reverse=True)[:5]
+    assert [c["match_score"] for c in candidates] == pytest.approx(best, abs=1e-3)
+    for candidate in candidates:
+        assert candidate["match_score"] == pytest.approx(pairwise[candidate["user_id"]], abs=1e-3)
+    assert np.all(np.diff([c["match_score"] for c in candidates]) <= 0)
@@ -0,0 +1,50 @@
+from benchmarks.fakes import FakeSpotify
+
+from app.services.track_features import TRACK_FEATURES_COLLECTION, TrackFeatureService
+
+
+class CountingSpotify(FakeSpotify):
+    """FakeSpotify recording every audio_features batch; ids starting with "x" have no features"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def audio_features(self, tracks=None):
+        self.batches.append(list(tracks))
+        return [None if track_id.startswith("x") else self._features(track_id) for track_id in tracks]
+
+
+def test_features_are_fetched_in_batches_of_100(fake_db):
+    sp = CountingSpotify()
+    track_ids = [f"t{i}" for i in range(250)]
+    features = TrackFeatureService().get_features(sp, track_ids + ["t0", ""])
+    assert list(features) == track_ids
+    assert sorted(len(batch) for batch in sp.batches) == [50, 100, 100]
+    assert features["t7"]["danceability"] == FakeSpotify._features("t7")["danceability"]
+
+
+def test_memory_then_firestore_then_spotify(fake_db):
+    sp = CountingSpotify()
+    TrackFeatureService().get_features(sp, ["t1", "t2", "x3"])
+    assert len(sp.batches) == 1
+    stored = fake_db.collection(TRACK_FEATURES_COLLECTION)
+    assert stored.snapshot("t1").exists and not stored.snapshot("x3").exists
+
+    # Another worker: finds t1 and t2 in Firestore, only asks Spotify for new tracks
+    other = TrackFeatureService()
+    features = other.get_features(sp, ["t1", "t2", "t4"])
+    assert sp.batches[1:] == [["t4"]]
+    assert features["t1"] == stored.snapshot("t1").to_dict()
+
+    # Then everything it has seen comes from memory, including tracks without features
+    round_trips = fake_db.round_trips
+    other.get_features(sp, ["t1", "t4"])
+    assert fake_db.round_trips == round_trips
+    assert TrackFeatureService().get_features(sp, ["x3"]) == {"x3": None}
+
+
+def test_memory_cache_is_bounded(fake_db):
+    service = TrackFeatureService(maxsize=2)
+    service.get_features(CountingSpotify(), ["t1", "t2", "t3"])
+    assert list(service._cache) == ["t2", "t3"]
@@ -0,0 +1,60 @@
+import json
+
+
+def _load_users(fake_db, count):
+    fake_db.collection("users").load(
+        (f"user{i:03d}", {"username": f"User {i}", "access_token": "secret"}) for i in range(count))
+
+
+def test_users_are_unpaginated_by_default(client, fake_db):
+    _load_users(fake_db, 150)
+    response = client.get("/users/users")
+    assert response.status_code == 200
+    assert len(response.json()) == 150
+    assert "x-next-cursor" not in response.headers
+
+
+def test_cursor_pagination_walks_every_user_once(client, fake_db):
+    _load_users(fake_db, 25)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10}
+        if cursor:
+            params["start_after"] = cursor
+        response = client.get("/users/users", params=params)
+        assert response.status_code == 200
+        seen += [user["id"] for user in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert seen == [f"user{i:03d}" for i in range(25)]
+
+
+def test_cursor_alone_uses_the_default_page_size(client, fake_db):
+    _load_users(fake_db, 150)
+    response = client.get("/users/users", params={"start_after": "user009"})
+    assert [user["id"] for user in response.json()] == [f"user{i:03d}" for i in range(10, 110)]
+    assert response.headers["x-next-cursor"] == "user109"
+
+
+def test_listing_never_returns_tokens(client, fake_db):
+    _load_users(fake_db, 3)
+    for user in client.get("/users/users").json():
+        assert "access_token" not in user
+    response = client.get("/users/users", params={"fields": "access_token"})
+    assert response.status_code == 400
+
+
+def test_fields_are_projected(client, fake_db):
+    _load_users(fake_db, 3)
+    users = client.get("/users/users", params={"fields": "username"}).json()
+    assert users[0] == {"id": "user000", "username": "User 0"}
+
+
+def test_ndjson_streams_one_user_per_line(client, fake_db):
+    _load_users(fake_db, 5)
+    response = client.get("/users/users", params={"format": "ndjson", "limit": 3, "start_after": "user000"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [user["id"] for user in lines] == ["user001", "user002", "user003"]
+    assert all("access_token" not in user for user in lines)